@@ -12,8 +12,18 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.join(current_dir, '..')
 sys.path.append(parent_dir)
 import src
+from src.cache import read_cache
 app = Dash(__name__, use_pages=True, pages_folder="pages")
 
+# The feature groups the pages offer, an uploaded Parquet table is only read for these columns
+DASHBOARD_GROUPS = ['Granularity', 'Intensity',
+                    'Texture_AngularSecondMoment', 
+                    'Texture_Contrast',
+                    'RadialDistribution_MeanFrac',
+                    'RadialDistribution_ZernikeMagnitude',
+                    'Area'
+                    ]
+
 app.layout = html.Div([
     # html.H1('Multi-page app with Dash Pages'),
     html.Div([
@@ -56,6 +66,9 @@ def parse_contents(contents, filename):
     
     if 'csv' in filename:
         df = pd.read_csv(StringIO(decoded.decode('utf-8')))
+    elif 'parquet' in filename:
+        # column projection from the manifest in the schema metadata (cache.write_cache)
+        df = read_cache(io.BytesIO(decoded), group=DASHBOARD_GROUPS)
     elif 'pkl' in filename:
         df = pd.read_pickle(io.BytesIO(decoded))
     elif 'json' in filename:
@@ -74,13 +87,7 @@ def update_output(data, name):
     dfs = {}
     cytokines = []
     doses = []
-    groups = ['Granularity', 'Intensity',
-             'Texture_AngularSecondMoment', 
-             'Texture_Contrast',
-             'RadialDistribution_MeanFrac',
-             'RadialDistribution_ZernikeMagnitude',
-             'Area'
-             ]
+    groups = DASHBOARD_GROUPS
     group = []
     tmp = parse_contents(data, name)
     for g in groups:
@@ -70,6 +70,6 @@ def update_graph4_box(d, y, dfs):
         anova_df = run_ANOVA_cytokines(data, y, d)
         tukey_df = cytokine_Tukey_HSD(data, y, d)
         data = data[data['Metadata_Metadata_Dose']==d]
-    fig = generate_box(data, 'Metadata_Metadata_Cytokine', y)
+    fig = generate_box(data, 'Metadata_Metadata_Cytokine', y, ci=True)
     
     return fig, anova_df[0].to_dict('records'), tukey_df.to_dict('records')
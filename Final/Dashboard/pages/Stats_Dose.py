@@ -70,7 +70,7 @@ def update_graph4_box(c, y, dfs):
     anova_df = run_ANOVA_doses(c, y, data)
     tukey_df = doses_Tukey_HSD(c, y, data)
     data = data[data['Metadata_Metadata_Cytokine']==c]
-    fig = generate_box(data, 'Metadata_Metadata_Dose', y)
+    fig = generate_box(data, 'Metadata_Metadata_Dose', y, ci=True)
     # tukey_df = tukey_df.summary()
     # tukey_df = pd.DataFrame.from_records(tukey_df.data)
     # new_header = tukey_df.iloc[0] #grab the first row for the header
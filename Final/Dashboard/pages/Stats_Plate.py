@@ -57,6 +57,6 @@ def update_graph4_box(y, dfs):
         anova_df = run_ANOVA_plates('untr', y, data)
         tukey_df = plate_Tukey_HSD('untr', y, data)
         data = data[data['Metadata_Metadata_Cytokine']=='untr']
-    fig = generate_box(data, 'Metadata_Plate', y)
+    fig = generate_box(data, 'Metadata_Plate', y, ci=True)
     
     return fig, anova_df[0].to_dict('records'), tukey_df.to_dict('records')
@@ -73,7 +73,7 @@ def update_graph3_box(c, d, y, dfs):
         data = pd.read_json(v, orient='split')
         data = data[data['Metadata_Metadata_Cytokine']==c]
         data = data[data['Metadata_Metadata_Dose']==d]
-    fig = generate_box(data, 'Metadata_Well', y)
+    fig = generate_box(data, 'Metadata_Well', y, ci=True)
     text_df = get_ttest_wells_d(c, d, y, data)
     
     return fig, text_df.to_dict('records')
\ No newline at end of file
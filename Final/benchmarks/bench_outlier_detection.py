@@ -0,0 +1,95 @@
+'''
+Benchmark of the vectorized outlier_detection against the original loop over every
+cytokine, dose and well combination and every feature.
+
+Run from this folder:
+
+    python bench_outlier_detection.py --objects 5000 --features 157
+'''
+import argparse
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('../src/')
+from preprocessing import outlier_detection, replace_outliers_with_sd
+warnings.filterwarnings('ignore')
+
+
+def make_plate(n_objects, n_features, seed=0):
+    '''
+    This function builds a synthetic object table laid out like the output of drop_columns,
+    six metadata columns followed by the measurements
+    '''
+    rng = np.random.default_rng(seed)
+    cytokines = ['EGF', 'FGF', 'IFNg', 'IL13', 'IL17', 'IL22', 'IL26', 'untr']
+    doses = [11, 33, 100]
+    wells = ['B2', 'C2', 'D2', 'E2']
+
+    data = pd.DataFrame({
+        'ImageNumber': np.sort(rng.integers(1, 409, n_objects)),
+        'ObjectNumber': np.arange(1, n_objects + 1),
+        'Metadata_Metadata_Cytokine': rng.choice(cytokines, n_objects),
+        'Metadata_Metadata_Dose': rng.choice(doses, n_objects),
+        'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2', 'Plate 3'], n_objects),
+        'Metadata_Well': rng.choice(wells, n_objects),
+    })
+    # heavy tails so that there are some outliers to find
+    measurements = rng.standard_t(3, size=(n_objects, n_features))
+    feature_names = ['Feature_' + str(i) for i in range(n_features)]
+    return pd.concat([data, pd.DataFrame(measurements, columns=feature_names)], axis=1)
+
+
+def legacy_outlier_detection(df, sd, thresh):
+    '''
+    The original implementation, kept here as the reference for timing and for checking results
+    '''
+    df_copy = df.copy()
+    features = df_copy.columns[6:]
+    threshold = round(thresh * len(features))
+    unique_pairs = df_copy[['Metadata_Metadata_Cytokine',
+                           'Metadata_Metadata_Dose',
+                           'Metadata_Well']].drop_duplicates().reset_index(drop=True)
+    all_outliers = []
+    for i, row in unique_pairs.iterrows():
+        outlier_cols = {}
+        for feature in features:
+            outlier_cols[feature + '_outliers'] = replace_outliers_with_sd(df_copy, feature, row.iloc[0],
+                                                                           row.iloc[1], row.iloc[2], sd)
+        all_outliers.append(pd.DataFrame(outlier_cols))
+    all_outliers = pd.concat(all_outliers)
+    outlier_count = (all_outliers == True).sum(1)
+    return df[outlier_count >= threshold], df[outlier_count < threshold]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=5000)
+    parser.add_argument('--features', type=int, default=157)
+    parser.add_argument('--sd', type=float, default=3)
+    parser.add_argument('--thresh', type=float, default=0.05)
+    args = parser.parse_args()
+
+    data = make_plate(args.objects, args.features)
+
+    start = time.perf_counter()
+    legacy_outliers, legacy_sub_data = legacy_outlier_detection(data, args.sd, args.thresh)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outliers, sub_data = outlier_detection(data, args.sd, args.thresh)
+    new_time = time.perf_counter() - start
+
+    same = outliers.index.equals(legacy_outliers.index) and sub_data.index.equals(legacy_sub_data.index)
+    print('objects:', args.objects, 'features:', args.features, 'outliers:', len(outliers))
+    print('loop:       %.3f s' % legacy_time)
+    print('vectorized: %.3f s' % new_time)
+    print('speedup:    %.1fx' % (legacy_time / new_time))
+    print('same split:', same)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Benchmark of the treatment medians and quartiles from merged quantile sketches against a grouped
+scan of the object table, with the rank error of the sketch medians.
+
+Run from this folder:
+
+    python bench_sketches.py --objects 1000000 --features 157
+'''
+import argparse
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.append('../src/')
+from sketches import build_sketches, rollup_quantiles
+from bench_outlier_detection import make_plate
+warnings.filterwarnings('ignore')
+
+TREATMENT = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']
+
+
+def timed(func, repeats):
+    '''
+    Returns the result of func and the best time of repeats calls
+    '''
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=1000000)
+    parser.add_argument('--features', type=int, default=157)
+    parser.add_argument('--k', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_plate(args.objects, args.features)
+    features = data.columns[6:].tolist()
+
+    sketch_table, build_time = timed(lambda: build_sketches(data, k=args.k), 1)
+    scan, scan_time = timed(lambda: data.groupby(TREATMENT)[features].median(), args.repeats)
+    medians, sketch_time = timed(lambda: rollup_quantiles(sketch_table, TREATMENT, 0.5), args.repeats)
+    _, scan_quartiles_time = timed(lambda: data.groupby(TREATMENT)[features].quantile([0.25, 0.5, 0.75]),
+                                   args.repeats)
+    _, sketch_quartiles_time = timed(lambda: rollup_quantiles(sketch_table, TREATMENT, [0.25, 0.5, 0.75]),
+                                     args.repeats)
+
+    # the rank error of the sketch median of every treatment and feature
+    errors = []
+    for (cytokine, dose), part in data.groupby(TREATMENT):
+        values = part[features].to_numpy()
+        errors.append(np.abs((values < medians.loc[(cytokine, dose)].to_numpy()).mean(axis=0) - 0.5))
+    relative = np.abs(medians.to_numpy() - scan.loc[medians.index].to_numpy())
+
+    print('objects:', args.objects, 'features:', args.features, 'groups:', len(sketch_table['keys']), 'k:', args.k)
+    print('build sketches (once):   %.3f s' % build_time)
+    print('medians, grouped scan:   %.3f s' % scan_time)
+    print('medians, sketches:       %.3f s' % sketch_time)
+    print('quartiles, grouped scan: %.3f s' % scan_quartiles_time)
+    print('quartiles, sketches:     %.3f s' % sketch_quartiles_time)
+    print('largest median rank error: %.5f (bound %.5f)' % (np.max(errors), 1 / args.k))
+    print('largest median difference: %.5f' % relative.max())
+
+
+if __name__ == '__main__':
+    main()
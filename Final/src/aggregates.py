@@ -0,0 +1,120 @@
+import os
+
+try:
+    from .cache import write_cache, read_cache
+except ImportError:
+    from cache import write_cache, read_cache
+
+# The grouping of every aggregate level: the image level is the one corr_heatmap_generator uses, the
+# well level holds the counts, means and SDs the stats functions need (cube.StatsCube.from_aggregates)
+# and the treatment level the medians of treatment_profiles_heatmap
+AGGREGATE_LEVELS = {
+    'image': ['ImageNumber', 'Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Plate', 'Metadata_Well'],
+    'well': ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Plate', 'Metadata_Well'],
+    'treatment': ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose'],
+}
+
+AGGREGATE_STATS = ['mean', 'median', 'count', 'std']
+
+# FUNCTIONS
+
+def aggregate_tables(df, levels=tuple(AGGREGATE_LEVELS), stats=AGGREGATE_STATS, features=None):
+    '''
+    This function summarises the object table per image and per well with a single groupby per level
+
+    Arguments:
+
+    - df: the cleaned Pandas DataFrame, features start at column 6
+    - levels: the keys of AGGREGATE_LEVELS to compute
+    - stats: the pandas aggregations to compute for every feature
+    - features: the features to summarise, every column from the 7th onwards by default
+
+    Returns:
+
+    - a dictionary keyed by (level, stat), each value a Pandas DataFrame with the group columns
+    followed by one column per feature, named as in df, and the groups in order of first appearance
+    '''
+    if features is None:
+        features = df.columns[6:].tolist()
+
+    tables = {}
+    for level in levels:
+        keys = AGGREGATE_LEVELS[level]
+        summary = df.groupby(keys, observed=True, sort=False)[features].agg(list(stats))
+        for stat in stats:
+            tables[(level, stat)] = summary.xs(stat, axis=1, level=1).reset_index()
+    return tables
+
+def aggregate_path(path, level, stat):
+    '''
+    Returns the path of an aggregate table stored next to the cleaned table at path,
+    e.g. PAM194_ObjCell_clean.image_mean.parquet
+    '''
+    return os.path.splitext(path)[0] + '.' + level + '_' + stat + '.parquet'
+
+def write_aggregates(df, path, levels=tuple(AGGREGATE_LEVELS), stats=AGGREGATE_STATS):
+    '''
+    This function materialises the aggregate tables of df once and caches them as Parquet, with
+    a feature group manifest each, next to the cleaned table at path
+
+    Returns:
+
+    - the list of the files written
+    '''
+    written = []
+    for (level, stat), table in aggregate_tables(df, levels=levels, stats=stats).items():
+        table_path = aggregate_path(path, level, stat)
+        write_cache(table, table_path, n_metadata=len(AGGREGATE_LEVELS[level]))
+        written.append(table_path)
+    return written
+
+def read_aggregate(path, level='image', stat='mean', group=None, columns=None):
+    '''
+    This function loads one cached aggregate table, optionally only one feature group or a few columns.
+    read_aggregate(path, 'image', 'mean') can be given straight to corr_heatmap_generator, and the
+    well-level tables to anything that does not need the individual objects.
+
+    Arguments:
+
+    - path: the cleaned table the aggregates were written for
+    - level: 'image' or 'well'
+    - stat: 'mean', 'median', 'count' or 'std'
+    - group, columns: passed to cache.read_cache
+
+    Returns:
+
+    - Pandas DataFrame with the group columns and the requested features
+    '''
+    return read_cache(aggregate_path(path, level, stat), group=group, columns=columns)
+
+def has_aggregate(path, level, stat):
+    '''
+    Returns True when write_aggregates has stored the given aggregate table for the cleaned table at path
+    '''
+    return os.path.exists(aggregate_path(path, level, stat))
+
+def read_grouped(path, group_cols, stat='mean', group=None):
+    '''
+    This function returns one statistic of every feature per group of the cleaned table at path. The
+    materialized aggregate is read when group_cols is one of the AGGREGATE_LEVELS and write_aggregates
+    has stored it, otherwise the needed columns of the cleaned table are read and grouped.
+
+    Arguments:
+
+    - path: the cleaned table, written by cache.write_cache
+    - group_cols: the columns to group by
+    - stat: a pandas aggregation, e.g. 'mean' or 'median'
+    - group: optional feature group, passed to cache.read_cache
+
+    Returns:
+
+    - Pandas DataFrame with the group columns followed by one column per feature, as aggregate_tables
+    '''
+    group_cols = list(group_cols)
+    for level, keys in AGGREGATE_LEVELS.items():
+        if keys == group_cols and has_aggregate(path, level, stat):
+            return read_aggregate(path, level, stat, group=group)
+
+    df = read_cache(path, group=group)
+    features = df.columns[6:].tolist()
+    return df.groupby(group_cols, observed=True)[features].agg(stat).reset_index()
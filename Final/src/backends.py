@@ -0,0 +1,117 @@
+'''
+The statistical tests of stats.py answered from group summaries instead of raw rows. A backend
+only has to provide group_moments(group_cols, features, where), which returns the 'count', 'mean'
+and 'm2' DataFrames of incremental.group_moments for the rows that pass the where filter,
+count_rows(where), first_seen(col, where), the values of a column in order of first appearance,
+and rows. where is a function taking a DataFrame with the metadata columns and
+returning a boolean mask. The stats functions hand any object that is not a DataFrame to the
+method of the same name, so the backends below can be passed in place of the data:
+
+- out_of_core.PlateDataset, partitions on disk merged plate by plate
+- cube.StatsCube, sums precomputed per plate, well, cytokine and dose
+'''
+import pandas as pd
+
+try:
+    from .power import ttest_power
+    from .stats import anova_from_moments, anova_table, tukey_from_moments, ttest_wells_from_moments, moments_summary
+except ImportError:
+    from power import ttest_power
+    from stats import anova_from_moments, anova_table, tukey_from_moments, ttest_wells_from_moments, moments_summary
+
+# The untreated controls that run_ANOVA_cytokines leaves out
+UNTREATED = ['untr', 'untr-50']
+
+class MomentsBackend:
+    '''
+    The stats.py tests computed from group_moments, shared by the backends
+    '''
+
+    def _anova(self, group_col, label, feature, where, obs):
+        moments = self.group_moments([group_col], features=[feature], where=where)
+        F, p = anova_from_moments(moments['count'].to_numpy(), moments['mean'].to_numpy(), moments['m2'].to_numpy())
+        final_df = pd.DataFrame([[label, feature, F[0], p[0]]], columns=['Cytokine', 'Feature', 'F-stat', 'P-value'])
+        anova_power = ttest_power(obs)
+        return final_df, anova_power
+
+    def run_ANOVA_doses(self, cytokine, feature):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == cytokine
+        return self._anova('Metadata_Metadata_Dose', cytokine, feature, where, self.count_rows(where))
+
+    def run_ANOVA_plates(self, untr, feature):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == untr
+        return self._anova('Metadata_Plate', untr, feature, where, self.count_rows(where))
+
+    def run_ANOVA_cytokines(self, feature, dose):
+        where = lambda part: ((part['Metadata_Metadata_Dose'] == dose) &
+                              ~part['Metadata_Metadata_Cytokine'].isin(UNTREATED))
+        # stats.run_ANOVA_cytokines uses the size of the whole table for the power
+        return self._anova('Metadata_Metadata_Cytokine', dose, feature, where, self.rows)
+
+    def _anova_batch(self, group_col, label, features, where, obs):
+        moments = self.group_moments([group_col], features=features, where=where)
+        final_df = anova_table(label, moments)
+        anova_power = ttest_power(obs)
+        return final_df, anova_power
+
+    def run_ANOVA_doses_batch(self, cytokine, features=None):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == cytokine
+        return self._anova_batch('Metadata_Metadata_Dose', cytokine, features, where, self.count_rows(where))
+
+    def run_ANOVA_plates_batch(self, untr, features=None):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == untr
+        return self._anova_batch('Metadata_Plate', untr, features, where, self.count_rows(where))
+
+    def run_ANOVA_cytokines_batch(self, dose, features=None):
+        where = lambda part: ((part['Metadata_Metadata_Dose'] == dose) &
+                              ~part['Metadata_Metadata_Cytokine'].isin(UNTREATED))
+        return self._anova_batch('Metadata_Metadata_Cytokine', dose, features, where, self.rows)
+
+    def doses_Tukey_HSD_batch(self, cytokine, features=None, alpha=0.05):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == cytokine
+        return tukey_from_moments(self.group_moments(['Metadata_Metadata_Dose'], features=features, where=where), alpha)
+
+    def plate_Tukey_HSD_batch(self, untr, features=None, alpha=0.05):
+        where = lambda part: part['Metadata_Metadata_Cytokine'] == untr
+        return tukey_from_moments(self.group_moments(['Metadata_Plate'], features=features, where=where), alpha)
+
+    def cytokine_Tukey_HSD_batch(self, dose, features=None, alpha=0.05):
+        where = lambda part: ((part['Metadata_Metadata_Dose'] == dose) &
+                              ~part['Metadata_Metadata_Cytokine'].isin(UNTREATED))
+        return tukey_from_moments(self.group_moments(['Metadata_Metadata_Cytokine'], features=features, where=where), alpha)
+
+    def get_ttest_wells_batch(self, features=None, cytokines=None, doses=None):
+        where = None
+        if cytokines is not None or doses is not None:
+            where = lambda part: ((part['Metadata_Metadata_Cytokine'].isin(cytokines) if cytokines is not None else True) &
+                                  (part['Metadata_Metadata_Dose'].isin(doses) if doses is not None else True))
+        group_cols = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
+        return ttest_wells_from_moments(self.group_moments(group_cols, features=features, where=where))
+
+    def _ttest_wells(self, cytokine, dose, feature):
+        where = lambda part: ((part['Metadata_Metadata_Dose'] == dose) &
+                              (part['Metadata_Metadata_Cytokine'] == cytokine))
+        group_cols = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
+        # the first two wells in order of appearance, as stats.get_ttest_wells does on a DataFrame
+        wells = self.first_seen('Metadata_Well', where)[:2]
+        moments = self.group_moments(group_cols, features=[feature],
+                                     where=lambda part: where(part) & part['Metadata_Well'].isin(wells))
+        order = [moments['count'].index.get_level_values('Metadata_Well').tolist().index(well) for well in wells]
+        moments = {key: value.iloc[order] for key, value in moments.items()}
+        result = ttest_wells_from_moments(moments).iloc[0]
+        power = ttest_power(self.count_rows(where))
+        return pd.DataFrame([[cytokine, feature, result['Well Comparison'], round(result['T-Statistic'], 3),
+                              round(result['p-value'], 3), power]],
+                            columns=['Cytokine', 'Feature', 'Well Comparison', 'T-Statistic', 'p-value', 'Power'])
+
+    def get_ttest_wells(self, cytokine, feature):
+        return self._ttest_wells(cytokine, 100, feature)
+
+    def get_ttest_wells_d(self, cytokine, dose, feature):
+        return self._ttest_wells(cytokine, dose, feature)
+
+    def summary(self, by, features=None, where=None):
+        '''
+        Returns the count, mean and standard deviation of every feature for every group of the by columns
+        '''
+        return moments_summary(self.group_moments(list(by), features=features, where=where))
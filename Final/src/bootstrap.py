@@ -0,0 +1,192 @@
+'''
+Bootstrap confidence intervals for group means and mean differences. Every group is resampled on
+its own from precomputed index arrays. A chunk of resamples is turned into a matrix of draw counts
+(resamples x objects of the group), so the resampled means of all features are one matrix product.
+The results can be cached in memory, for the most recent requests, and on disk under the fingerprint
+of the data and the parameters, so repeated requests for the same plot are answered from the cache.
+'''
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .fingerprint import data_fingerprint, stage_key
+except ImportError:
+    from fingerprint import data_fingerprint, stage_key
+
+# The columns of the tables returned by bootstrap_ci
+MEAN_CI_COLUMNS = ['Group', 'Feature', 'mean', 'lower', 'upper']
+DIFF_CI_COLUMNS = ['Feature', 'group1', 'group2', 'meandiff', 'lower', 'upper']
+
+# The number of results kept in memory by cached_bootstrap_ci
+CACHE_SIZE = 32
+
+# Results of bootstrap_ci by cache key, least recently used first
+_cache = OrderedDict()
+
+# FUNCTIONS
+
+def bootstrap_group_means(values, labels, n_boot=1000, seed=0, chunk_size=100):
+    '''
+    This function resamples the objects of every group with replacement and returns the mean of
+    every feature in every resample
+
+    Arguments:
+
+    - values: array (objects x features) without missing values
+    - labels: the group of every object
+    - n_boot: the number of resamples
+    - seed: the seed of the resamples, every group draws from its own stream so the results do
+    not depend on chunk_size
+    - chunk_size: the number of resamples evaluated at once, bounds the memory to about
+    chunk_size x the largest group
+
+    Returns:
+
+    - groups: the sorted group labels
+    - boot: array (n_boot x groups x features) of the resampled means
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if np.isnan(values).any():
+        raise ValueError('the bootstrap needs complete features, run replace_NA first')
+    codes, groups = pd.factorize(pd.Series(labels), sort=True)
+    group_indices = [np.flatnonzero(codes == g) for g in range(len(groups))]
+    streams = [np.random.default_rng([seed, g]) for g in range(len(groups))]
+
+    boot = np.empty((n_boot, len(groups), values.shape[1]))
+    for start in range(0, n_boot, chunk_size):
+        chunk = min(chunk_size, n_boot - start)
+        for g, index in enumerate(group_indices):
+            n = len(index)
+            draws = streams[g].integers(0, n, size=(chunk, n))
+            # how often every object is drawn in every resample
+            weights = np.bincount((draws + n * np.arange(chunk)[:, None]).ravel(), minlength=chunk * n).reshape(chunk, n)
+            boot[start:start + chunk, g] = weights @ values[index] / n
+    return groups, boot
+
+def bootstrap_ci(values, labels, features, n_boot=1000, alpha=0.05, seed=0, chunk_size=100):
+    '''
+    This function computes percentile bootstrap confidence intervals for the mean of every group
+    and for the difference of the means of every pair of groups, for every feature
+
+    Arguments:
+
+    - values: array (objects x features) without missing values
+    - labels: the group of every object
+    - features: the names of the columns of values
+    - n_boot, seed, chunk_size: passed to bootstrap_group_means
+    - alpha: 1 - the confidence level
+
+    Returns:
+
+    - means_df: a Pandas DataFrame with the columns of MEAN_CI_COLUMNS
+    - diffs_df: a Pandas DataFrame with the columns of DIFF_CI_COLUMNS, meandiff is the mean of
+    group2 minus the mean of group1 as in the Tukey tables
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    groups, boot = bootstrap_group_means(values, labels, n_boot, seed, chunk_size)
+    codes = pd.factorize(pd.Series(labels), sort=True)[0]
+    means = np.stack([values[codes == g].mean(axis=0) for g in range(len(groups))])
+    quantiles = [alpha / 2, 1 - alpha / 2]
+    features = np.asarray(features)
+
+    lower, upper = np.quantile(boot, quantiles, axis=0)
+    means_df = pd.DataFrame({'Group': np.repeat(np.asarray(groups, dtype=object), len(features)),
+                             'Feature': np.tile(features, len(groups)),
+                             'mean': means.ravel(),
+                             'lower': lower.ravel(),
+                             'upper': upper.ravel()}, columns=MEAN_CI_COLUMNS)
+
+    idx1, idx2 = np.triu_indices(len(groups), 1)
+    diff_lower, diff_upper = np.quantile(boot[:, idx2] - boot[:, idx1], quantiles, axis=0)
+    diffs_df = pd.DataFrame({'Feature': np.repeat(features, len(idx1)),
+                             'group1': np.tile(np.asarray(groups, dtype=object)[idx1], len(features)),
+                             'group2': np.tile(np.asarray(groups, dtype=object)[idx2], len(features)),
+                             'meandiff': (means[idx2] - means[idx1]).T.ravel(),
+                             'lower': diff_lower.T.ravel(),
+                             'upper': diff_upper.T.ravel()}, columns=DIFF_CI_COLUMNS)
+    return means_df, diffs_df
+
+def cached_bootstrap_ci(sub_df, group_col, features, n_boot=1000, alpha=0.05, seed=0, chunk_size=100,
+                        use_cache=False, cache_dir=None):
+    '''
+    This function runs bootstrap_ci on the features of sub_df grouped by group_col, unless the
+    same data and parameters have been bootstrapped before. The data is only hashed when a cache
+    is used
+
+    Arguments:
+
+    - sub_df: the Pandas DataFrame of the objects to compare
+    - group_col: the column that defines the groups
+    - features: the features to bootstrap
+    - n_boot, alpha, seed, chunk_size: passed to bootstrap_ci
+    - use_cache: keep the result in memory, the CACHE_SIZE most recent results are kept
+    - cache_dir: optional folder where the results are also stored as pickles, so that they are
+    kept across sessions
+
+    Returns:
+
+    - means_df, diffs_df: as bootstrap_ci
+    '''
+    sub_df = sub_df[[group_col] + list(features)]
+    if not use_cache and cache_dir is None:
+        return bootstrap_ci(sub_df[features].to_numpy(), sub_df[group_col], features, n_boot, alpha, seed, chunk_size)
+
+    params = {'group_col': group_col, 'n_boot': n_boot, 'alpha': alpha, 'seed': seed}
+    key = stage_key(data_fingerprint(sub_df), 'bootstrap', bootstrap_ci, params)
+    if use_cache and key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    path = os.path.join(cache_dir, 'bootstrap-' + key[:20] + '.pkl') if cache_dir is not None else None
+    if path is not None and os.path.exists(path):
+        result = pd.read_pickle(path)
+    else:
+        result = bootstrap_ci(sub_df[features].to_numpy(), sub_df[group_col], features, n_boot, alpha, seed,
+                              chunk_size)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            pd.to_pickle(result, path)
+    if use_cache:
+        _cache[key] = result
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+def bootstrap_ci_doses(cytokine, df, features=None, **kwargs):
+    '''
+    Bootstrap CIs across the dosage levels of a cytokine, the groups of plot_by_dose.
+    The keyword arguments are passed to cached_bootstrap_ci.
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == cytokine]
+    return cached_bootstrap_ci(sub_df, 'Metadata_Metadata_Dose', features, **kwargs)
+
+def bootstrap_ci_wells(cytokine, df, features=None, dose=100, **kwargs):
+    '''
+    Bootstrap CIs across the wells of a cytokine at one dosage level, the groups of plot_by_wells.
+    The keyword arguments are passed to cached_bootstrap_ci.
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df[(df['Metadata_Metadata_Dose'] == dose) & (df['Metadata_Metadata_Cytokine'] == cytokine)]
+    return cached_bootstrap_ci(sub_df, 'Metadata_Well', features, **kwargs)
+
+def bootstrap_ci_plates(untr, df, features=None, **kwargs):
+    '''
+    Bootstrap CIs across plates for the untreated experiments, the groups of plot_by_plate.
+    The keyword arguments are passed to cached_bootstrap_ci.
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == untr]
+    return cached_bootstrap_ci(sub_df, 'Metadata_Plate', features, **kwargs)
+
+def bootstrap_ci_cytokines(df, dose, features=None, **kwargs):
+    '''
+    Bootstrap CIs across the cytokines at one dosage level, the groups of plot_by_cytokine.
+    The keyword arguments are passed to cached_bootstrap_ci.
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df[df['Metadata_Metadata_Dose'] == dose]
+    return cached_bootstrap_ci(sub_df, 'Metadata_Metadata_Cytokine', features, **kwargs)
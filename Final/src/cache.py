@@ -0,0 +1,114 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from .schema import feature_groups
+except ImportError:
+    from schema import feature_groups
+
+# The key of the manifest in the Parquet schema metadata, so that a table read from a buffer (e.g. a
+# dashboard upload) can still be projected
+MANIFEST_KEY = b'manifest'
+
+# FUNCTIONS
+
+def manifest_path(path):
+    '''
+    Returns the path of the manifest that sits next to a cached table
+    '''
+    return os.path.splitext(path)[0] + '.manifest.json'
+
+def write_cache(df, path, n_metadata=6):
+    '''
+    This function writes a cleaned object table to Parquet together with a small json manifest
+    of its metadata columns and feature groups. The manifest is also stored in the schema metadata
+    of the Parquet file.
+
+    Arguments:
+
+    - df: the cleaned Pandas DataFrame, metadata columns first as after drop_columns
+    - path: the path of the .parquet file to write
+    - n_metadata: the number of leading metadata columns (ImageNumber, ObjectNumber, Cytokine,
+    Dose, Plate, Well)
+
+    Returns:
+
+    - manifest: the dictionary written next to the table
+    '''
+    columns = [str(col) for col in df.columns]
+    manifest = {
+        'metadata': columns[:n_metadata],
+        'groups': feature_groups(columns[n_metadata:]),
+        'rows': len(df),
+    }
+
+    table = pa.Table.from_pandas(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[MANIFEST_KEY] = json.dumps(manifest).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    with open(manifest_path(path), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def read_manifest(path, n_metadata=6):
+    '''
+    Returns the manifest written by write_cache for the table at path. path can also be a file
+    object such as an uploaded io.BytesIO, the manifest then comes from the schema metadata, or
+    from the column names when the file was not written by write_cache.
+    '''
+    if isinstance(path, str) and os.path.exists(manifest_path(path)):
+        with open(manifest_path(path)) as f:
+            return json.load(f)
+
+    schema = pq.read_schema(path)
+    if hasattr(path, 'seek'):
+        path.seek(0)
+    metadata = schema.metadata or {}
+    if MANIFEST_KEY in metadata:
+        return json.loads(metadata[MANIFEST_KEY])
+    columns = [name for name in schema.names if not name.startswith('__index_level_')]
+    return {'metadata': columns[:n_metadata], 'groups': feature_groups(columns[n_metadata:]), 'rows': None}
+
+def group_columns(manifest, group):
+    '''
+    Returns the columns of every feature group starting with group, so 'Texture' gives all
+    Texture_* groups and 'Area' gives AreaShape
+    '''
+    columns = []
+    for name, cols in manifest['groups'].items():
+        if name.startswith(group):
+            columns.extend(cols)
+    return columns
+
+def read_cache(path, group=None, columns=None, metadata=True):
+    '''
+    This function loads a cached table reading only the requested columns from disk
+
+    Arguments:
+
+    - path: the .parquet file written by write_cache, or a file object with its content
+    - group: a feature group name such as 'Granularity' or 'Texture_Contrast', or a list of them
+    - columns: a list of column names, added to the group columns if both are given
+    - metadata: whether to also load the metadata columns
+
+    Returns:
+
+    - Pandas DataFrame with the metadata and the requested features. All columns are read when
+    neither group nor columns are given
+    '''
+    if group is None and columns is None:
+        return pd.read_parquet(path)
+
+    manifest = read_manifest(path)
+    selected = list(manifest['metadata']) if metadata else []
+    if group is not None:
+        for name in ([group] if isinstance(group, str) else group):
+            selected += [col for col in group_columns(manifest, name) if col not in selected]
+    if columns is not None:
+        selected += [col for col in columns if col not in selected]
+
+    return pd.read_parquet(path, columns=selected)
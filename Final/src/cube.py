@@ -0,0 +1,166 @@
+'''
+A cube of sufficient statistics: the count, sum and sum of squares of every feature for every
+plate, well, cytokine and dose, built in one pass when the data is loaded. Every ANOVA, t-test and
+summary of stats.py only needs these per group, so a StatsCube can be passed in place of the
+DataFrame and answers by rolling the cube up to the grouping of the test, without reading the
+object rows again.
+'''
+import numpy as np
+import pandas as pd
+
+try:
+    from .backends import MomentsBackend
+    from .aggregates import has_aggregate, read_aggregate
+    from .cache import read_cache
+except ImportError:
+    from backends import MomentsBackend
+    from aggregates import has_aggregate, read_aggregate
+    from cache import read_cache
+
+# The finest grouping of the cube, every query rolls up from these columns
+CUBE_GROUPS = ['Metadata_Plate', 'Metadata_Well', 'Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']
+
+class StatsCube(MomentsBackend):
+    '''
+    Counts, sums and sums of squares per plate, well, cytokine and dose. The sums are taken around
+    the overall mean of every feature so that the variances computed from them keep their precision.
+    The cells are kept in the order the groups first appear in the object table.
+    '''
+
+    def __init__(self, count, sums, sumsq, shift, sizes):
+        self.count = count
+        self.sums = sums
+        self.sumsq = sumsq
+        self.shift = shift
+        self.sizes = sizes
+        self.keys = count.index.to_frame(index=False)
+        self.rows = int(sizes.sum())
+        # the tables as arrays, and the group codes of every grouping that has been queried
+        self._values = {'count': count.to_numpy(dtype=np.float64), 'sums': sums.to_numpy(dtype=np.float64),
+                        'sumsq': sumsq.to_numpy(dtype=np.float64)}
+        self._positions = {feature: j for j, feature in enumerate(count.columns)}
+        self._groupings = {}
+
+    @classmethod
+    def from_frame(cls, df, features=None, group_cols=CUBE_GROUPS):
+        '''
+        Builds the cube from the cleaned DataFrame, features start at column 6
+        '''
+        if features is None:
+            features = df.columns[6:].tolist()
+        values = df[features].astype(np.float64)
+        shift = values.mean()
+        centered = values - shift
+        keys = [df[col] for col in group_cols]
+
+        grouped = centered.groupby(keys, observed=True, sort=False)
+        count = grouped.count()
+        sums = grouped.sum()
+        sumsq = (centered ** 2).groupby(keys, observed=True, sort=False).sum()
+        sizes = df.groupby(group_cols, observed=True, sort=False).size()
+        return cls(count, sums, sumsq, shift, sizes.reindex(count.index))
+
+    @classmethod
+    def from_aggregates(cls, path, features=None):
+        '''
+        Builds the cube from the well-level count, mean and std tables that aggregates.write_aggregates
+        stored next to the cleaned table at path, without reading the object rows. The number of
+        objects of a group is its largest feature count, which is exact after replace_NA
+        '''
+        tables = {stat: read_aggregate(path, 'well', stat, columns=features).set_index(CUBE_GROUPS)
+                  for stat in ['count', 'mean', 'std']}
+        count = tables['count']
+        mean = tables['mean'][count.columns]
+        # pandas' std has ddof=1, a single object has no spread
+        m2 = (tables['std'][count.columns] ** 2 * (count - 1)).fillna(0)
+
+        shift = (count * mean).sum() / count.sum()
+        deviation = (mean - shift).fillna(0)
+        sums = count * deviation
+        sumsq = m2 + count * deviation ** 2
+        return cls(count, sums, sumsq, shift, count.max(axis=1))
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return 'StatsCube(groups=' + str(len(self.count)) + ', features=' + str(self.count.shape[1]) + ', rows=' + str(self.rows) + ')'
+
+    def features(self):
+        return self.count.columns.tolist()
+
+    def _selected(self, where):
+        if where is None:
+            return np.ones(len(self.keys), dtype=bool)
+        return np.asarray(where(self.keys), dtype=bool)
+
+    def _grouping(self, group_cols):
+        key = tuple(group_cols)
+        if key not in self._groupings:
+            grouped = self.keys.groupby(list(group_cols), observed=True, sort=True)
+            self._groupings[key] = (grouped.ngroup().to_numpy(), grouped.size().index)
+        return self._groupings[key]
+
+    def rollup(self, group_cols, features=None, where=None):
+        '''
+        Returns the count, sum and sum of squares (around the shift) of every group of group_cols
+        for the cells that pass the where filter
+        '''
+        features = self.features() if features is None else list(features)
+        columns = [self._positions[feature] for feature in features]
+        codes, index = self._grouping(group_cols)
+        selected = np.flatnonzero(self._selected(where))
+
+        # summing the cells of every group is a product with the cell to group indicator matrix
+        indicator = np.zeros((len(index), len(selected)))
+        indicator[codes[selected], np.arange(len(selected))] = 1
+        present = indicator.any(axis=1)
+        indicator = indicator[present]
+
+        def rolled(name):
+            return pd.DataFrame(indicator @ self._values[name][np.ix_(selected, columns)],
+                                index=index[present], columns=features)
+
+        return rolled('count'), rolled('sums'), rolled('sumsq')
+
+    def group_moments(self, group_cols, features=None, where=None):
+        '''
+        Returns the count, mean and M2 of every group and feature, as incremental.group_moments
+        would on the rows that pass the where filter
+        '''
+        features = self.features() if features is None else list(features)
+        count, sums, sumsq = self.rollup(group_cols, features, where)
+        n = count.where(count > 0)
+        mean = sums / n + self.shift[features]
+        m2 = (sumsq - sums ** 2 / n).clip(lower=0).fillna(0)
+        return {'count': count.astype(np.int64), 'mean': mean, 'm2': m2}
+
+    def count_rows(self, where=None):
+        '''
+        Returns the number of objects that pass the where filter
+        '''
+        return int(self.sizes[self._selected(where)].sum())
+
+    def first_seen(self, col, where=None):
+        '''
+        Returns the values of col in the order they first appear among the objects that pass the where filter
+        '''
+        return self.keys.loc[self._selected(where), col].unique().tolist()
+
+    def save(self, path):
+        pd.to_pickle({'count': self.count, 'sums': self.sums, 'sumsq': self.sumsq, 'shift': self.shift,
+                      'sizes': self.sizes}, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(**pd.read_pickle(path))
+
+def load_for_stats(path):
+    '''
+    Returns what the stats.py functions should be given for the cleaned table at path: the StatsCube
+    of its materialized well-level aggregates when aggregates.write_aggregates has stored them, and
+    the cached object table otherwise
+    '''
+    if all(has_aggregate(path, 'well', stat) for stat in ['count', 'mean', 'std']):
+        return StatsCube.from_aggregates(path)
+    return read_cache(path)
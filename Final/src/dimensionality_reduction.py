@@ -7,6 +7,13 @@ from sklearn.decomposition import PCA
 from sklearn.model_selection import train_test_split
 from typing import Optional, Union
 
+try:
+    from .schema import feature_group
+    from .shared_store import FeatureStore, map_features
+except ImportError:
+    from schema import feature_group
+    from shared_store import FeatureStore, map_features
+
 #FUNCTIONS
 
 ##Function 1 
@@ -158,6 +165,134 @@ def plot_variance_explained(pca_object, title="Variance Explained by Principal C
     # Show the plot
     plt.show()
 
+#Function 5
+def blockwise_correlation(values, block_size=100000, columns: Optional[list] = None):
+    '''
+    This function computes the Pearson correlation matrix of the columns of a 2D array or DataFrame
+    without holding more than block_size rows in float32 at a time. The column means are taken in a
+    first pass and the centered cross-products are accumulated block by block in a second one.
+    Missing values are handled pairwise as in DataFrame.corr: the correlation of two features uses
+    the rows where both are present.
+
+    Inputs:
+    1. values: a 2D array or a DataFrame (objects x features)
+    2. block_size: type(int), the number of rows converted to float32 at once
+    3. columns: type(list), for a DataFrame the columns to correlate, all by default. The rows of
+    a block are sliced before the columns are selected, so only the block is copied
+
+    Returns:
+    1. corr: features x features correlation matrix, 0 for features with no variance
+    '''
+    def block(start):
+        if isinstance(values, pd.DataFrame):
+            rows = values.iloc[start:start + block_size]
+            return (rows if columns is None else rows[columns]).to_numpy(dtype=np.float32)
+        return np.asarray(values[start:start + block_size], dtype=np.float32)
+
+    n_rows = len(values)
+    n_cols = len(columns) if columns is not None else values.shape[1]
+    sums = np.zeros(n_cols)
+    counts = np.zeros(n_cols)
+    for start in range(0, n_rows, block_size):
+        rows = block(start)
+        sums += np.nansum(rows, axis=0, dtype=np.float64)
+        counts += (~np.isnan(rows)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nan_to_num(sums / counts).astype(np.float32)
+
+    # for every pair (i, j), over the rows where both are present: the number of rows, the sums
+    # of x_i and x_i^2 and the cross-product
+    n = np.zeros((n_cols, n_cols))
+    sum_x = np.zeros((n_cols, n_cols))
+    sum_xx = np.zeros((n_cols, n_cols))
+    cross = np.zeros((n_cols, n_cols))
+    for start in range(0, n_rows, block_size):
+        rows = block(start) - means
+        missing = np.isnan(rows)
+        if missing.any():
+            present = (~missing).astype(np.float32)
+            rows[missing] = 0
+            n += present.T @ present
+            sum_x += rows.T @ present
+            sum_xx += (rows ** 2).T @ present
+        else:
+            n += len(rows)
+            sum_x += rows.sum(axis=0, dtype=np.float64)[:, None]
+            sum_xx += (rows ** 2).sum(axis=0, dtype=np.float64)[:, None]
+        cross += rows.T @ rows
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = cross - sum_x * sum_x.T / n
+        var = sum_xx - sum_x ** 2 / n
+        corr = cov / np.sqrt(var * var.T)
+    # only pairs without variance (or without common rows) have no correlation
+    return np.where(np.isnan(corr), 0, corr)
+
+#Function 6
+def _greedy_keep(corr, threshold):
+    # the positions of the features kept when they are visited in order
+    kept_idx = []
+    for j in range(len(corr)):
+        if np.all(corr[j, kept_idx] <= threshold):
+            kept_idx.append(j)
+    return kept_idx
+
+def _prune_group(store, group, groups, threshold, block_size):
+    # the kept positions of one feature group, run in a worker attached to a shared_store.FeatureStore
+    columns = groups[group]
+    corr = np.abs(blockwise_correlation(store.frame(columns), block_size=block_size, columns=columns))
+    return _greedy_keep(corr, threshold)
+
+def prune_correlated_features(data, threshold=0.9, features: Optional[list] = None, by_prefix=True,
+                              block_size=100000, workers=1):
+    '''
+    The function automates the correlation filtering of notebook 03. Within each feature group
+    (Granularity, Intensity, Texture_Contrast, ...) the features are visited in column order and a
+    feature is kept only if its absolute correlation with every feature kept so far is at most
+    threshold, so from a set of strongly correlated features the first one survives.
+
+    Inputs:
+    1. data: type(DataFrame or shared_store.FeatureStore), the cleaned data
+    2. threshold: type(float), the largest absolute correlation allowed between two kept features
+    3. features: type(list), the features to filter, every column from the 7th onwards (every feature
+    of the store) by default
+    4. by_prefix: type(bool), compare features only within their feature group, as in the notebook.
+    With False all features are compared with each other
+    5. block_size: type(int), passed to blockwise_correlation
+    6. workers: type(int), with a FeatureStore the feature groups are pruned in this many processes
+    that attach to the store instead of receiving a copy of the data, None for all cores
+
+    Returns:
+    1. kept: the list of features to keep
+    2. dropped: the list of features to drop
+    '''
+    if features is None:
+        features = data.features if isinstance(data, FeatureStore) else data.columns[6:].tolist()
+
+    groups = {}
+    for feature in features:
+        groups.setdefault(feature_group(feature) if by_prefix else 'all', []).append(feature)
+
+    if isinstance(data, FeatureStore) and workers != 1:
+        kept_positions = map_features(_prune_group, data.directory, list(groups), workers, groups=groups,
+                                      threshold=threshold, block_size=block_size)
+    else:
+        frame = data.frame(features) if isinstance(data, FeatureStore) else data
+        kept_positions = {group: _greedy_keep(np.abs(blockwise_correlation(frame, block_size=block_size,
+                                                                           columns=columns)), threshold)
+                          for group, columns in groups.items()}
+
+    kept, dropped = [], []
+    for group, columns in groups.items():
+        kept_idx = set(kept_positions[group])
+        kept.extend(column for j, column in enumerate(columns) if j in kept_idx)
+        dropped.extend(column for j, column in enumerate(columns) if j not in kept_idx)
+
+    # keep the original column order
+    kept_set = set(kept)
+    kept = [feature for feature in features if feature in kept_set]
+    return kept, dropped
+
 def return_csv(dataframe, file_path):
     '''
     This function takes in a dataframe and filepath and stores it to a csv file.
@@ -0,0 +1,125 @@
+'''
+Content hashes for caching: of a DataFrame, of the code a function runs and of a computation step.
+It only depends on pandas so that any module can key a cache without importing the analysis code.
+'''
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+# FUNCTIONS
+
+def data_fingerprint(df):
+    '''
+    Returns a sha256 hex digest of the content of a DataFrame: its column names, dtypes,
+    index and values. Two frames with the same fingerprint give the same results in every stage
+    whose code is unchanged, which stage_key checks with code_fingerprint.
+    '''
+    h = hashlib.sha256()
+    h.update(json.dumps([str(col) for col in df.columns]).encode())
+    h.update(json.dumps([str(dtype) for dtype in df.dtypes]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _referenced_names(code):
+    # the global names used by a code object and the functions, lambdas and comprehensions inside it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+def callable_name(func):
+    '''
+    Returns a name for any callable: module.qualname for functions and classes, the name of the
+    wrapped function with its bound arguments for a functools.partial, and the class and attributes
+    of a callable object
+    '''
+    if isinstance(func, functools.partial):
+        return ('partial(' + callable_name(func.func) + ', ' + repr(func.args) + ', '
+                + repr(sorted(func.keywords.items())) + ')')
+    if inspect.ismethod(func):
+        return callable_name(func.__self__) + '.' + func.__func__.__name__
+    if not (inspect.isfunction(func) or inspect.isclass(func) or inspect.isbuiltin(func)):
+        # the attributes of a callable object are its parameters
+        return callable_name(type(func)) + '(' + repr(sorted(getattr(func, '__dict__', {}).items())) + ')'
+    module = getattr(func, '__module__', None)
+    qualname = getattr(func, '__qualname__', None)
+    if module is None or qualname is None:
+        return repr(func)
+    return module + '.' + qualname
+
+def _code_object(obj):
+    # the function or class whose source stands for a callable: the wrapped function of a
+    # functools.partial or a bound method, the class of a callable object
+    obj = inspect.unwrap(obj)
+    while isinstance(obj, functools.partial):
+        obj = inspect.unwrap(obj.func)
+    if inspect.ismethod(obj):
+        return obj.__func__
+    if not (inspect.isfunction(obj) or inspect.isclass(obj)) and callable(obj):
+        return type(obj)
+    return obj
+
+def _in_package(obj, package_dir):
+    try:
+        return os.path.dirname(os.path.abspath(inspect.getsourcefile(obj))) == package_dir
+    except (OSError, TypeError):
+        return False
+
+def code_fingerprint(func):
+    '''
+    Returns a sha256 hex digest of the source of func and of every function or class of this
+    package that it calls, directly, through a module attribute such as preprocessing.outlier_detection
+    or through other functions, so that editing a stage or any helper it uses changes the key of the
+    stage. Library code is left out.
+    '''
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    root = _code_object(func)
+    h = hashlib.sha256()
+    seen = set()
+    pending = [root]
+    while pending:
+        obj = _code_object(pending.pop())
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        try:
+            source_file = os.path.abspath(inspect.getsourcefile(obj))
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            # e.g. a stage defined in an interactive session, fall back to its bytecode
+            if obj is root and hasattr(obj, '__code__'):
+                h.update(obj.__code__.co_code + repr(obj.__code__.co_consts).encode())
+            continue
+        if os.path.dirname(source_file) != package_dir and obj is not root:
+            continue
+        h.update((obj.__module__ + '.' + obj.__qualname__ + '\n' + source).encode())
+        code = getattr(obj, '__code__', None)
+        if code is None:
+            # a class, follow the functions defined in it
+            pending.extend(member for member in vars(obj).values() if inspect.isfunction(member))
+            continue
+        names = sorted(_referenced_names(code))
+        referenced = [obj.__globals__.get(name) for name in names]
+        # the attribute names are in co_names too, look them up on the modules of this package
+        modules = [module for module in referenced if inspect.ismodule(module) and _in_package(module, package_dir)]
+        referenced += [getattr(module, name, None) for module in modules for name in names]
+        pending.extend(member for member in referenced if inspect.isfunction(member) or inspect.isclass(member))
+    return h.hexdigest()
+
+def stage_key(input_key, name, func, params):
+    '''
+    Returns the cache key of a stage: a hash of the key of its input, the stage name, the
+    function (callable_name), the code it runs (code_fingerprint) and its parameters
+    '''
+    h = hashlib.sha256()
+    h.update(input_key.encode())
+    h.update(name.encode())
+    h.update(callable_name(func).encode())
+    h.update(code_fingerprint(func).encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
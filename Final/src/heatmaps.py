@@ -3,6 +3,11 @@ import plotly.express as px
 import numpy as np
 import pandas as pd
 
+try:
+    from .aggregates import read_grouped
+except ImportError:
+    from aggregates import read_grouped
+
 # FUNCTIONS
 
 #Function for drawing heatmap 
@@ -16,9 +21,12 @@ def corr_heatmap_generator(df, groupby_cols = ['ImageNumber','Metadata_Metadata_
     
     Arguments:
 
-    - dataframe: the dataframe which is going to be used for finding correlation. Note: all columns in
+    - dataframe: the dataframe (or out_of_core.PlateDataset) which is going to be used for finding correlation. Note: all columns in
     this dataframe that are not numerical must be listed in the groupby_cols argumnent,
     as the function will perform a groupby and take the mean of all other features.
+    The path of a cleaned Parquet table (cache.write_cache) can be given instead: the image-level
+    mean table that aggregates.write_aggregates stored next to it is then read, only for the
+    feature group of interest, and the object rows are not regrouped.
     - groupby_cols: a list of the column names of the dataframe that you wish to groupby
     - name_of_cytokine_column: the name of the column which has different cytokine types
     - cytokine_of_interest: the name of the cytokine we wish to filter the data by
@@ -32,11 +40,18 @@ def corr_heatmap_generator(df, groupby_cols = ['ImageNumber','Metadata_Metadata_
     '''
     # get the remaining columns
     # Reference: https://stackoverflow.com/questions/3428536/how-do-i-subtract-one-list-from-another
-    all_cols = df.columns.to_list()
-    features_of_interest = [elt for elt in all_cols if elt not in groupby_cols]
-    
-    # Perform groupby and calculate average
-    df = df.groupby(groupby_cols)[features_of_interest].mean().reset_index()
+    if isinstance(df, str):
+        # a cached table, answered from its materialized aggregate when there is one
+        df = read_grouped(df, groupby_cols, 'mean', group=columns_of_interest_for_heatmap)
+    elif isinstance(df, pd.DataFrame):
+        all_cols = df.columns.to_list()
+        features_of_interest = [elt for elt in all_cols if elt not in groupby_cols]
+        
+        # Perform groupby and calculate average
+        df = df.groupby(groupby_cols, observed=True)[features_of_interest].mean().reset_index()
+    else:
+        # disk-backed datasets (out_of_core.PlateDataset) merge per-plate sums and counts
+        df = df.grouped_mean(groupby_cols)
     
     # Select columns starting with columns_of_interest_for_heatmap
     selected_columns = df.filter(regex=f'^{columns_of_interest_for_heatmap}_', axis=1).columns.tolist()
@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from .preprocessing import OUTLIER_GROUPS, sd_outlier_mask, split_outliers
+except ImportError:
+    from preprocessing import OUTLIER_GROUPS, sd_outlier_mask, split_outliers
+
+# The running statistics of every group, in the order save_moments stores them
+MOMENT_STATS = ['count', 'mean', 'm2']
+
+# FUNCTIONS
+
+def group_moments(df, features=None, group_cols=OUTLIER_GROUPS):
+    '''
+    This function computes the running statistics of every feature for every group: the number
+    of non-missing values, their mean and M2, the sum of squared deviations from the mean.
+
+    Arguments:
+
+    - df: the Pandas DataFrame after drop_columns, features start at column 6
+    - features: the features to summarise, every column from the 7th onwards by default
+    - group_cols: the columns that define a group, (cytokine, dose, well) as in outlier_detection
+
+    Returns:
+
+    - moments: a dictionary with the 'count', 'mean' and 'm2' DataFrames, indexed by the
+    groups with one column per feature
+    '''
+    if features is None:
+        features = df.columns[6:]
+
+    grouped = df.groupby(group_cols, observed=True, dropna=False)[list(features)]
+    count = grouped.count()
+    mean = grouped.mean()
+    m2 = (grouped.var(ddof=0) * count).fillna(0)
+
+    return {'count': count, 'mean': mean.where(count > 0), 'm2': m2}
+
+def merge_moments(a, b):
+    '''
+    This function merges two sets of running statistics with the pairwise Welford (Chan et al.)
+    update, so that the result is the same as computing group_moments on both data sets together.
+    Groups and features that only appear in one of the inputs are carried over.
+
+    Arguments:
+
+    - a, b: outputs of group_moments or of a previous merge
+
+    Returns:
+
+    - the merged moments dictionary
+    '''
+    index = a['count'].index.union(b['count'].index)
+    columns = a['count'].columns.union(b['count'].columns, sort=False)
+
+    def aligned(moments, key):
+        return moments[key].reindex(index=index, columns=columns).fillna(0).to_numpy(dtype=np.float64)
+
+    n_a, mean_a, m2_a = aligned(a, 'count'), aligned(a, 'mean'), aligned(a, 'm2')
+    n_b, mean_b, m2_b = aligned(b, 'count'), aligned(b, 'mean'), aligned(b, 'm2')
+
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, mean_a + delta * n_b / n, np.nan)
+        m2 = np.where(n > 0, m2_a + m2_b + delta ** 2 * n_a * n_b / n, 0)
+
+    return {'count': pd.DataFrame(n.astype(np.int64), index=index, columns=columns),
+            'mean': pd.DataFrame(mean, index=index, columns=columns),
+            'm2': pd.DataFrame(m2, index=index, columns=columns)}
+
+def moments_std(moments):
+    '''
+    Returns the population standard deviation (ddof=0) of every group and feature
+    '''
+    count = moments['count']
+    return np.sqrt(moments['m2'] / count.where(count > 0))
+
+def pooled_means(moments):
+    '''
+    Returns the overall mean of every feature across all groups, the value replace_NA fills with
+    '''
+    count = moments['count']
+    return (moments['mean'].fillna(0) * count).sum() / count.sum().where(count.sum() > 0)
+
+def save_moments(moments, path):
+    '''
+    Stores the running statistics as one Parquet table: the group columns, a 'moment' column
+    naming the statistic of the row ('count', 'mean' or 'm2') and one column per feature
+    '''
+    group_cols = list(moments['count'].index.names)
+    features = [str(col) for col in moments['count'].columns]
+    table = pd.concat([moments[stat].astype(np.float64).reset_index().assign(moment=stat)
+                       for stat in MOMENT_STATS], ignore_index=True)
+    table.columns = [str(col) for col in table.columns]
+    table[group_cols + ['moment'] + features].to_parquet(path, index=False)
+
+def load_moments(path):
+    '''
+    Loads the running statistics written by save_moments
+    '''
+    table = pd.read_parquet(path)
+    group_cols = table.columns[:table.columns.get_loc('moment')].tolist()
+    moments = {stat: table[table['moment'] == stat].drop(columns='moment').set_index(group_cols)
+               for stat in MOMENT_STATS}
+    moments['count'] = moments['count'].astype(np.int64)
+    return moments
+
+def score_outliers(df, moments, sd, thresh, group_cols=OUTLIER_GROUPS):
+    '''
+    This function runs the outlier_detection rule for df against stored group statistics
+    instead of statistics computed from df itself. Objects of groups that are not in the
+    store are never flagged.
+
+    Arguments:
+
+    - df: the Pandas DataFrame to score, features start at column 6
+    - moments: the running statistics, usually including df
+    - sd: the number of standard deviations used as the cut-off
+    - thresh: the fraction of features an object must be an outlier in to be dropped
+
+    Returns:
+
+    - outliers: the objects that are outliers in at least thresh of the features
+    - sub_data: the remaining objects
+    '''
+    features = df.columns[6:]
+    keys = pd.MultiIndex.from_frame(df[group_cols].astype(object))
+    if len(group_cols) == 1:
+        keys = keys.get_level_values(0)
+
+    means = moments['mean'].reindex(index=keys, columns=features).to_numpy(dtype=np.float64)
+    sds = moments_std(moments).reindex(index=keys, columns=features).to_numpy(dtype=np.float64)
+    values = df[features].to_numpy(dtype=np.float64)
+
+    outlier_mask = sd_outlier_mask(values, means, sds, sd)
+
+    return split_outliers(df, outlier_mask, thresh)
+
+def append_plate(new_data, moments=None, sd=5, thresh=0.2, store_path=None):
+    '''
+    This function ingests a new plate without touching the plates that were already processed.
+    The plate's own statistics are merged into the store, its missing values are filled with the
+    overall means of the updated store, and its objects are scored against the updated group
+    statistics. The cost depends on the size of the new plate and the number of groups only.
+
+    The store is built from the observed values, so the imputed values do not feed back into the
+    group statistics.
+
+    Arguments:
+
+    - new_data: the new plate after drop_columns, features start at column 6. It is imputed in place
+    - moments: the running statistics of the plates so far, loaded from store_path when not given
+    - sd: the number of standard deviations used as the cut-off
+    - thresh: the fraction of features an object must be an outlier in to be dropped
+    - store_path: optional Parquet file holding the store (save_moments); it is read when
+    moments is None and rewritten with the updated store
+
+    Returns:
+
+    - outliers: the outliers of the new plate
+    - sub_data: the remaining objects of the new plate
+    - moments: the updated running statistics
+    '''
+    if moments is None and store_path is not None:
+        try:
+            moments = load_moments(store_path)
+        except FileNotFoundError:
+            moments = None
+
+    new_moments = group_moments(new_data)
+    moments = new_moments if moments is None else merge_moments(moments, new_moments)
+
+    measurements = new_data.columns[6:]
+    new_data[measurements] = new_data[measurements].fillna(pooled_means(moments)[measurements])
+
+    outliers, sub_data = score_outliers(new_data, moments, sd, thresh)
+
+    if store_path is not None:
+        save_moments(moments, store_path)
+
+    return outliers, sub_data, moments
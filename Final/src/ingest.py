@@ -0,0 +1,114 @@
+import pandas as pd
+
+try:
+    from .preprocessing import is_dropped_column
+except ImportError:
+    from preprocessing import is_dropped_column
+
+# FUNCTIONS
+
+def kept_columns(file_path, sep=','):
+    '''
+    This function reads only the header of a CellProfiler object table and returns the columns
+    that survive drop_columns, in file order
+
+    Arguments:
+
+    - file_path: path to the exported csv, e.g. pam194ObjCell.csv
+    - sep: the delimiter of the file
+
+    Returns:
+
+    - list of the column names to read, empty for an empty file
+    '''
+    try:
+        header = pd.read_csv(file_path, sep=sep, nrows=0).columns
+    except pd.errors.EmptyDataError:
+        return []
+    return [col for col in header if not is_dropped_column(col)]
+
+def column_means(file_path, chunksize=100000, sep=','):
+    '''
+    First pass of the streaming cleaner. Reads the table in chunks, without the dropped columns,
+    and accumulates the per-column sums and counts that replace_NA needs for its means.
+
+    Arguments:
+
+    - file_path: path to the exported csv
+    - chunksize: number of rows held in memory at once
+    - sep: the delimiter of the file
+
+    Returns:
+
+    - means: a Pandas Series with the mean of every measurement column (columns 6 onwards after dropping)
+    '''
+    columns = kept_columns(file_path, sep=sep)
+    measurements = columns[6:]
+
+    sums = pd.Series(0.0, index=measurements)
+    counts = pd.Series(0, index=measurements)
+    for chunk in pd.read_csv(file_path, sep=sep, usecols=columns, chunksize=chunksize):
+        sums += chunk[measurements].sum()
+        counts += chunk[measurements].count()
+
+    # columns that are entirely empty get a NaN mean and stay empty, as in replace_NA
+    return sums / counts.where(counts > 0)
+
+def iter_clean_chunks(file_path, means=None, chunksize=100000, sep=','):
+    '''
+    Second pass of the streaming cleaner. Yields the table chunk by chunk with the dropped columns
+    skipped at read time and the missing measurements filled with the given means.
+
+    Arguments:
+
+    - file_path: path to the exported csv
+    - means: the output of column_means, computed from file_path when not given
+    - chunksize: number of rows held in memory at once
+    - sep: the delimiter of the file
+
+    Returns:
+
+    - a generator of cleaned Pandas DataFrames
+    '''
+    if means is None:
+        means = column_means(file_path, chunksize=chunksize, sep=sep)
+    columns = kept_columns(file_path, sep=sep)
+
+    for chunk in pd.read_csv(file_path, sep=sep, usecols=columns, chunksize=chunksize):
+        chunk[means.index] = chunk[means.index].fillna(means)
+        yield chunk
+
+def stream_clean_csv(file_path, output_path, chunksize=100000, sep=','):
+    '''
+    This function is the out-of-memory version of drop_columns followed by replace_NA. The table is
+    read twice, once to collect the column means and once to impute and write, so the peak memory
+    is bounded by chunksize and not by the size of the file.
+
+    Arguments:
+
+    - file_path: path to the exported csv, e.g. pam194ObjCell.csv
+    - output_path: path of the cleaned csv to write
+    - chunksize: number of rows held in memory at once
+    - sep: the delimiter of the input file
+
+    Returns:
+
+    - means: the column means used for the imputation
+
+    The output is always written: with only the header when the input has no rows, and empty when
+    the input file is empty.
+    '''
+    columns = kept_columns(file_path, sep=sep)
+    if not columns:
+        open(output_path, 'w').close()
+        return pd.Series(dtype='float64')
+    means = column_means(file_path, chunksize=chunksize, sep=sep)
+
+    first = True
+    for chunk in iter_clean_chunks(file_path, means=means, chunksize=chunksize, sep=sep):
+        chunk.to_csv(output_path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+    if first:
+        pd.DataFrame(columns=columns).to_csv(output_path, index=False)
+
+    return means
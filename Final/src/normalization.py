@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# The untreated control wells every plate carries
+CONTROLS = ['untr', 'untr-50']
+
+# Dividing the interquartile range by this makes it consistent with the SD for normal data
+IQR_SCALE = 1.349
+
+# FUNCTIONS
+
+def control_parameters(df, features=None, controls=CONTROLS, robust=True):
+    '''
+    This function estimates the location and scale of every feature in the untreated controls of
+    every plate, in one grouped pass over the control objects. These are the plate effects that
+    run_ANOVA_plates detects.
+
+    Arguments:
+
+    - df: the cleaned Pandas DataFrame, features start at column 6
+    - features: the features to estimate, every column from the 7th onwards by default
+    - controls: the cytokine labels of the control wells
+    - robust: True for the median and IQR / 1.349, False for the mean and SD
+
+    Returns:
+
+    - params: a Pandas DataFrame indexed by ('location' or 'scale', plate) with one column per feature
+    '''
+    if features is None:
+        features = df.columns[6:].tolist()
+
+    ctrl = df[df['Metadata_Metadata_Cytokine'].isin(controls)]
+    if len(ctrl) == 0:
+        raise ValueError('there are no control objects labelled ' + ', '.join(controls))
+    grouped = ctrl.groupby('Metadata_Plate', observed=True)[features]
+
+    if robust:
+        quartiles = grouped.quantile([0.25, 0.5, 0.75])
+        location = quartiles.xs(0.5, level=-1)
+        scale = (quartiles.xs(0.75, level=-1) - quartiles.xs(0.25, level=-1)) / IQR_SCALE
+    else:
+        location = grouped.mean()
+        scale = grouped.std()
+
+    return pd.concat({'location': location, 'scale': scale})
+
+def normalize_to_controls(df, params, method='zscore'):
+    '''
+    This function normalizes every object to the controls of its own plate. The per-plate
+    parameters are broadcast to the objects and the whole measurement block is transformed in one
+    array operation.
+
+    Arguments:
+
+    - df: the Pandas DataFrame to normalize, it can hold plates that were not used to estimate
+    params as long as params has an entry for them
+    - params: the output of control_parameters, or load_control_parameters for cached ones
+    - method: 'zscore' for (x - location) / scale, 'percent' for 100 * x / location
+
+    Returns:
+
+    - a new Pandas DataFrame with the normalized features. A zero scale or location gives NaN
+    '''
+    if method not in ['zscore', 'percent']:
+        raise ValueError("method must be 'zscore' or 'percent'")
+
+    location = params.loc['location']
+    scale = params.loc['scale']
+    features = location.columns.tolist()
+
+    # position of every object's plate in the parameter table
+    plate_idx = location.index.get_indexer(df['Metadata_Plate'])
+    if (plate_idx < 0).any():
+        missing = df['Metadata_Plate'][plate_idx < 0].unique().tolist()
+        raise ValueError('no control parameters for plates ' + ', '.join(str(p) for p in missing))
+
+    values = df[features].to_numpy(dtype=np.float64)
+    loc = location.to_numpy(dtype=np.float64)[plate_idx]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method == 'zscore':
+            spread = scale.to_numpy(dtype=np.float64)[plate_idx]
+            normalized = (values - loc) / np.where(spread > 0, spread, np.nan)
+        else:
+            normalized = 100 * values / np.where(loc != 0, loc, np.nan)
+
+    # float32 features from schema.compact_dtypes stay float32
+    dtypes = {col: np.float32 if df[col].dtype == np.float32 else np.float64 for col in features}
+    out = df.copy()
+    out[features] = pd.DataFrame(normalized, index=df.index, columns=features).astype(dtypes)
+    return out
+
+def save_control_parameters(params, path):
+    '''
+    Caches the per-plate control parameters so that new data can be normalized without the controls
+    '''
+    params.to_pickle(path)
+
+def load_control_parameters(path):
+    '''
+    Loads the parameters written by save_control_parameters
+    '''
+    return pd.read_pickle(path)
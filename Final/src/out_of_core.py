@@ -0,0 +1,279 @@
+'''
+Disk-backed datasets for data that does not fit in memory. The cleaned object table is stored as
+Parquet files partitioned by plate, and the group statistics the src functions need are computed
+partition by partition and merged. A PlateDataset can be passed wherever the src functions below
+take a DataFrame:
+
+- preprocessing.outlier_detection
+- heatmaps.corr_heatmap_generator
+- treatment_profiling.treatment_profiles_heatmap
+- stats.run_ANOVA_doses, stats.run_ANOVA_plates, stats.run_ANOVA_cytokines
+- stats.run_ANOVA_doses_batch, stats.run_ANOVA_plates_batch, stats.run_ANOVA_cytokines_batch
+- stats.doses_Tukey_HSD_batch, stats.plate_Tukey_HSD_batch, stats.cytokine_Tukey_HSD_batch
+- stats.get_ttest_wells_batch, stats.get_ttest_wells, stats.get_ttest_wells_d
+'''
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+try:
+    from .ingest import column_means, iter_clean_chunks
+    from .incremental import group_moments, merge_moments, score_outliers
+    from .preprocessing import OUTLIER_GROUPS
+    from .backends import MomentsBackend, UNTREATED
+except ImportError:
+    from ingest import column_means, iter_clean_chunks
+    from incremental import group_moments, merge_moments, score_outliers
+    from preprocessing import OUTLIER_GROUPS
+    from backends import MomentsBackend, UNTREATED
+
+# The columns that are always loaded for the where filters
+FILTER_COLUMNS = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']
+
+def partition_name(plate):
+    '''
+    Returns a folder name for a plate label, e.g. 'plate=Plate_1' for 'Plate 1'
+    '''
+    return 'plate=' + re.sub(r'[^0-9A-Za-z.-]+', '_', str(plate))
+
+class PlateDataset(MomentsBackend):
+    '''
+    A cleaned object table stored on disk as one folder of Parquet files per plate, with a
+    dataset.json that lists the columns and the plates. Only one partition, or a few columns of all
+    partitions, is in memory at a time. The stats.py tests come from backends.MomentsBackend.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'dataset.json')) as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.partitions = meta['partitions']
+        self.rows = meta['rows']
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return 'PlateDataset(' + repr(self.directory) + ', plates=' + str(len(self.partitions)) + ', rows=' + str(self.rows) + ')'
+
+    @property
+    def plates(self):
+        return list(self.partitions)
+
+    # WRITING
+
+    @classmethod
+    def write(cls, chunks, directory, plate_col='Metadata_Plate'):
+        '''
+        This function writes an iterable of DataFrame chunks to a new dataset, splitting every chunk
+        by plate so that no plate has to be in memory at once
+
+        Arguments:
+
+        - chunks: an iterable of Pandas DataFrames with the same columns, or a single DataFrame
+        - directory: the folder of the dataset, it must not contain another dataset
+        - plate_col: the column to partition on
+
+        Returns:
+
+        - the PlateDataset
+        '''
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
+        if os.path.exists(os.path.join(directory, 'dataset.json')):
+            raise FileExistsError(directory + ' already contains a dataset')
+        os.makedirs(directory, exist_ok=True)
+
+        columns, partitions, parts, rows = None, {}, {}, 0
+        for chunk in chunks:
+            if columns is None:
+                columns = [str(col) for col in chunk.columns]
+            for plate, part in chunk.groupby(plate_col, sort=False, observed=True):
+                folder = partitions.setdefault(str(plate), partition_name(plate))
+                os.makedirs(os.path.join(directory, folder), exist_ok=True)
+                parts[folder] = parts.get(folder, 0) + 1
+                part.to_parquet(os.path.join(directory, folder, 'part-%05d.parquet' % parts[folder]))
+            rows += len(chunk)
+
+        with open(os.path.join(directory, 'dataset.json'), 'w') as f:
+            json.dump({'columns': columns or [], 'partitions': partitions, 'rows': rows}, f, indent=1)
+        return cls(directory)
+
+    @classmethod
+    def from_csv(cls, file_paths, directory, chunksize=100000):
+        '''
+        Streams one or more CellProfiler exports through the chunked cleaner of ingest.py
+        (drop_columns and replace_NA with the means of each file) into a new dataset
+        '''
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+
+        def chunks():
+            for file_path in file_paths:
+                means = column_means(file_path, chunksize=chunksize)
+                for chunk in iter_clean_chunks(file_path, means=means, chunksize=chunksize):
+                    yield chunk
+
+        return cls.write(chunks(), directory)
+
+    # READING
+
+    def read_partition(self, plate, columns=None):
+        '''
+        Returns the objects of one plate, with only the given columns when columns is not None
+        '''
+        folder = os.path.join(self.directory, self.partitions[str(plate)])
+        files = sorted(name for name in os.listdir(folder) if name.endswith('.parquet'))
+        return pd.concat([pd.read_parquet(os.path.join(folder, name), columns=columns) for name in files])
+
+    def iter_partitions(self, columns=None):
+        '''
+        Yields (plate, DataFrame) for every plate, one at a time
+        '''
+        for plate in self.partitions:
+            yield plate, self.read_partition(plate, columns=columns)
+
+    def read(self, columns=None, where=None):
+        '''
+        Loads the given columns of the objects that pass the where filter into one DataFrame.
+        Only use it when the projection fits in memory.
+
+        Arguments:
+
+        - columns: the columns to load, all by default
+        - where: optional function taking a partition DataFrame and returning a boolean mask,
+        it can use the columns in FILTER_COLUMNS
+        '''
+        read_columns = columns
+        if where is not None and columns is not None:
+            read_columns = list(dict.fromkeys(list(columns) + FILTER_COLUMNS))
+        frames = []
+        for plate, part in self.iter_partitions(columns=read_columns):
+            if where is not None:
+                part = part[where(part)]
+            frames.append(part if columns is None else part[columns])
+        return pd.concat(frames)
+
+    def features(self):
+        '''
+        Returns the measurement columns, every column from the 7th onwards as in preprocessing
+        '''
+        return self.columns[6:]
+
+    # PARTIAL AGGREGATES
+
+    def group_moments(self, group_cols, features=None, where=None):
+        '''
+        Returns the count, mean and M2 of every group and feature, computed for every plate
+        and merged with incremental.merge_moments. where is an optional row filter as in read
+        '''
+        features = self.features() if features is None else list(features)
+        columns = list(group_cols) + features + (FILTER_COLUMNS if where is not None else [])
+        moments = None
+        for plate, part in self.iter_partitions(columns=list(dict.fromkeys(columns))):
+            if where is not None:
+                part = part[where(part)]
+            if len(part) == 0:
+                continue
+            part_moments = group_moments(part, features=features, group_cols=group_cols)
+            moments = part_moments if moments is None else merge_moments(moments, part_moments)
+        return moments
+
+    def grouped_mean(self, groupby_cols, features=None):
+        '''
+        Returns the equivalent of df.groupby(groupby_cols)[features].mean().reset_index(), from
+        per-plate sums and counts. features defaults to every column not in groupby_cols.
+        '''
+        if features is None:
+            features = [col for col in self.columns if col not in groupby_cols]
+        sums, counts = [], []
+        for plate, part in self.iter_partitions(columns=list(groupby_cols) + list(features)):
+            grouped = part.groupby(groupby_cols, observed=True)[features]
+            sums.append(grouped.sum())
+            counts.append(grouped.count())
+        sums = pd.concat(sums).groupby(level=list(range(len(groupby_cols)))).sum()
+        counts = pd.concat(counts).groupby(level=list(range(len(groupby_cols)))).sum()
+        return (sums / counts.where(counts > 0)).reset_index()
+
+    # BACKENDS OF THE PUBLIC SRC FUNCTIONS
+
+    def outlier_detection(self, sd, thresh, method='sd', output_directory=None):
+        '''
+        Out-of-core preprocessing.outlier_detection. The (cytokine, dose, well) means and SDs are
+        merged across plates in a first pass, and every plate is scored against them in a second one.
+
+        Returns:
+
+        - outliers: a Pandas DataFrame of the outliers, which are few
+        - sub_data: a PlateDataset of the remaining objects, written to output_directory
+        (the dataset folder + '_clean' by default). A dataset already in output_directory, e.g.
+        from a previous call, is replaced once the new one is complete.
+        '''
+        if method != 'sd':
+            raise ValueError("method='" + str(method) + "' is not available out of core, only method='sd': "
+                             "medians and MADs cannot be merged across plates")
+        if output_directory is None:
+            output_directory = os.path.normpath(self.directory) + '_clean'
+        if os.path.abspath(output_directory) == os.path.abspath(self.directory):
+            raise ValueError('output_directory must not be the folder of the dataset being cleaned')
+
+        moments = self.group_moments(OUTLIER_GROUPS)
+        outliers = []
+
+        def kept():
+            for plate, part in self.iter_partitions():
+                part_outliers, part_kept = score_outliers(part, moments, sd, thresh)
+                outliers.append(part_outliers)
+                yield part_kept
+
+        # the new dataset is written next to the old one and swapped in when it is complete
+        temporary = os.path.normpath(output_directory) + '.tmp'
+        shutil.rmtree(temporary, ignore_errors=True)
+        PlateDataset.write(kept(), temporary)
+        if os.path.exists(output_directory):
+            shutil.rmtree(output_directory)
+        os.replace(temporary, output_directory)
+        return pd.concat(outliers), PlateDataset(output_directory)
+
+    def treatment_medians(self, non_numeric_cols, features_per_pass=None):
+        '''
+        The per cytokine and dose medians of treatment_profiles_heatmap. Medians cannot be merged
+        from partial aggregates, so the values of the features are gathered from every plate: each
+        partition is read once for all the features. features_per_pass bounds the memory instead,
+        with one read of every partition per block of that many features.
+        '''
+        treatment = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']
+        features = [col for col in self.columns if col not in non_numeric_cols]
+        step = max(len(features) if features_per_pass is None else features_per_pass, 1)
+        medians = []
+        for start in range(0, len(features), step):
+            block = features[start:start + step]
+            part = self.read(columns=treatment + block)
+            key = part['Metadata_Metadata_Cytokine'].astype(str) + "-" + part['Metadata_Metadata_Dose'].astype(str)
+            medians.append(part[block].groupby(key.rename('Cytokine_and_Dose')).median())
+        return pd.concat(medians, axis=1)
+
+    def count_rows(self, where=None):
+        '''
+        Returns the number of objects that pass the where filter
+        '''
+        if where is None:
+            return self.rows
+        return sum(int(where(part).sum()) for plate, part in self.iter_partitions(columns=FILTER_COLUMNS))
+
+    def first_seen(self, col, where=None):
+        '''
+        Returns the values of col in the order they first appear among the objects that pass the
+        where filter, reading the partitions in order
+        '''
+        columns = list(dict.fromkeys([col] + (FILTER_COLUMNS if where is not None else [])))
+        values = {}
+        for plate, part in self.iter_partitions(columns=columns):
+            if where is not None:
+                part = part[where(part)]
+            values.update(dict.fromkeys(value for value in part[col].unique() if value not in values))
+        return list(values)
@@ -0,0 +1,144 @@
+'''
+Permutation tests for the group comparisons of stats.py, which do not assume normal features. The
+group labels are shuffled as integer index arrays, and for a chunk of permutations the group sums of
+every feature are one sparse indicator matrix product, so all features and permutations of a chunk
+are tested at once. The statistic is the between group sum of squares, which orders permutations
+the same way as the one-way ANOVA F-statistic.
+'''
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# The columns of the tables returned by the permutation tests
+PERMUTATION_COLUMNS = ['Cytokine', 'Feature', 'F-stat', 'P-value', 'N', 'Groups', 'Permutations']
+
+# FUNCTIONS
+
+def permutation_anova(values, labels, n_permutations=1000, seed=0, chunk_size=100):
+    '''
+    This function runs the one-way ANOVA permutation test for every column of values
+
+    Arguments:
+
+    - values: array (objects x features) without missing values
+    - labels: array of the group of every object, objects with a missing label are left out
+    - n_permutations: the number of label permutations
+    - seed: the seed of the permutations, the same seed gives the same P-values for any chunk_size
+    - chunk_size: the number of permutations evaluated at once
+
+    Returns:
+
+    - F: array of the F-statistic of every feature
+    - p: array of the permutation P-value of every feature, (1 + #{F_perm >= F}) / (1 + n_permutations)
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    codes, groups = pd.factorize(np.asarray(labels), sort=True)
+    # objects without a group label are left out, as groupby does
+    labelled = codes >= 0
+    values, codes = values[labelled], codes[labelled]
+    if np.isnan(values).any():
+        raise ValueError('the permutation tests need complete features, run replace_NA first')
+    n, k = len(codes), len(groups)
+    sizes = np.bincount(codes, minlength=k).astype(np.float64)
+
+    # the sums of squares only depend on deviations from the feature means
+    centered = values - values.mean(axis=0)
+    total_ss = (centered ** 2).sum(axis=0)
+
+    def between_ss(sums):
+        return (sums ** 2 / sizes[:, None]).sum(axis=-2)
+
+    observed = between_ss(sparse.csr_matrix((np.ones(n), (codes, np.arange(n))), shape=(k, n)) @ centered)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        F = (observed / (k - 1)) / ((total_ss - observed) / (n - k))
+
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(values.shape[1])
+    # a small tolerance so that permutations that tie with the observed value count as exceeding it
+    threshold = observed - 1e-9 * np.abs(observed)
+    for start in range(0, n_permutations, chunk_size):
+        chunk = min(chunk_size, n_permutations - start)
+        # one row of shuffled object indices per permutation
+        permutations = rng.permuted(np.tile(np.arange(n), (chunk, 1)), axis=1)
+        rows = (np.arange(chunk)[:, None] * k + codes[permutations]).ravel()
+        columns = np.tile(np.arange(n), chunk)
+        indicator = sparse.csr_matrix((np.ones(chunk * n), (rows, columns)), shape=(chunk * k, n))
+        sums = (indicator @ centered).reshape(chunk, k, -1)
+        exceed += (between_ss(sums) >= threshold).sum(axis=0)
+
+    p = (1 + exceed) / (1 + n_permutations)
+    return F, p
+
+def _permutation_table(sub_df, group_col, label, features, n_permutations, seed, chunk_size):
+    F, p = permutation_anova(sub_df[features].to_numpy(), sub_df[group_col].to_numpy(), n_permutations, seed,
+                             chunk_size)
+    return pd.DataFrame({'Cytokine': label,
+                         'Feature': features,
+                         'F-stat': F,
+                         'P-value': p,
+                         'N': int(sub_df[group_col].notna().sum()),
+                         'Groups': sub_df[group_col].nunique(),
+                         'Permutations': n_permutations}, columns=PERMUTATION_COLUMNS)
+
+def permutation_ANOVA_doses(cytokine, df, features=None, n_permutations=1000, seed=0, chunk_size=100):
+    '''
+    This function runs the permutation test across dosage levels of a cytokine, the
+    counterpart of run_ANOVA_doses
+
+    Arguments:
+
+    - cytokine: the cytokine we are interested in
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - n_permutations, seed, chunk_size: passed to permutation_anova
+
+    Returns:
+
+    - final_df: a Pandas DataFrame with the columns of PERMUTATION_COLUMNS, one row per feature
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == cytokine, ['Metadata_Metadata_Dose'] + features]
+    return _permutation_table(sub_df, 'Metadata_Metadata_Dose', cytokine, features, n_permutations, seed, chunk_size)
+
+def permutation_ANOVA_plates(untr, df, features=None, n_permutations=1000, seed=0, chunk_size=100):
+    '''
+    This function runs the permutation test across plates using untreated experiments, the
+    counterpart of run_ANOVA_plates
+
+    Arguments:
+
+    - untr: specifies the untreated experiments
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - n_permutations, seed, chunk_size: passed to permutation_anova
+
+    Returns:
+
+    - final_df: a Pandas DataFrame with the columns of PERMUTATION_COLUMNS, one row per feature
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == untr, ['Metadata_Plate'] + features]
+    return _permutation_table(sub_df, 'Metadata_Plate', untr, features, n_permutations, seed, chunk_size)
+
+def permutation_ANOVA_cytokines(df, dose, features=None, n_permutations=1000, seed=0, chunk_size=100):
+    '''
+    This function runs the permutation test across different cytokines at the dosage level of
+    interest, the counterpart of run_ANOVA_cytokines
+
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - dose: the dosage level that we are interested in
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - n_permutations, seed, chunk_size: passed to permutation_anova
+
+    Returns:
+
+    - final_df: a Pandas DataFrame with the columns of PERMUTATION_COLUMNS, one row per feature
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    # We're only looking at our treated cells, so filter out the untreated cells
+    treated = ((df['Metadata_Metadata_Dose'] == dose) &
+               (df['Metadata_Metadata_Cytokine'] != 'untr') & (df['Metadata_Metadata_Cytokine'] != 'untr-50'))
+    sub_df = df.loc[treated, ['Metadata_Metadata_Cytokine'] + features]
+    return _permutation_table(sub_df, 'Metadata_Metadata_Cytokine', dose, features, n_permutations, seed, chunk_size)
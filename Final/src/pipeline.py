@@ -0,0 +1,179 @@
+import os
+import time
+
+import pandas as pd
+
+try:
+    from .fingerprint import data_fingerprint, stage_key
+    from .preprocessing import drop_columns, replace_NA, outlier_detection
+    from .dimensionality_reduction import principal_component_analysis, prune_correlated_features
+    from .normalization import control_parameters, normalize_to_controls
+except ImportError:
+    from fingerprint import data_fingerprint, stage_key
+    from preprocessing import drop_columns, replace_NA, outlier_detection
+    from dimensionality_reduction import principal_component_analysis, prune_correlated_features
+    from normalization import control_parameters, normalize_to_controls
+
+# STAGES
+# Every stage takes the output of the previous one plus its parameters and returns a new object,
+# the in-place steps of the notebooks are wrapped so that cached inputs are never modified.
+
+def clean_stage(data, scope='global'):
+    '''
+    drop_columns followed by replace_NA on a copy of data
+    '''
+    data = data.copy()
+    drop_columns(data)
+    replace_NA(data, scope=scope)
+    return data
+
+def outlier_stage(data, sd=5, thresh=0.2, method='sd'):
+    '''
+    Returns the objects that outlier_detection keeps
+    '''
+    outliers, sub_data = outlier_detection(data, sd, thresh, method=method)
+    return sub_data
+
+def normalize_stage(data, method='zscore', robust=True):
+    '''
+    Normalizes every plate to its own untreated controls
+    '''
+    return normalize_to_controls(data, control_parameters(data, robust=robust), method=method)
+
+def drop_features_stage(data, columns=()):
+    '''
+    Drops a fixed list of features, e.g. the Texture_Contrast_* columns picked in notebook 03
+    '''
+    return data.drop(list(columns), axis=1)
+
+def prune_stage(data, threshold=0.9, by_prefix=True):
+    '''
+    Drops the features that prune_correlated_features finds redundant
+    '''
+    kept, dropped = prune_correlated_features(data, threshold=threshold, by_prefix=by_prefix)
+    return data.drop(dropped, axis=1)
+
+def pca_stage(data, number_of_components=10, number_of_column=6):
+    '''
+    principal_component_analysis on the features from number_of_column onwards, returns (pca, columns)
+    '''
+    return principal_component_analysis(data, number_of_components=number_of_components,
+                                        number_of_column=number_of_column)
+
+# PIPELINE
+
+class Pipeline:
+    '''
+    A declarative chain of analysis stages with an on-disk cache. The output of every stage is
+    stored under a key that hashes the fingerprint of the input data together with the parameters
+    of that stage and all the stages before it. Changing a parameter therefore only reruns that stage
+    and the ones after it, everything upstream is read back from the cache.
+
+    Example:
+
+        pipe = (Pipeline('cache/')
+                .add('clean', clean_stage)
+                .add('outliers', outlier_stage, sd=5, thresh=0.2)
+                .add('pca', pca_stage, number_of_components=10))
+        pca, columns = pipe.run(raw_data)
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.stages = []
+        self.last_run = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def add(self, name, func, **params):
+        '''
+        Appends a stage that calls func(previous_output, **params), returns the pipeline for chaining
+        '''
+        if any(stage[0] == name for stage in self.stages):
+            raise ValueError("a stage named '" + name + "' already exists")
+        self.stages.append((name, func, params))
+        return self
+
+    def keys(self, data):
+        '''
+        Returns the cache key of every stage for the given input data
+        '''
+        keys = []
+        key = data_fingerprint(data)
+        for name, func, params in self.stages:
+            key = stage_key(key, name, func, params)
+            keys.append(key)
+        return keys
+
+    def cache_path(self, name, key):
+        return os.path.join(self.cache_dir, name + '-' + key[:20] + '.pkl')
+
+    def _store(self, result, path):
+        # an interrupted write leaves no file at path, so a later run never reads a partial pickle
+        temporary = path + '.tmp'
+        try:
+            pd.to_pickle(result, temporary)
+            os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def run(self, data, until=None):
+        '''
+        This function runs the pipeline on data, starting after the last stage that is already cached
+
+        Arguments:
+
+        - data: the input of the first stage, usually the raw object table
+        - until: optional stage name to stop after
+
+        Returns:
+
+        - the output of the last stage run. self.last_run lists every stage with whether it was
+        read from the cache or computed, and the seconds it took
+        '''
+        stages = self.stages
+        if until is not None:
+            names = [stage[0] for stage in stages]
+            stages = stages[:names.index(until) + 1]
+        keys = self.keys(data)[:len(stages)]
+
+        # find the furthest stage whose output is already on disk
+        start = 0
+        for i in range(len(stages) - 1, -1, -1):
+            if os.path.exists(self.cache_path(stages[i][0], keys[i])):
+                start = i + 1
+                break
+
+        self.last_run = []
+        result = data
+        if start > 0:
+            name = stages[start - 1][0]
+            tic = time.perf_counter()
+            result = pd.read_pickle(self.cache_path(name, keys[start - 1]))
+            self.last_run.append((name, 'cached', time.perf_counter() - tic))
+
+        for i in range(start, len(stages)):
+            name, func, params = stages[i]
+            tic = time.perf_counter()
+            result = func(result, **params)
+            self._store(result, self.cache_path(name, keys[i]))
+            self.last_run.append((name, 'computed', time.perf_counter() - tic))
+
+        return result
+
+def cleaning_pipeline(cache_dir, scope='global', sd=5, thresh=0.2, method='sd', normalize=None,
+                      columns_to_drop=(), corr_thresh=None, number_of_components=10):
+    '''
+    Returns the pipeline of the notebooks: cleaning, outlier removal, optionally plate normalization
+    ('zscore' or 'percent'), dropping the correlated features (a fixed list, and automatically above
+    corr_thresh when it is given) and PCA
+    '''
+    pipe = (Pipeline(cache_dir)
+            .add('clean', clean_stage, scope=scope)
+            .add('outliers', outlier_stage, sd=sd, thresh=thresh, method=method))
+    if normalize is not None:
+        pipe.add('normalize', normalize_stage, method=normalize)
+    pipe.add('drop_features', drop_features_stage, columns=list(columns_to_drop))
+    if corr_thresh is not None:
+        pipe.add('prune', prune_stage, threshold=corr_thresh)
+    return pipe.add('pca', pca_stage, number_of_components=number_of_components)
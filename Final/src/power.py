@@ -0,0 +1,113 @@
+'''
+Power analysis for the tests of stats.py. The power of a test only depends on the number of
+observations, the effect size and alpha, so it is computed once for every distinct value and
+remembered, and a whole array of nobs is answered with one vectorized call.
+
+scipy's noncentral t returns NaN when the noncentrality is large (e.g. nobs of about 500 to 750
+at an effect size of 0.5, where the power is 1 to many decimals), which TTestPower.solve_power
+passes on. The normal approximation is used for those values instead.
+'''
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from statsmodels.stats.power import FTestAnovaPower
+
+# The defaults the stats.py functions have always used
+EFFECT_SIZE = 0.5
+ALPHA = 0.05
+
+# The ANOVA effect size (Cohen's f) of a medium effect
+ANOVA_EFFECT_SIZE = 0.25
+
+# FUNCTIONS
+
+def _ttest_power(nobs, effect_size, alpha):
+    # the power of the two-sided one sample t-test, as TTestPower().power
+    nobs = np.asarray(nobs, dtype=np.float64)
+    dof = nobs - 1
+    nc = effect_size * np.sqrt(nobs)
+    crit = stats.t.isf(alpha / 2, dof)
+    with np.errstate(invalid='ignore'):
+        power = stats.nct.sf(crit, dof, nc) + stats.nct.cdf(-crit, dof, nc)
+        approx = stats.norm.sf(crit - nc) + stats.norm.cdf(-crit - nc)
+    return np.where(np.isnan(power) & (dof > 0), approx, power)
+
+@lru_cache(maxsize=None)
+def _ttest_power_cached(nobs, effect_size, alpha):
+    return float(_ttest_power(nobs, effect_size, alpha))
+
+@lru_cache(maxsize=None)
+def _anova_power_cached(nobs, k_groups, effect_size, alpha):
+    return float(FTestAnovaPower().power(effect_size, nobs, alpha, k_groups=k_groups))
+
+def ttest_power(nobs, effect_size=EFFECT_SIZE, alpha=ALPHA):
+    '''
+    This function returns the power of the t-test, the value of
+    TTestPower().solve_power(nobs=nobs, effect_size=effect_size, power=None, alpha=alpha)
+
+    Arguments:
+
+    - nobs: the number of observations, a number or an array
+    - effect_size: Cohen's d
+    - alpha: the significance level
+
+    Returns:
+
+    - the power, a float for a number of observations and an array for an array
+    '''
+    if np.ndim(nobs) == 0:
+        return _ttest_power_cached(float(nobs), float(effect_size), float(alpha))
+    # every distinct nobs is only computed once
+    unique, inverse = np.unique(np.asarray(nobs, dtype=np.float64), return_inverse=True)
+    return _ttest_power(unique, effect_size, alpha)[inverse.reshape(np.shape(nobs))]
+
+def anova_power(nobs, k_groups, effect_size=ANOVA_EFFECT_SIZE, alpha=ALPHA):
+    '''
+    This function returns the power of the one-way ANOVA F-test with FTestAnovaPower
+
+    Arguments:
+
+    - nobs: the total number of observations, a number or an array
+    - k_groups: the number of groups, a number or an array of the same shape as nobs
+    - effect_size: Cohen's f
+    - alpha: the significance level
+
+    Returns:
+
+    - the power, a float for a number of observations and an array for an array
+    '''
+    if np.ndim(nobs) == 0 and np.ndim(k_groups) == 0:
+        return _anova_power_cached(float(nobs), int(k_groups), float(effect_size), float(alpha))
+    nobs, k_groups = np.broadcast_arrays(np.asarray(nobs, dtype=np.float64), np.asarray(k_groups, dtype=np.float64))
+    pairs, inverse = np.unique(np.stack([nobs.ravel(), k_groups.ravel()], axis=1), axis=0, return_inverse=True)
+    # FTestAnovaPower broadcasts over nobs and k_groups, one call answers every distinct pair
+    power = np.asarray(FTestAnovaPower().power(effect_size, pairs[:, 0], alpha, k_groups=pairs[:, 1]))
+    return power[inverse.ravel()].reshape(nobs.shape)
+
+def power_table(nobs, effect_sizes, alpha=ALPHA, k_groups=None):
+    '''
+    This function tabulates the power over a range of numbers of observations and effect sizes
+
+    Arguments:
+
+    - nobs: list of numbers of observations
+    - effect_sizes: list of effect sizes, Cohen's d for the t-test or Cohen's f for the ANOVA
+    - alpha: the significance level
+    - k_groups: the number of groups of the ANOVA, None for the t-test
+
+    Returns:
+
+    - table: a Pandas DataFrame with one row per nobs and one column per effect size
+    '''
+    nobs = np.asarray(nobs, dtype=np.float64)
+    columns = {}
+    for effect_size in effect_sizes:
+        if k_groups is None:
+            columns[effect_size] = ttest_power(nobs, effect_size, alpha)
+        else:
+            columns[effect_size] = anova_power(nobs, np.full(nobs.shape, k_groups), effect_size, alpha)
+    table = pd.DataFrame(columns, index=pd.Index(nobs, name='nobs'))
+    table.columns.name = 'effect_size'
+    return table
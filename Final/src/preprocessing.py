@@ -6,17 +6,64 @@ import sys
 sys.path.append('../src/')
 warnings.filterwarnings('ignore')
 
+# Metadata columns that CellProfiler exports but that are empty for our experiments
+DROPPED_METADATA = ['Metadata_Date', 'Metadata_FileLocation', 'Metadata_Frame',
+                    'Metadata_Run', 'Metadata_Series']
+
+def is_dropped_column(column):
+    '''
+    Returns True for the columns that drop_columns removes, so that loaders can skip them while reading
+    '''
+    return 'FileName_' in column or 'PathName_' in column or column in DROPPED_METADATA
+
 def drop_columns(data):
     data.drop(list(data.filter(regex = 'FileName_')), axis=1, inplace=True) # Dropping all of the columns starting with 'FileName_'
     data.drop(list(data.filter(regex = 'PathName_')), axis=1, inplace=True) # Dropping all of the columns starting with 'PathName_'
-    data.drop(['Metadata_Date', 'Metadata_FileLocation', 'Metadata_Frame',
-              'Metadata_Run', 'Metadata_Series'], axis=1, inplace=True)
+    data.drop(DROPPED_METADATA, axis=1, inplace=True)
     
-def replace_NA(data):
-    measurements = data.iloc[:,6:].columns # since we know which columns we're dropping, should this subset be fixed?
-    for measure in measurements:
-        if data[measure].isna().any():
-            data[measure].fillna(data[measure].mean(), inplace=True)
+# The groups whose own means are used to fill missing values, so imputation does not leak across plates
+IMPUTATION_SCOPES = {
+    'global': [],
+    'plate': ['Metadata_Plate'],
+    'plate_well': ['Metadata_Plate', 'Metadata_Well'],
+    'treatment': ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose'],
+}
+
+def replace_NA(data, scope='global'):
+    '''
+    This function fills the missing measurements in place with the mean of their column, taken over
+    the whole table or within groups. Values of a feature that is missing for a whole group are
+    filled with the overall mean.
+
+    Arguments:
+
+    - data: the Pandas DataFrame after drop_columns, features start at column 6
+    - scope: 'global', 'plate', 'plate_well' or 'treatment', see IMPUTATION_SCOPES
+
+    Returns:
+
+    - report: a Pandas DataFrame with the number of imputed values per group (rows) for every
+    column that had missing values
+    '''
+    if scope not in IMPUTATION_SCOPES:
+        raise ValueError("scope must be one of " + ", ".join(IMPUTATION_SCOPES))
+
+    measurements = data.columns[6:] # since we know which columns we're dropping, should this subset be fixed?
+    values = data[measurements]
+    missing = values.isna()
+    group_cols = IMPUTATION_SCOPES[scope]
+
+    if group_cols:
+        keys = [data[col] for col in group_cols]
+        fill = values.groupby(keys, observed=True, dropna=False).transform('mean').fillna(values.mean())
+        report = missing.groupby(keys, observed=True, dropna=False).sum()
+    else:
+        fill = values.mean()
+        report = missing.sum().to_frame(scope).T
+
+    data[measurements] = values.fillna(fill)
+
+    return report.loc[:, report.any()]
             
 # Decide with team whether we have a consistent threshold/SD or leave it to user
             
@@ -30,56 +77,166 @@ def replace_outliers_with_sd(df, feature, c, d, w, n):
     bool_col = (sub_df < (m - n * sd)) | (sub_df > (m + n * sd))
     return bool_col
 
-def outlier_detection(df, sd, thresh):
-    df_copy = df.copy()
-    features = df_copy.columns[6:]
+# Objects are compared with the other objects of the same treatment in the same well
+OUTLIER_GROUPS = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
 
-    threshold = round(thresh * len(features))
+def sd_outlier_mask(values, means, sds, n):
+    '''
+    Returns the objects x features boolean matrix of the values that are more than n standard
+    deviations away from their group mean. NaN comparisons are False, like in replace_outliers_with_sd
+    '''
+    return (values < means - n * sds) | (values > means + n * sds)
 
-    # Preferable to groupby as this maintains the unique combination of cytokine, dose, and well in the same 
-    # order as they appear in the original dataframe
-    unique_pairs = df_copy[['Metadata_Metadata_Cytokine', 
-                           'Metadata_Metadata_Dose', 
-                           'Metadata_Well']].drop_duplicates().reset_index(drop=True)
-    
-    # This final outlier dataset will contain the outliers for all cytokines and their respective doses and wells
-    all_outliers = pd.DataFrame()
-    
-    # loop through each specific cytokine, dose, and well combination in the specific order that they're in 
-    # the original dataframe
-    for i, row in unique_pairs.iterrows():
-        
-        # This outlier dataset will be used to find outliers for each specific cytokine, dose treatment, and well
-        # for all features. 
-        outlier_cols = pd.DataFrame()
-
-        cytokine = row[0]
-        dose = row[1]
-        well = row[2]
-
-        # again, this is calculating the outliers for each specific cytokine, dose, and well in
-        # the same order they appear in the original dataframe. 
-        for feature in features:
-            test = replace_outliers_with_sd(df_copy, feature, cytokine, dose, well, sd)
-            col_name = feature + '_outliers'
-            outlier_cols.loc[:, col_name] = test
-
-        all_outliers = pd.concat([all_outliers, outlier_cols])
-
-    # get the sum value where an image is an outlier for each feature (i.e True from the above function)  
-    cols = all_outliers.columns
-    df['Outlier_Count'] = (all_outliers[cols] == True).sum(1)
+# Scale factors that make the MAD and the mean absolute deviation consistent with the SD for normal data
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+def group_statistics(df, features, method='sd', group_cols=OUTLIER_GROUPS):
+    '''
+    This function computes the center and scale of every feature within every group, once per group
+    instead of once per object
+
+    Arguments:
+
+    - df: the Pandas DataFrame of the objects
+    - features: the features to summarize
+    - method: 'sd' for the mean and SD (ddof=0 to match np.std in replace_outliers_with_sd), 'mad'
+    for the median and scaled MAD. Where more than half of a group shares one value the MAD is 0,
+    and the scaled mean absolute deviation around the median is used instead.
+    - group_cols: the columns that define the groups
+
+    Returns:
+
+    - codes: the group number of every object, in the order of df
+    - centers: array (groups x features) of the means or medians
+    - scales: array (groups x features) of the SDs or scaled MADs
+    '''
+    if method not in ('sd', 'mad'):
+        raise ValueError("method must be 'sd' or 'mad'")
+    values = df[features]
+    codes = values.groupby([df[col] for col in group_cols], sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    grouped = values.groupby(codes, sort=True)
+    if method == 'sd':
+        return codes, grouped.mean().to_numpy(dtype=np.float64), grouped.std(ddof=0).to_numpy(dtype=np.float64)
+
+    centers = grouped.median().to_numpy(dtype=np.float64)
+    grouped_deviations = pd.DataFrame(np.abs(values.to_numpy(dtype=np.float64) - centers[codes])).groupby(codes, sort=True)
+    mads = MAD_SCALE * grouped_deviations.median().to_numpy(dtype=np.float64)
+    mean_ads = MEAN_AD_SCALE * grouped_deviations.mean().to_numpy(dtype=np.float64)
+    return codes, centers, np.where(mads > 0, mads, mean_ads)
+
+def _group_outlier_mask(values, codes, centers, scales, n, method):
+    # the outlier matrix of the objects in values, given their group codes and the group statistics
+    if method == 'sd':
+        return sd_outlier_mask(values, centers[codes], scales[codes], n)
+    return np.abs(values - centers[codes]) > n * scales[codes]
+
+def robust_outlier_mask(df, features, n, group_cols=OUTLIER_GROUPS):
+    '''
+    Returns the objects x features boolean matrix of the values that are more than n scaled MADs
+    away from their group median, see group_statistics. Unlike the SD the median and MAD are not
+    pulled by the outliers themselves.
+    '''
+    codes, centers, scales = group_statistics(df, features, 'mad', group_cols)
+    return _group_outlier_mask(df[features].to_numpy(dtype=np.float64), codes, centers, scales, n, 'mad')
+
+def outlier_mask(df, features, n, method='sd'):
+    '''
+    Returns the objects x features boolean outlier matrix of df for the given method,
+    'sd' for mean +/- n SD and 'mad' for median +/- n scaled MAD within each OUTLIER_GROUPS group
+    '''
+    codes, centers, scales = group_statistics(df, features, method)
+    return _group_outlier_mask(df[features].to_numpy(dtype=np.float64), codes, centers, scales, n, method)
+
+def outlier_flags(df, n, method='sd', block_size=100000):
+    '''
+    This function stores which features flag each object as a bit-packed NumPy array, one bit per
+    feature, which takes an eighth of the memory of a boolean matrix and far less than a DataFrame
+    of _outliers columns. The group statistics are computed once and the objects are flagged and
+    packed block_size rows at a time, so no full objects x features matrix is built.
+
+    Arguments:
+
+    - df: the Pandas DataFrame after drop_columns and replace_NA, features start at column 6
+    - n: the number of SDs or scaled MADs used as the cut-off
+    - method: 'sd' or 'mad', see group_statistics
+    - block_size: the number of objects flagged at once
+
+    Returns:
+
+    - flags: a uint8 array with one row per object (in the order of df) and ceil(features / 8) columns
+    - features: the feature names, in bit order
+    '''
+    features = df.columns[6:]
+    codes, centers, scales = group_statistics(df, features, method)
+
+    flags = np.empty((len(df), (len(features) + 7) // 8), dtype=np.uint8)
+    for start in range(0, len(df), block_size):
+        values = df.iloc[start:start + block_size, 6:].to_numpy(dtype=np.float64)
+        mask = _group_outlier_mask(values, codes[start:start + block_size], centers, scales, n, method)
+        flags[start:start + block_size] = np.packbits(mask, axis=1)
+    return flags, list(features)
+
+def flagged_features(flags, features, position):
+    '''
+    Returns the names of the features that flagged the object at the given row position of the flags
+    '''
+    bits = np.unpackbits(flags[position], count=len(features)).astype(bool)
+    return [feature for feature, bit in zip(features, bits) if bit]
+
+# The number of set bits of every byte value
+BIT_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+def flag_counts(flags):
+    '''
+    Returns the number of features each object is an outlier in, straight from the packed flags
+    '''
+    return BIT_COUNTS[flags].sum(axis=1, dtype=np.int64)
+
+def split_outliers(df, mask, thresh):
+    '''
+    Splits df into the objects that are outliers in at least thresh of the features and the rest,
+    given the objects x features outlier matrix
+    '''
+    return split_by_count(df, mask.sum(axis=1), mask.shape[1], thresh)
+
+def split_by_count(df, outlier_count, n_features, thresh):
+    '''
+    Splits df into the objects that are outliers in at least thresh of the n_features features and
+    the rest, given the number of features every object is an outlier in
+    '''
+    threshold = round(thresh * n_features)
 
     # Get the images that have outliers that exceed our threshold and those that don't
-    outliers = df[df['Outlier_Count'] >= threshold]
-    sub_data = df[df['Outlier_Count'] < threshold]
-    
-    # Drop the outlier count columns in both datasets
-    outliers.drop(['Outlier_Count'], axis=1, inplace=True)
-    sub_data.drop(['Outlier_Count'], axis=1, inplace=True)
-    
-    # I'm only returning the outliers for the team to show our sponsors which images are outliers. 
-    # We can remove this part of the function in our final product. 
+    outliers = df[outlier_count >= threshold]
+    sub_data = df[outlier_count < threshold]
     return outliers, sub_data
 
+def outlier_detection(df, sd, thresh, method='sd'):
+    '''
+    This function flags the objects that are outliers in too many features. For each
+    cytokine, dose and well combination an object is an outlier in a feature when it
+    lies more than sd standard deviations away from the group mean, or more than sd
+    scaled MADs away from the group median with method='mad'.
+
+    Arguments:
+
+    - df: the Pandas DataFrame after drop_columns and replace_NA, features start at column 6,
+    or an out_of_core.PlateDataset
+    - sd: the number of standard deviations (or scaled MADs) used as the cut-off
+    - thresh: the fraction of features an object must be an outlier in to be dropped
+    - method: 'sd' for mean +/- sd SD, 'mad' for the robust median +/- sd scaled MAD
+
+    Returns:
+
+    - outliers: the objects that are outliers in at least thresh of the features
+    - sub_data: the remaining objects
+    '''
+    # disk-backed datasets (out_of_core.PlateDataset) merge the group statistics across plates
+    if not isinstance(df, pd.DataFrame):
+        return df.outlier_detection(sd, thresh, method=method)
+
+    # the packed flags are built block by block, so the full boolean matrix is never held
+    flags, features = outlier_flags(df, sd, method)
 
+    return split_by_count(df, flag_counts(flags), len(features), thresh)
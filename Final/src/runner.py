@@ -0,0 +1,152 @@
+'''
+Batch cleaning of whole experiments. Every compartment table of every experiment goes through
+drop_columns -> replace_NA -> outlier_detection in a process pool and is written to the Parquet cache.
+
+    python runner.py /data/PAM194_Keratino_CytoPanel_1 /data/PAM195_Fibro_CytoPanel_1 --workers 8
+'''
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+try:
+    from .preprocessing import drop_columns, replace_NA, outlier_detection
+    from .cache import write_cache
+    from .aggregates import write_aggregates
+except ImportError:
+    from preprocessing import drop_columns, replace_NA, outlier_detection
+    from cache import write_cache
+    from aggregates import write_aggregates
+
+# The object tables CellProfiler exports for every experiment, e.g. pam194ObjCell.csv
+COMPARTMENTS = ['ObjCell', 'ObjPerinuclear', 'ObjAllCyto', 'ObjPerinucCyto']
+
+# FUNCTIONS
+
+def find_compartment_files(experiment_dir):
+    '''
+    Returns a list of (compartment, path) pairs for the compartment csv files in experiment_dir
+    '''
+    found = []
+    for name in sorted(os.listdir(experiment_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() != '.csv':
+            continue
+        for compartment in COMPARTMENTS:
+            if stem.lower().endswith(compartment.lower()):
+                found.append((compartment, os.path.join(experiment_dir, name)))
+    return found
+
+def clean_file(file_path, output_dir, sd=5, thresh=0.2, scope='global', method='sd'):
+    '''
+    This function runs the cleaning steps of the data cleaning notebook on one compartment file
+    and writes the cleaned objects, the outliers and the aggregate tables to the Parquet cache
+
+    Arguments:
+
+    - file_path: path to the exported csv
+    - output_dir: the folder for the cleaned tables
+    - sd, thresh, method: passed to outlier_detection
+    - scope: passed to replace_NA
+
+    Returns:
+
+    - a dictionary with the row counts, the output path and the time spent in every step
+    '''
+    timings = {}
+    start = time.perf_counter()
+
+    data = pd.read_csv(file_path, sep=',')
+    timings['read_s'] = time.perf_counter() - start
+
+    step = time.perf_counter()
+    drop_columns(data)
+    replace_NA(data, scope=scope)
+    timings['clean_s'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    outliers, clean_data = outlier_detection(data, sd, thresh, method=method)
+    timings['outliers_s'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    output_path = os.path.join(output_dir, stem + '_clean.parquet')
+    write_cache(clean_data, output_path)
+    write_cache(outliers, os.path.join(output_dir, stem + '_outliers.parquet'))
+    timings['write_s'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    write_aggregates(clean_data, output_path)
+    timings['aggregate_s'] = time.perf_counter() - step
+
+    timings['total_s'] = time.perf_counter() - start
+    return dict(rows=len(data), outliers=len(outliers), output=output_path, **timings)
+
+def clean_experiments(experiment_dirs, output_dir=None, workers=None, sd=5, thresh=0.2, scope='global',
+                      method='sd'):
+    '''
+    This function cleans every compartment file of one or more experiments concurrently. All files
+    share one process pool so that a full reprocess keeps every worker busy.
+
+    Arguments:
+
+    - experiment_dirs: an experiment folder or a list of them
+    - output_dir: where the cleaned tables go, a 'cleaned' folder inside each experiment by default
+    - workers: the number of processes, all cores by default
+    - sd, thresh, method: passed to outlier_detection
+    - scope: passed to replace_NA
+
+    Returns:
+
+    - summary: a Pandas DataFrame with one row per file with its row counts and timings. A file
+    that fails does not stop the others, its row has the exception in the 'error' column instead.
+    The rows are also written as timings.csv in every output folder: one per experiment by default,
+    a single one covering all the experiments when they share output_dir
+    '''
+    if isinstance(experiment_dirs, str):
+        experiment_dirs = [experiment_dirs]
+
+    jobs = []
+    for experiment_dir in experiment_dirs:
+        out = output_dir if output_dir is not None else os.path.join(experiment_dir, 'cleaned')
+        os.makedirs(out, exist_ok=True)
+        for compartment, file_path in find_compartment_files(experiment_dir):
+            jobs.append({'experiment': os.path.basename(os.path.normpath(experiment_dir)),
+                         'compartment': compartment, 'file': file_path, 'output_dir': out})
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(clean_file, job['file'], job['output_dir'], sd, thresh, scope, method): job
+                   for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                rows.append(dict(job, **future.result()))
+            except Exception as error:
+                rows.append(dict(job, error=type(error).__name__ + ': ' + str(error)))
+
+    summary = pd.DataFrame(rows, columns=['experiment', 'compartment', 'file', 'output_dir', 'rows', 'outliers',
+                                          'output', 'read_s', 'clean_s', 'outliers_s', 'write_s', 'aggregate_s',
+                                          'total_s', 'error'])
+    summary = summary.sort_values(['experiment', 'compartment']).reset_index(drop=True)
+    for out, timings in summary.groupby('output_dir'):
+        timings.drop(columns='output_dir').to_csv(os.path.join(out, 'timings.csv'), index=False)
+
+    return summary.drop(columns='output_dir')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean every compartment file of the given experiments in parallel')
+    parser.add_argument('experiment_dirs', nargs='+')
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--sd', type=float, default=5)
+    parser.add_argument('--thresh', type=float, default=0.2)
+    parser.add_argument('--scope', default='global')
+    parser.add_argument('--method', default='sd')
+    args = parser.parse_args()
+
+    summary = clean_experiments(args.experiment_dirs, output_dir=args.output_dir, workers=args.workers,
+                                sd=args.sd, thresh=args.thresh, scope=args.scope, method=args.method)
+    print(summary.to_string())
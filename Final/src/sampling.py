@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Every treatment in every well is represented in the samples
+SAMPLE_GROUPS = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
+
+# The random priority of every sampled object, kept in reservoirs so that previews can be nested
+SAMPLE_KEY = 'Sample_Key'
+
+# FUNCTIONS
+
+def _chunks(source, chunksize):
+    if isinstance(source, pd.DataFrame):
+        return [source]
+    if isinstance(source, str):
+        return pd.read_csv(source, chunksize=chunksize)
+    if hasattr(source, 'iter_partitions'):
+        # out_of_core.PlateDataset
+        return (part for plate, part in source.iter_partitions())
+    return source
+
+def reservoir_sample(source, size, seed=0, group_cols=SAMPLE_GROUPS, chunksize=100000):
+    '''
+    This function keeps a fixed-size uniform sample of every (cytokine, dose, well) group in a
+    single pass over the data. Every object gets a random priority from one seeded generator and
+    each group's reservoir holds the size objects with the smallest priorities, so the result does
+    not depend on how the data is chunked and is the same for the same seed.
+
+    Arguments:
+
+    - source: a Pandas DataFrame, the path of a cleaned csv, an iterable of DataFrame chunks or an
+    out_of_core.PlateDataset
+    - size: the number of objects kept per group, smaller groups are kept whole
+    - seed: the seed of the random priorities
+    - group_cols: the columns that define a group
+    - chunksize: the number of rows read at once from a csv
+
+    Returns:
+
+    - reservoir: a Pandas DataFrame of the sampled objects with their priority in the Sample_Key
+    column, which preview_sample uses
+    '''
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    for chunk in _chunks(source, chunksize):
+        chunk = chunk.assign(**{SAMPLE_KEY: rng.random(len(chunk))})
+        pool = chunk if reservoir is None else pd.concat([reservoir, chunk])
+        rank = pool.groupby(group_cols, observed=True, dropna=False, sort=False)[SAMPLE_KEY].rank(method='first')
+        reservoir = pool[rank <= size]
+    return reservoir
+
+def preview_sample(data, budget, min_per_group=1, seed=0, group_cols=SAMPLE_GROUPS):
+    '''
+    This function draws a "fast preview" of at most budget objects for the plots and quick-look
+    statistics. Every group gets min_per_group objects (or all of them if it is smaller) and the rest
+    of the budget is shared in proportion to the group sizes.
+
+    Arguments:
+
+    - data: a Pandas DataFrame, either the full table or a reservoir from reservoir_sample, in which
+    case the previews of increasing budgets are nested
+    - budget: the largest number of objects returned
+    - min_per_group: the number of objects every group is guaranteed
+    - seed: the seed of the random priorities, only used when data has no Sample_Key column
+    - group_cols: the columns that define a group
+
+    Returns:
+
+    - Pandas DataFrame with the sampled objects, without the Sample_Key column
+    '''
+    if SAMPLE_KEY in data.columns:
+        keys = data[SAMPLE_KEY].to_numpy()
+    else:
+        keys = np.random.default_rng(seed).random(len(data))
+
+    group_ids = data.groupby(group_cols, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+    sizes = np.bincount(group_ids)
+    if budget < len(sizes) * min_per_group:
+        raise ValueError('a budget of ' + str(budget) + ' cannot give ' + str(min_per_group) +
+                         ' objects to each of the ' + str(len(sizes)) + ' groups')
+
+    # guaranteed part first, then the rest of the budget in proportion to what is left in every group
+    quota = np.minimum(sizes, min_per_group)
+    spare = sizes - quota
+    remaining = min(budget - quota.sum(), spare.sum())
+    if remaining > 0:
+        quota += np.minimum(spare, np.floor(remaining * spare / spare.sum()).astype(int))
+
+    rank = pd.Series(keys).groupby(group_ids).rank(method='first').to_numpy()
+    sample = data[rank <= quota[group_ids]]
+    return sample.drop(columns=SAMPLE_KEY, errors='ignore')
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# The identifying columns that come before the measurements after drop_columns
+METADATA_COLUMNS = ['ImageNumber', 'ObjectNumber', 'Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose',
+                    'Metadata_Plate', 'Metadata_Well']
+
+# The string metadata that every groupby in src keys on
+CATEGORICAL_COLUMNS = ['Metadata_Metadata_Cytokine', 'Metadata_Plate', 'Metadata_Well']
+
+# The feature families that are split on their second token, e.g. Texture_Contrast, RadialDistribution_MeanFrac
+TWO_LEVEL_GROUPS = ['Texture', 'RadialDistribution']
+
+# FUNCTIONS
+
+def feature_group(column):
+    '''
+    Returns the feature group a measurement belongs to, e.g. 'Granularity' for Granularity_1_CorrActin
+    and 'Texture_Contrast' for Texture_Contrast_CorrActin_3_00_256
+    '''
+    parts = column.split('_')
+    if parts[0] in TWO_LEVEL_GROUPS and len(parts) > 1:
+        return parts[0] + '_' + parts[1]
+    return parts[0]
+
+def feature_groups(columns):
+    '''
+    This function builds the feature group manifest for a list of measurement columns
+
+    Arguments:
+
+    - columns: the measurement column names
+
+    Returns:
+
+    - a dictionary with the group names as keys and the list of their columns as values,
+    in the order the columns appear
+    '''
+    groups = {}
+    for col in columns:
+        groups.setdefault(feature_group(col), []).append(col)
+    return groups
+
+def feature_columns(df):
+    '''
+    Returns the measurement columns of df, i.e. every numeric column that is not metadata
+    '''
+    return [col for col in df.columns
+            if col not in METADATA_COLUMNS and pd.api.types.is_numeric_dtype(df[col])]
+
+def float32_safe_columns(df, columns, rtol=1e-3):
+    '''
+    This function checks which float64 columns can be stored as float32 without losing precision
+    that matters for the analysis. A column passes when the largest rounding error is below rtol
+    times its standard deviation, so columns with a large offset and a small spread stay float64.
+
+    Arguments:
+
+    - df: the Pandas DataFrame
+    - columns: the columns to check
+    - rtol: the largest rounding error allowed, as a fraction of the column's standard deviation
+
+    Returns:
+
+    - list of the columns that are safe to downcast
+    '''
+    safe = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        with np.errstate(over='ignore'):
+            rounded = values.astype(np.float32).astype(np.float64)
+        error = np.nanmax(np.abs(rounded - values), initial=0)
+        spread = np.nanstd(values) if np.isfinite(values).any() else 0
+        # constant columns only need to be represented exactly
+        if (np.isfinite(error) and error <= rtol * spread) or error == 0:
+            safe.append(col)
+    return safe
+
+def compact_dtypes(df, rtol=1e-3, categorical_columns=CATEGORICAL_COLUMNS):
+    '''
+    This function normalizes an object-level frame to a compact schema: the cytokine, plate and well
+    metadata become categoricals, the integer identifiers are downcast, and the measurements are
+    stored as float32 wherever float32_safe_columns allows it. This roughly halves the memory of the
+    frame and lets groupby work on the integer category codes. Every function in src accepts the
+    compact form.
+
+    Arguments:
+
+    - df: the Pandas DataFrame after drop_columns
+    - rtol: precision tolerance passed to float32_safe_columns
+    - categorical_columns: the metadata columns to turn into categoricals
+
+    Returns:
+
+    - a new Pandas DataFrame with the compact dtypes. Columns that fail the precision check keep float64
+    '''
+    compact = df.copy()
+
+    for col in categorical_columns:
+        if col in compact.columns:
+            compact[col] = compact[col].astype('category')
+
+    for col in ['ImageNumber', 'ObjectNumber', 'Metadata_Metadata_Dose']:
+        if col in compact.columns and pd.api.types.is_integer_dtype(compact[col]):
+            compact[col] = pd.to_numeric(compact[col], downcast='integer')
+
+    float_cols = [col for col in feature_columns(compact) if compact[col].dtype == np.float64]
+    for col in float32_safe_columns(compact, float_cols, rtol=rtol):
+        compact[col] = compact[col].astype(np.float32)
+
+    return compact
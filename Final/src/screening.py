@@ -0,0 +1,141 @@
+'''
+Screening of the full treatment grid. The dose ANOVA of every cytokine and the cytokine ANOVA of
+every dose are run for every feature in a process pool, the P-values are corrected for the whole
+grid with Benjamini-Hochberg and the results are ranked into a hit list.
+'''
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from statsmodels.stats.multitest import multipletests
+
+try:
+    from .stats import run_ANOVA_doses_batch, run_ANOVA_cytokines_batch
+except ImportError:
+    from stats import run_ANOVA_doses_batch, run_ANOVA_cytokines_batch
+
+# The untreated controls, they are left out of the cytokine comparisons as in run_ANOVA_cytokines
+UNTREATED = ['untr', 'untr-50']
+
+# The columns of the screening results
+SCREEN_COLUMNS = ['Comparison', 'Cytokine', 'Dose', 'Feature', 'F-stat', 'P-value', 'Q-value', 'Hit', 'N',
+                  'Groups', 'Power']
+
+# FUNCTIONS
+
+def screening_tasks(df, features, chunk_size=50):
+    '''
+    This function lists the tests of the screen, every cytokine with more than one dose is tested
+    across doses and every dose with more than one treated cytokine is tested across cytokines.
+    The features are split into chunks so that the work spreads over all the workers.
+
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features to screen
+    - chunk_size: the number of features per task
+
+    Returns:
+
+    - tasks: a list of (comparison, value, features) tuples, comparison is 'doses' or 'cytokines'
+    '''
+    treatments = df[['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']].drop_duplicates()
+    treatments = treatments.astype({'Metadata_Metadata_Cytokine': str})
+    doses_per_cytokine = treatments.groupby('Metadata_Metadata_Cytokine')['Metadata_Metadata_Dose'].nunique()
+    treated = treatments[~treatments['Metadata_Metadata_Cytokine'].isin(UNTREATED)]
+    cytokines_per_dose = treated.groupby('Metadata_Metadata_Dose')['Metadata_Metadata_Cytokine'].nunique()
+
+    chunks = [features[i:i + chunk_size] for i in range(0, len(features), chunk_size)]
+    tasks = []
+    for cytokine in doses_per_cytokine.index[doses_per_cytokine > 1]:
+        tasks.extend(('doses', cytokine, chunk) for chunk in chunks)
+    for dose in cytokines_per_dose.index[cytokines_per_dose > 1]:
+        tasks.extend(('cytokines', dose, chunk) for chunk in chunks)
+    return tasks
+
+_worker_data = None
+
+def _attach(df):
+    global _worker_data
+    _worker_data = df
+
+def _run_task(comparison, value, features):
+    if comparison == 'doses':
+        final_df, power = run_ANOVA_doses_batch(value, _worker_data, features)
+        final_df['Dose'] = None
+    else:
+        final_df, power = run_ANOVA_cytokines_batch(_worker_data, value, features)
+        final_df['Dose'] = value
+        final_df['Cytokine'] = None
+    final_df['Comparison'] = comparison
+    final_df['Power'] = power
+    return final_df
+
+def screen(df, features=None, workers=None, alpha=0.05, chunk_size=50, progress=None):
+    '''
+    This function runs the dose and cytokine ANOVA tests over every cytokine, dose and feature
+    and applies the Benjamini-Hochberg correction across the whole grid
+
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features to screen, every column from the 7th onwards by default
+    - workers: the number of processes, all cores by default, 1 runs in this process
+    - alpha: the false discovery rate of the hits
+    - chunk_size: the number of features per task
+    - progress: optional function called as progress(done, total) every time a task finishes
+
+    Returns:
+
+    - results: a Pandas DataFrame with the columns of SCREEN_COLUMNS, one row per test, ranked by
+    Q-value and then F-stat. The hit list is results[results['Hit']]
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    tasks = screening_tasks(df, features, chunk_size)
+    # the workers only receive the columns the tests use, once each
+    data = df[['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose'] + features]
+
+    frames = []
+    if workers == 1:
+        _attach(data)
+        for done, task in enumerate(tasks, start=1):
+            frames.append(_run_task(*task))
+            if progress is not None:
+                progress(done, len(tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(data,)) as pool:
+            futures = [pool.submit(_run_task, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), start=1):
+                frames.append(future.result())
+                if progress is not None:
+                    progress(done, len(tasks))
+
+    if not frames:
+        return pd.DataFrame(columns=SCREEN_COLUMNS)
+    results = pd.concat(frames, ignore_index=True)
+
+    # tests without a P-value (e.g. constant features) are left out of the correction
+    results['Q-value'] = np.nan
+    tested = results['P-value'].notna()
+    if tested.any():
+        results.loc[tested, 'Q-value'] = multipletests(results.loc[tested, 'P-value'], alpha=alpha,
+                                                       method='fdr_bh')[1]
+    results['Hit'] = results['Q-value'] <= alpha
+
+    results = results.sort_values(['Q-value', 'F-stat'], ascending=[True, False], na_position='last')
+    return results[SCREEN_COLUMNS].reset_index(drop=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Screen every cytokine, dose and feature of a cleaned table')
+    parser.add_argument('input', help='cleaned table, .csv or .parquet')
+    parser.add_argument('output', help='where the ranked results are written as .csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--alpha', type=float, default=0.05)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.input) if args.input.endswith('.parquet') else pd.read_csv(args.input)
+    results = screen(df, workers=args.workers, alpha=args.alpha,
+                     progress=lambda done, total: print(str(done) + '/' + str(total), end='\r'))
+    results.to_csv(args.output, index=False)
+    print(str(int(results['Hit'].sum())) + ' hits out of ' + str(len(results)) + ' tests')
@@ -0,0 +1,189 @@
+'''
+A feature matrix that several processes can share without copying it. The measurements are written
+once as column-major .npy files that every worker memory-maps read-only, one float32 block for the
+features that schema.float32_safe_columns allows to downcast and one float64 block for the rest, and
+the metadata is kept as integer codes with the category labels in a json sidecar. An N-worker job
+then costs about the memory of one copy of the data, as the operating system shares the mapped pages
+between processes.
+'''
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .schema import METADATA_COLUMNS, CATEGORICAL_COLUMNS, feature_columns, float32_safe_columns
+except ImportError:
+    from schema import METADATA_COLUMNS, CATEGORICAL_COLUMNS, feature_columns, float32_safe_columns
+
+# The dtypes of the feature blocks of a store
+BLOCK_DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+# FUNCTIONS
+
+def write_feature_store(df, directory, features=None, downcast=True, rtol=1e-3):
+    '''
+    This function writes the measurement block of df as memory-mappable arrays and its metadata
+    as integer codes
+
+    Arguments:
+
+    - df: the cleaned Pandas DataFrame
+    - directory: the folder of the store, created if needed
+    - features: the measurement columns to store, every numeric non-metadata column by default
+    - downcast: store the features that pass schema.float32_safe_columns as float32
+    - rtol: precision tolerance passed to float32_safe_columns
+
+    Returns:
+
+    - the attached FeatureStore
+    '''
+    os.makedirs(directory, exist_ok=True)
+    features = feature_columns(df) if features is None else list(features)
+    safe = set(float32_safe_columns(df, features, rtol=rtol)) if downcast else set()
+    blocks = {'float32': [feature for feature in features if feature in safe],
+              'float64': [feature for feature in features if feature not in safe]}
+
+    for name, columns in blocks.items():
+        if not columns:
+            continue
+        # column-major so that every feature is one contiguous run of the file
+        values = np.lib.format.open_memmap(os.path.join(directory, 'features_' + name + '.npy'), mode='w+',
+                                           dtype=BLOCK_DTYPES[name], shape=(len(df), len(columns)), fortran_order=True)
+        for j, feature in enumerate(columns):
+            values[:, j] = df[feature].to_numpy(dtype=BLOCK_DTYPES[name])
+        values.flush()
+        del values
+
+    # the string metadata is stored as codes, the numeric identifiers and the dose as they are
+    categories, numeric = {}, []
+    for col in METADATA_COLUMNS:
+        if col in CATEGORICAL_COLUMNS and col in df.columns:
+            codes, labels = pd.factorize(df[col], sort=True)
+            np.save(os.path.join(directory, 'codes_' + col + '.npy'), codes.astype(np.int32))
+            categories[col] = np.asarray(labels).tolist()
+        elif col in df.columns:
+            np.save(os.path.join(directory, 'meta_' + col + '.npy'), df[col].to_numpy())
+            numeric.append(col)
+
+    with open(os.path.join(directory, 'store.json'), 'w') as f:
+        json.dump({'features': features, 'blocks': blocks, 'categories': categories, 'numeric': numeric,
+                   'rows': len(df)}, f, indent=1)
+
+    return FeatureStore(directory)
+
+class FeatureStore:
+    '''
+    Read-only view of a store written by write_feature_store. Attaching only maps the files, no data
+    is read until it is used.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'store.json')) as f:
+            meta = json.load(f)
+        self.features = meta['features']
+        self.categories = meta['categories']
+        self.rows = meta['rows']
+        self.blocks = {name: np.load(os.path.join(directory, 'features_' + name + '.npy'), mmap_mode='r')
+                       for name, columns in meta['blocks'].items() if columns}
+        self.codes = {col: np.load(os.path.join(directory, 'codes_' + col + '.npy'), mmap_mode='r')
+                      for col in self.categories}
+        self.numeric = {col: np.load(os.path.join(directory, 'meta_' + col + '.npy'), mmap_mode='r')
+                        for col in meta['numeric']}
+        # the block and the column within the block of every feature
+        self._positions = {feature: (name, j) for name, columns in meta['blocks'].items()
+                           for j, feature in enumerate(columns)}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, feature):
+        '''
+        Returns the values of one feature as a zero-copy view of the mapped file
+        '''
+        name, j = self._positions[feature]
+        return self.blocks[name][:, j]
+
+    def metadata_frame(self):
+        '''
+        Returns the metadata columns in their usual order, the cytokine, plate and well as
+        categoricals built from the stored codes
+        '''
+        columns = {}
+        for col in METADATA_COLUMNS:
+            if col in self.categories:
+                columns[col] = pd.Categorical.from_codes(self.codes[col], categories=self.categories[col])
+            elif col in self.numeric:
+                columns[col] = self.numeric[col]
+        return pd.DataFrame(columns)
+
+    def frame(self, features=None):
+        '''
+        Returns the metadata plus the given features as a DataFrame in the layout the src functions
+        expect. The features are zero-copy views of the mapped files: consecutive features of a block
+        are wrapped as one slice, and copy-on-write keeps pandas from copying them until they are
+        modified. Only the metadata is built in memory.
+        '''
+        features = self.features if features is None else list(features)
+        frames = [self.metadata_frame()]
+        run = []
+        for feature in features:
+            name, j = self._positions[feature]
+            if run and (name != run[0][1] or j != run[-1][2] + 1):
+                frames.append(self._run_frame(run))
+                run = []
+            run.append((feature, name, j))
+        if run:
+            frames.append(self._run_frame(run))
+        return pd.concat(frames, axis=1)
+
+    def _run_frame(self, run):
+        # a DataFrame over consecutive columns of one block, a view of the mapped file
+        _, name, start = run[0]
+        return pd.DataFrame(self.blocks[name][:, start:start + len(run)], columns=[feature for feature, _, _ in run],
+                            copy=False)
+
+# PARALLEL JOBS
+
+_worker_store = None
+
+def _attach(directory):
+    global _worker_store
+    _worker_store = FeatureStore(directory)
+
+def _run(func, feature, kwargs):
+    return func(_worker_store, feature, **kwargs)
+
+def map_features(func, directory, features=None, workers=None, **kwargs):
+    '''
+    This function runs func(store, feature, **kwargs) for every feature in a process pool. Each
+    worker attaches to the store once, so only the path is sent to the workers and the data is
+    shared through the mapped file rather than pickled.
+
+    Arguments:
+
+    - func: a module-level function taking the FeatureStore and a feature name
+    - directory: the folder written by write_feature_store
+    - features: the features to run, all by default. Any hashable task keys can be given instead,
+    e.g. the feature groups of dimensionality_reduction.prune_correlated_features
+    - workers: the number of processes, all cores by default
+
+    Returns:
+
+    - a dictionary of the results by feature
+
+    Example, one ANOVA per feature:
+
+        def dose_anova(store, feature, cytokine):
+            return run_ANOVA_doses(cytokine, feature, store.frame([feature]))
+
+        results = map_features(dose_anova, 'store/', cytokine='IL26')
+    '''
+    if features is None:
+        features = FeatureStore(directory).features
+    with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(directory,)) as pool:
+        futures = {feature: pool.submit(_run, func, feature, kwargs) for feature in features}
+        return {feature: future.result() for feature, future in futures.items()}
@@ -0,0 +1,241 @@
+'''
+Mergeable quantile sketches. One sketch is built per (plate, well, cytokine, dose, feature) in a
+single scan of the data, after which medians and quartiles for any roll-up of those groups (per
+treatment, per cytokine, per plate, ...) come from merging sketches, without rescanning raw values.
+
+The sketch table keeps, for every group and feature, a summary of at most k items: all the values
+of a small group, and k evenly spaced order statistics of a larger one, each standing for n / k of
+its values. Merging summaries is concatenating their weighted items, so a roll-up is one sort of the
+items of its groups for all features at once. The rank error of a quantile is at most 1 / k of the
+number of values (0.5% with the default k=200) and quantiles of groups of at most k values are exact.
+QuantileSketch is the streaming form for a single feature whose data arrives in pieces.
+'''
+import numpy as np
+import pandas as pd
+
+# The finest grouping the sketches are built for, every roll-up is a subset of these columns
+SKETCH_GROUPS = ['Metadata_Plate', 'Metadata_Well', 'Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']
+
+class QuantileSketch:
+    '''
+    A KLL quantile sketch. Values are kept in levels of compactors, an item at level h standing
+    for 2**h of the original values. When a level is over its capacity it is sorted and every other
+    item, from a random offset, moves up one level. The sketch of n values keeps O(k log(n / k))
+    items, is exact while n <= k (quantiles interpolate between order statistics as np.quantile
+    does), and its quantiles have a rank error of about 2 / k of n in practice (under 1% with the
+    default k=200). Merging two sketches gives a sketch of the union of their data.
+    '''
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        # the top level holds k items and each level below holds 2/3 as many, but at least 2
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays where it is
+                stay = items[:len(items) % 2]
+                items = items[len(items) % 2:]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[level] = stay
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # adding a level changes every capacity, start again from the bottom
+                level = 0
+            else:
+                level += 1
+
+    def update(self, values):
+        '''
+        Adds an array of values to the sketch, NaN values are skipped. Returns the sketch.
+        '''
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        '''
+        Returns a new sketch of the union of the data of both sketches
+        '''
+        merged = QuantileSketch(k=max(self.k, other.k), seed=self._rng.integers(2 ** 31))
+        merged.n = self.n + other.n
+        merged.levels = [np.empty(0) for _ in range(max(len(self.levels), len(other.levels)))]
+        for sketch in [self, other]:
+            for level, items in enumerate(sketch.levels):
+                merged.levels[level] = np.concatenate([merged.levels[level], items])
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        '''
+        Returns the approximate q-quantile (a float or an array for an array of q), NaN for an empty sketch
+        '''
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_h), 2.0 ** h) for h, items_h in enumerate(self.levels)])
+        result = weighted_quantiles(items[None], weights[None], np.atleast_1d(q))[:, 0]
+        return result if np.ndim(q) else float(result[0])
+
+def weighted_quantiles(values, weights, q):
+    '''
+    This function computes quantiles of weighted items, an item of weight w standing for w values.
+    Every item sits at the middle of the ranks it stands for and the quantile interpolates linearly
+    between items, so with unit weights the result is the exact np.quantile (and DataFrame.median).
+
+    Arguments:
+
+    - values: array (rows x items), one set of items per row, NaN items are ignored
+    - weights: array of the same shape with the weight of every item
+    - q: array of quantiles
+
+    Returns:
+
+    - array (quantiles x rows), NaN for rows without items
+    '''
+    q = np.asarray(q, dtype=np.float64)
+    result = np.full((len(q), len(values)), np.nan)
+    if values.shape[1] == 0:
+        return result
+    weights = np.where(np.isnan(values), 0, weights)
+    order = np.argsort(values, axis=1, kind='stable')
+    values = np.take_along_axis(values, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+    cumulative = np.cumsum(weights, axis=1)
+    total = cumulative[:, -1]
+    # the 0-based rank at the middle of every item, the NaN items at the end are never reached
+    centers = np.where(weights > 0, cumulative - (weights + 1) / 2, np.inf)
+    last = np.maximum((weights > 0).sum(axis=1) - 1, 0)
+
+    rows = np.arange(len(values))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i, quantile in enumerate(q):
+            target = quantile * np.maximum(total - 1, 0)
+            lower = np.clip((centers <= target[:, None]).sum(axis=1) - 1, 0, last)
+            upper = np.minimum(lower + 1, last)
+            low, high = centers[rows, lower], centers[rows, upper]
+            fraction = np.where(high > low, np.clip((target - low) / (high - low), 0, 1), 0)
+            result[i] = values[rows, lower] + fraction * (values[rows, upper] - values[rows, lower])
+    result[:, total == 0] = np.nan
+    return result
+
+# FUNCTIONS
+
+def build_sketches(df, features=None, k=200, group_cols=SKETCH_GROUPS):
+    '''
+    This function builds the quantile summary of every group and feature, sorting the values of
+    one group at a time for all features at once
+
+    Arguments:
+
+    - df: the cleaned Pandas DataFrame, features start at column 6
+    - features: the features to sketch, every column from the 7th onwards by default
+    - k: the number of items kept per group and feature, larger is more accurate
+    - group_cols: the finest grouping, SKETCH_GROUPS by default
+
+    Returns:
+
+    - a dictionary with the 'groups' and 'features' lists, the group 'keys' (a Pandas DataFrame
+    with one row per group), the 'values' (groups x features x k, NaN padded) and the 'weights'
+    (groups x features) of the kept items. It can be stored with pd.to_pickle.
+    '''
+    if features is None:
+        features = df.columns[6:].tolist()
+
+    grouped = df.groupby(group_cols, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    keys = grouped.size().index.to_frame(index=False)
+    data = df[features].to_numpy(dtype=np.float64)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+    values = np.full((len(keys), len(features), k), np.nan)
+    weights = np.zeros((len(keys), len(features)))
+    slots = np.arange(k)[:, None]
+    for g in range(len(keys)):
+        # NaN values sort to the end of every column
+        block = np.sort(data[order[bounds[g]:bounds[g + 1]]], axis=0)
+        n = (~np.isnan(block)).sum(axis=0)
+        # all the values of small groups, k evenly spaced order statistics of the others
+        positions = np.where(n <= k, slots, ((slots + 0.5) * n / k).astype(np.int64))
+        kept = np.take_along_axis(block, np.minimum(positions, len(block) - 1), axis=0)
+        values[g] = np.where(slots < np.minimum(n, k), kept, np.nan).T
+        weights[g] = np.where(n > k, n / k, 1.0)
+    return {'groups': list(group_cols), 'features': list(features), 'keys': keys, 'values': values,
+            'weights': weights}
+
+def rollup_quantiles(sketch_table, by, q=0.5, features=None, where=None):
+    '''
+    This function computes approximate quantiles for a coarser grouping by merging the summaries of
+    the groups that roll up into it
+
+    Arguments:
+
+    - sketch_table: the output of build_sketches
+    - by: the columns to group by, a subset of the columns the sketches were built for
+    (an empty list gives one row for all the data)
+    - q: a quantile or a list of quantiles, e.g. 0.5 for the median or [0.25, 0.5, 0.75]
+    - features: the features to compute, all sketched features by default
+    - where: optional dictionary of {column: value or list of values} selecting the groups to include
+
+    Returns:
+
+    - Pandas DataFrame indexed by the by columns, with one column per feature for a single q and
+    (feature, q) columns for a list of q
+    '''
+    features = sketch_table['features'] if features is None else list(features)
+    columns = [sketch_table['features'].index(feature) for feature in features]
+    keys = sketch_table['keys']
+    selected = np.ones(len(keys), dtype=bool)
+    if where is not None:
+        for col, allowed in where.items():
+            selected &= keys[col].isin(allowed if isinstance(allowed, (list, tuple, set)) else [allowed]).to_numpy()
+    selected = np.flatnonzero(selected)
+
+    if by:
+        grouped = keys.iloc[selected].groupby(list(by), observed=True, sort=True)
+        targets = grouped.ngroup().to_numpy()
+        index = grouped.size().index
+    else:
+        targets = np.zeros(len(selected), dtype=np.int64)
+        index = pd.Index(['all'] if len(selected) else [])
+    quantiles = np.atleast_1d(q)
+
+    rows = []
+    for t in range(len(index)):
+        members = selected[targets == t]
+        # the items of all member groups of every feature side by side
+        values = sketch_table['values'][np.ix_(members, columns)]
+        k = values.shape[2]
+        weights = np.repeat(sketch_table['weights'][np.ix_(members, columns)][:, :, None], k, axis=2)
+        result = weighted_quantiles(values.transpose(1, 0, 2).reshape(len(columns), -1),
+                                    weights.transpose(1, 0, 2).reshape(len(columns), -1), quantiles)
+        rows.append(result.T.ravel())
+
+    if np.ndim(q) == 0:
+        frame_columns = features
+    else:
+        frame_columns = pd.MultiIndex.from_product([features, list(q)])
+    return pd.DataFrame(np.reshape(rows, (len(index), len(frame_columns))), index=index, columns=frame_columns)
+
+def treatment_medians(sketch_table, features=None):
+    '''
+    Returns the approximate medians per treatment, indexed by 'Cytokine-Dose' labels like the
+    medians in treatment_profiles_heatmap
+    '''
+    medians = rollup_quantiles(sketch_table, ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose'],
+                               q=0.5, features=features)
+    medians.index = pd.Index([str(c) + "-" + str(d) for c, d in medians.index], name='Cytokine_and_Dose')
+    return medians.sort_index()
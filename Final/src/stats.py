@@ -4,12 +4,32 @@ import matplotlib.pyplot as plt
 import statsmodels.api as sm
 import seaborn as sns
 import scipy.stats as stats
-from statsmodels.stats.power import TTestIndPower
-from statsmodels.stats.power import FTestAnovaPower
 from statsmodels.stats.multicomp import pairwise_tukeyhsd
-from statsmodels.stats.power import TTestPower
 from scipy.stats import f_oneway
 
+try:
+    from .incremental import group_moments
+    from . import power as power_analysis
+    from .bootstrap import bootstrap_ci_doses, bootstrap_ci_wells, bootstrap_ci_plates, bootstrap_ci_cytokines
+except ImportError:
+    from incremental import group_moments
+    import power as power_analysis
+    from bootstrap import bootstrap_ci_doses, bootstrap_ci_wells, bootstrap_ci_plates, bootstrap_ci_cytokines
+
+# The columns of the tables returned by the batched ANOVA functions
+ANOVA_BATCH_COLUMNS = ['Cytokine', 'Feature', 'F-stat', 'P-value', 'N', 'Groups', 'Group Sizes', 'ANOVA Power']
+
+# The columns of the tables returned by the batched Tukey functions, as in pairwise_tukeyhsd plus the feature
+TUKEY_BATCH_COLUMNS = ['Feature', 'group1', 'group2', 'meandiff', 'p-adj', 'lower', 'upper', 'reject']
+
+# The columns of the tables returned by the batched Kruskal-Wallis and Dunn tests
+KRUSKAL_BATCH_COLUMNS = ['Cytokine', 'Feature', 'H-stat', 'P-value', 'N', 'Groups', 'Group Sizes']
+DUNN_BATCH_COLUMNS = ['Feature', 'group1', 'group2', 'meanrankdiff', 'z', 'p-adj', 'reject']
+
+# The columns of the table returned by get_ttest_wells_batch
+TTEST_BATCH_COLUMNS = ['Cytokine', 'Dose', 'Feature', 'Well Comparison', 'Well 1', 'Well 2', 'T-Statistic',
+                       'p-value', 'df', 'N 1', 'N 2', 'Power']
+
 def run_ANOVA_doses(cytokine, feature, df):
     '''
     This function run ANOVA test across dosage levels of a cytokine
@@ -27,6 +47,10 @@ def run_ANOVA_doses(cytokine, feature, df):
     F-stat and P-value of the ANOVA test
     - anova_power: the power of the test
     '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_doses(cytokine, feature)
+
     # Dropping the Dose and Well columns
     df_doses = df.drop(['Metadata_Plate', 'Metadata_Well'], axis=1)
     final_df = pd.DataFrame(columns=['Cytokine', 'Feature', 'F-stat', 'P-value'])
@@ -36,12 +60,11 @@ def run_ANOVA_doses(cytokine, feature, df):
     obs = len(sub_cyto_df)
     
     # Calculating the power for this test using the size of the above subset
-    power = TTestPower()
-    anova_power = power.solve_power(nobs=obs, effect_size=0.5, power=None, alpha=0.05)
+    anova_power = power_analysis.ttest_power(obs)
     
     # Group the subset by plate and perform One-Way ANOVA
     sub_df = sub_cyto_df[['Metadata_Metadata_Dose', feature]]
-    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Metadata_Dose')]
+    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Metadata_Dose', observed=True)]
     F, p = f_oneway(*grps)
     
     # Append the results of our One-Way ANOVA to a dataframe and then return it along with the power
@@ -49,7 +72,7 @@ def run_ANOVA_doses(cytokine, feature, df):
 
     return final_df,anova_power
 
-def plot_by_dose(cytokine, feature, df):
+def plot_by_dose(cytokine, feature, df, ci=False):
     '''
     This function produces box-plots of the feature of interest using the cytokine 
     of interest grouped by dosage levels 
@@ -59,10 +82,11 @@ def plot_by_dose(cytokine, feature, df):
     - cytokine: the cytokine that we are interested in
     - feature: the feature that we are interested in
     - df: the Pandas DataFrame that stores all the data
+    - ci: whether to draw the group means with bootstrap 95% confidence intervals over the boxes
     '''
     cytokine_dose = df[(df['Metadata_Metadata_Cytokine'] == cytokine)]
     cytokine_dose = cytokine_dose[['Metadata_Metadata_Dose', feature]]
-    grouped = cytokine_dose.groupby('Metadata_Metadata_Dose')[feature]
+    grouped = cytokine_dose.groupby('Metadata_Metadata_Dose', observed=True)[feature]
 
     fig,ax = plt.subplots(figsize=(8,6))
 
@@ -76,6 +100,9 @@ def plot_by_dose(cytokine, feature, df):
     ax.set_title('Dose Comparison: Mean Difference (' + cytokine + ' , ' + feature + ')')
     ax.set_xlabel('Doses')
     ax.set_ylabel('Mean Value (95% CI)')
+    if ci:
+        means_df, diffs_df = bootstrap_ci_doses(cytokine, df, [feature], use_cache=True)
+        plot_mean_ci(ax, means_df, list(grouped.groups.keys()))
     
     return fig
 
@@ -126,6 +153,10 @@ def get_ttest_wells(cytokine, feature, df):
     Well Comparison that specifies the wells in the test, T-Statistic, P-value and Power
     of the t-test
     '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.get_ttest_wells(cytokine, feature)
+
     ttest_df = pd.DataFrame(columns=['Cytokine', 'Feature', 'Well Comparison', 'T-Statistic', 'p-value', 'Power'])
     cytokine_wells = df[(df['Metadata_Metadata_Dose'] == 100) & (df['Metadata_Metadata_Cytokine'] == cytokine)]
     obs = len(cytokine_wells)
@@ -140,8 +171,7 @@ def get_ttest_wells(cytokine, feature, df):
     well_2_means = cytokine_wells.where(cytokine_wells['Metadata_Well'] == well_2).dropna()[feature]
     
     results = stats.ttest_ind(well_1_means,well_2_means, equal_var=False)
-    power = TTestPower()
-    ttest_power = power.solve_power(nobs=obs, effect_size=0.5, power=None, alpha=0.05)
+    ttest_power = power_analysis.ttest_power(obs)
     
     Tstat = round(results[0],3)
     Pvalue = round(results[1],3)
@@ -169,6 +199,10 @@ def get_ttest_wells_d(cytokine, dose, feature, df):
     Well Comparison that specifies the wells in the test, T-Statistic, P-value and Power
     of the t-test
     '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.get_ttest_wells_d(cytokine, dose, feature)
+
     ttest_df = pd.DataFrame(columns=['Cytokine', 'Feature', 'Well Comparison', 'T-Statistic', 'p-value', 'Power'])
     # is it okay if we generalize the Metadata_Metadata_Dose to input by users
     cytokine_wells = df[(df['Metadata_Metadata_Dose'] == dose) & (df['Metadata_Metadata_Cytokine'] == cytokine)]
@@ -184,8 +218,7 @@ def get_ttest_wells_d(cytokine, dose, feature, df):
     well_2_means = cytokine_wells.where(cytokine_wells['Metadata_Well'] == well_2).dropna()[feature]
     
     results = stats.ttest_ind(well_1_means,well_2_means, equal_var=False)
-    power = TTestPower()
-    ttest_power = power.solve_power(nobs=obs, effect_size=0.5, power=None, alpha=0.05)
+    ttest_power = power_analysis.ttest_power(obs)
     
     Tstat = round(results[0],3)
     Pvalue = round(results[1],3)
@@ -194,7 +227,7 @@ def get_ttest_wells_d(cytokine, dose, feature, df):
                                'T-Statistic': Tstat, 'p-value': Pvalue, 'Power': ttest_power}, ignore_index=True)
     return ttest_df
 
-def plot_by_wells(cytokine, feature, df):
+def plot_by_wells(cytokine, feature, df, ci=False):
     '''
     This function produces box-plots of the feature of interest in
     different wells using the cytokine of interest at the dosage level of 100
@@ -204,10 +237,11 @@ def plot_by_wells(cytokine, feature, df):
     - cytokine: the cytokine that we are interested in
     - feature: the feature that we are interested in
     - df: the Pandas DataFrame that stores all the data
+    - ci: whether to draw the group means with bootstrap 95% confidence intervals over the boxes
     '''
     cytokine_wells = df[(df['Metadata_Metadata_Dose'] == 100) & (df['Metadata_Metadata_Cytokine'] == cytokine)]
     cytokine_wells = cytokine_wells[['Metadata_Well', feature]]
-    grouped = cytokine_wells.groupby('Metadata_Well')[feature]
+    grouped = cytokine_wells.groupby('Metadata_Well', observed=True)[feature]
 
     fig,ax = plt.subplots(figsize=(8,6))
 
@@ -221,6 +255,10 @@ def plot_by_wells(cytokine, feature, df):
     ax.set_title('Well Comparison: TMean Difference at 100 ng/ml ( ' + cytokine + ' , ' + feature + ' )')
     ax.set_xlabel('Wells')
     ax.set_ylabel('Mean Value (95% CI)')
+    if ci:
+        means_df, diffs_df = bootstrap_ci_wells(cytokine, df, [feature], use_cache=True)
+        plot_mean_ci(ax, means_df, list(grouped.groups.keys()))
+    
     return fig
 
 def run_ANOVA_plates(untr, feature, df):
@@ -240,6 +278,10 @@ def run_ANOVA_plates(untr, feature, df):
     F-stat and P-value of the ANOVA test
     - anova_power: the power of the test
     '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_plates(untr, feature)
+
     # Dropping the Dose and Well columns
     df_doses = df.drop(['Metadata_Metadata_Dose', 'Metadata_Well'], axis=1)
     final_df = pd.DataFrame(columns=['Cytokine', 'Feature', 'F-stat', 'P-value'])
@@ -249,12 +291,11 @@ def run_ANOVA_plates(untr, feature, df):
     obs = len(sub_cyto_df)
     
     # Calculating the power for this test using the size of the above subset
-    power = TTestPower()
-    anova_power = power.solve_power(nobs=obs, effect_size=0.5, power=None, alpha=0.05)
+    anova_power = power_analysis.ttest_power(obs)
     
     # Group the subset by plate and perform One-Way ANOVA
     sub_df = sub_cyto_df[['Metadata_Plate', feature]]
-    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Plate')]
+    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Plate', observed=True)]
     F, p = f_oneway(*grps)
     
     # Append the results of our One-Way ANOVA to a dataframe and then return it along with the power
@@ -262,7 +303,7 @@ def run_ANOVA_plates(untr, feature, df):
 
     return final_df,anova_power
 
-def plot_by_plate(untr, feature, df):
+def plot_by_plate(untr, feature, df, ci=False):
     '''
     This function produces box-plots of the feature of interest in
     different plates using untreated experiments
@@ -272,10 +313,11 @@ def plot_by_plate(untr, feature, df):
     - df: the Pandas DataFrame that stores all the data
     - feature: the feature that we are interested in
     - dose: the dosage level that we are interested in
+    - ci: whether to draw the group means with bootstrap 95% confidence intervals over the boxes
     '''
     cytokine_plate = df[(df['Metadata_Metadata_Cytokine'] == untr)]
     cytokine_plate = cytokine_plate[['Metadata_Plate', feature]]
-    grouped = cytokine_plate.groupby('Metadata_Plate')[feature]
+    grouped = cytokine_plate.groupby('Metadata_Plate', observed=True)[feature]
 
     fig,ax = plt.subplots(figsize=(8,6))
 
@@ -288,6 +330,10 @@ def plot_by_plate(untr, feature, df):
     ax.set_title('Plate Comparison: Mean Differences for untreatd cells (' + feature + ')')
     ax.set_xlabel('Plates')
     ax.set_ylabel('Mean Value (95% CI)')
+    if ci:
+        means_df, diffs_df = bootstrap_ci_plates(untr, df, [feature], use_cache=True)
+        plot_mean_ci(ax, means_df, list(grouped.groups.keys()))
+    
     return fig
 
 def plate_Tukey_HSD(untr, feature, df):
@@ -338,6 +384,10 @@ def run_ANOVA_cytokines(df, feature, dose):
     F-stat and P-value of the ANOVA test
     - anova_power: the power of the test
     '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_cytokines(feature, dose)
+
     sub_df = df[df['Metadata_Metadata_Dose'] == dose]
     
     # We're only looking at our treated cells, so filter out the untreated cells
@@ -351,12 +401,11 @@ def run_ANOVA_cytokines(df, feature, dose):
     obs = len(df_doses)
     
     # Calculating the power for this test using the size of the above subset
-    power = TTestPower()
-    anova_power = power.solve_power(nobs=obs, effect_size=0.5, power=None, alpha=0.05)
+    anova_power = power_analysis.ttest_power(obs)
     
     # Group the subset by plate and perform One-Way ANOVA
     sub_df = sub_df[['Metadata_Metadata_Cytokine', feature]]
-    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Metadata_Cytokine')]
+    grps = [d[feature] for _, d in sub_df.groupby('Metadata_Metadata_Cytokine', observed=True)]
     F, p = f_oneway(*grps)
     
     # Append the results of our One-Way ANOVA to a dataframe and then return it along with the power
@@ -364,7 +413,7 @@ def run_ANOVA_cytokines(df, feature, dose):
 
     return final_df,anova_power
 
-def plot_by_cytokine(df, feature, dose):
+def plot_by_cytokine(df, feature, dose, ci=False):
     '''
     This function produces box-plots of the feature of interest group by 
     different cytokines at the dosage level of interest
@@ -374,10 +423,11 @@ def plot_by_cytokine(df, feature, dose):
     - df: the Pandas DataFrame that stores all the data
     - feature: the feature that we are interested in
     - dose: the dosage level that we are interested in
+    - ci: whether to draw the group means with bootstrap 95% confidence intervals over the boxes
     '''
     cytokine_dose = df[(df['Metadata_Metadata_Dose'] == dose)]
     cytokine_dose = cytokine_dose[['Metadata_Metadata_Cytokine', feature]]
-    grouped = cytokine_dose.groupby('Metadata_Metadata_Cytokine')[feature]
+    grouped = cytokine_dose.groupby('Metadata_Metadata_Cytokine', observed=True)[feature]
 
     fig,ax = plt.subplots(figsize=(8,6))
 
@@ -397,6 +447,10 @@ def plot_by_cytokine(df, feature, dose):
     ax.set_title('Cytokine Comparison: Mean Difference (' + feature + ',' + str(dose) + 'ng/ml)')
     ax.set_xlabel('Cytokines')
     ax.set_ylabel('Mean Value (95% CI)')
+    if ci:
+        means_df, diffs_df = bootstrap_ci_cytokines(df, dose, [feature], use_cache=True)
+        plot_mean_ci(ax, means_df, list(grouped.groups.keys()))
+    
     return fig
 
 def cytokine_Tukey_HSD(df, feature, dose):
@@ -431,3 +485,626 @@ def cytokine_Tukey_HSD(df, feature, dose):
     rs.columns = new_header #set the header row as the df header
     
     return rs
+
+def anova_from_moments(counts, means, m2):
+    '''
+    This function computes the one-way ANOVA from group summaries instead of raw values, which
+    gives the same F-statistic as f_oneway
+    
+    Arguments:
+
+    - counts: array (groups x features) of the number of values in every group
+    - means: array (groups x features) of the group means
+    - m2: array (groups x features) of the sums of squared deviations from the group means
+    
+    Returns: 
+    
+    - F: array of the F-statistic of every feature
+    - p: array of the P-value of every feature
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    present = counts > 0
+    means = np.where(present, np.asarray(means, dtype=np.float64), 0)
+    m2 = np.where(present, np.asarray(m2, dtype=np.float64), 0)
+
+    k = present.sum(axis=0)
+    n = counts.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grand_mean = (counts * means).sum(axis=0) / n
+        ss_between = (counts * (means - grand_mean) ** 2).sum(axis=0)
+        ss_within = m2.sum(axis=0)
+        F = (ss_between / (k - 1)) / (ss_within / (n - k))
+    p = stats.f.sf(F, k - 1, n - k)
+    return F, p
+
+def anova_table(label, moments):
+    '''
+    This function turns group summaries into a table of one-way ANOVA results, one row per feature
+    
+    Arguments:
+
+    - label: the value of the Cytokine column, as in run_ANOVA_doses/plates/cytokines
+    - moments: the 'count', 'mean' and 'm2' DataFrames of incremental.group_moments, indexed by
+    the groups being compared with one column per feature
+    
+    Returns: 
+    
+    - final_df: a Pandas DataFrame with the columns of ANOVA_BATCH_COLUMNS, the F-stat and P-value
+    of every feature, the number of values N, the number of groups, the size of every group and
+    the power of the F-test for a medium effect (power.anova_power)
+    '''
+    counts = moments['count']
+    F, p = anova_from_moments(counts.to_numpy(), moments['mean'].to_numpy(), moments['m2'].to_numpy())
+    
+    sizes = counts.to_numpy()
+    groups = counts.index.tolist()
+    group_sizes = [{group: int(n) for group, n in zip(groups, sizes[:, j]) if n > 0} for j in range(sizes.shape[1])]
+    
+    n = sizes.sum(axis=0).astype(np.int64)
+    k = (sizes > 0).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f_power = np.where(k > 1, power_analysis.anova_power(n, np.maximum(k, 2)), np.nan)
+    
+    final_df = pd.DataFrame({'Cytokine': label,
+                             'Feature': counts.columns,
+                             'F-stat': F,
+                             'P-value': p,
+                             'N': n,
+                             'Groups': k,
+                             'Group Sizes': group_sizes,
+                             'ANOVA Power': f_power}, columns=ANOVA_BATCH_COLUMNS)
+    return final_df
+
+def _anova_batch(sub_df, group_col, label, features, obs):
+    # one groupby over all the features gives the sums of squares of every feature at once
+    moments = group_moments(sub_df, features=features, group_cols=[group_col])
+    final_df = anova_table(label, moments)
+    
+    anova_power = power_analysis.ttest_power(obs)
+    return final_df, anova_power
+
+def run_ANOVA_doses_batch(cytokine, df, features=None):
+    '''
+    This function runs the ANOVA test of run_ANOVA_doses across dosage levels of a cytokine
+    for a list of features at once
+    
+    Arguments:
+
+    - cytokine: the cytokine we are interested in
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    
+    Returns: 
+    
+    - final_df: a Pandas DataFrame with one row per feature (see anova_table)
+    - anova_power: the power of the test
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_doses_batch(cytokine, features)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    # only the group column and the features are copied
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == cytokine, ['Metadata_Metadata_Dose'] + features]
+    return _anova_batch(sub_df, 'Metadata_Metadata_Dose', cytokine, features, len(sub_df))
+
+def run_ANOVA_plates_batch(untr, df, features=None):
+    '''
+    This function runs the ANOVA test of run_ANOVA_plates across plates using untreated experiments
+    for a list of features at once
+    
+    Arguments:
+
+    - untr: specifies the untreated experiments
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    
+    Returns: 
+    
+    - final_df: a Pandas DataFrame with one row per feature (see anova_table)
+    - anova_power: the power of the test
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_plates_batch(untr, features)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == untr, ['Metadata_Plate'] + features]
+    return _anova_batch(sub_df, 'Metadata_Plate', untr, features, len(sub_df))
+
+def run_ANOVA_cytokines_batch(df, dose, features=None):
+    '''
+    This function runs the ANOVA test of run_ANOVA_cytokines across different cytokines
+    at the dosage level of interest for a list of features at once
+    
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - dose: the dosage level that we are interested in
+    - features: the features we are interested in, every column from the 7th onwards by default
+    
+    Returns: 
+    
+    - final_df: a Pandas DataFrame with one row per feature (see anova_table)
+    - anova_power: the power of the test
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.run_ANOVA_cytokines_batch(dose, features)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    # We're only looking at our treated cells, so filter out the untreated cells
+    treated = ((df['Metadata_Metadata_Dose'] == dose) &
+               (df['Metadata_Metadata_Cytokine'] != 'untr') & (df['Metadata_Metadata_Cytokine'] != 'untr-50'))
+    sub_df = df.loc[treated, ['Metadata_Metadata_Cytokine'] + features]
+    # run_ANOVA_cytokines uses the size of the whole table for the power
+    return _anova_batch(sub_df, 'Metadata_Metadata_Cytokine', dose, features, len(df))
+
+def studentized_range_sf(q, k, df, points=256, grid_size=4096):
+    '''
+    This function computes the survival function of the studentized range distribution for many
+    values at once. scipy integrates over the error variance for every value, which takes about
+    10 ms each, so instead the infinite df distribution is tabulated once and averaged over
+    quantiles of the error standard deviation. Against stats.studentized_range.sf the absolute
+    error is at most about 1.3e-4 for small df (tens) and about 1e-6 for df >= 1000. In the far
+    tail the relative error is larger: up to about 15% for p-values well below 1e-3 at small df
+    (e.g. k=8, df=30), under 0.1% for df >= 1000. The critical values and reject decisions of
+    tukey_from_moments use the exact stats.studentized_range.ppf.
+    
+    Arguments:
+
+    - q: array of studentized ranges
+    - k: the number of groups
+    - df: the degrees of freedom of the error term
+    - points: the number of quantiles of the error standard deviation
+    - grid_size: the number of points the infinite df distribution is tabulated at
+    
+    Returns: 
+    
+    - array of P(Q > q)
+    '''
+    q = np.asarray(q, dtype=np.float64)
+    if np.isinf(df):
+        s = np.ones(1)
+    else:
+        u = (np.arange(points) + 0.5) / points
+        s = np.sqrt(stats.chi2.ppf(u, df) / df)
+    top = max(np.nanmax(q, initial=0), 1e-9) * s.max()
+    grid = np.linspace(0, top, grid_size)
+    sf_grid = stats.studentized_range.sf(grid, k, np.inf)
+    return np.interp(np.multiply.outer(q, s), grid, sf_grid).mean(axis=-1)
+
+def tukey_from_moments(moments, alpha=0.05):
+    '''
+    This function runs the Tukey HSD test (Tukey-Kramer for unequal group sizes) from group
+    summaries for every feature at once, with the same results as pairwise_tukeyhsd
+    
+    Arguments:
+
+    - moments: the 'count', 'mean' and 'm2' DataFrames of incremental.group_moments, indexed by
+    the groups being compared with one column per feature
+    - alpha: the family-wise error rate
+    
+    Returns: 
+    
+    - rs: a Pandas DataFrame with the columns of TUKEY_BATCH_COLUMNS, one row per feature and
+    pair of groups. meandiff is the mean of group2 minus the mean of group1
+    '''
+    counts = moments['count'].to_numpy(dtype=np.float64)
+    means = moments['mean'].to_numpy(dtype=np.float64)
+    m2 = moments['m2'].to_numpy(dtype=np.float64)
+    groups = moments['count'].index.tolist()
+    features = moments['count'].columns
+    
+    # pooled within group variance of every feature
+    k = (counts > 0).sum(axis=0)
+    df_error = counts.sum(axis=0) - k
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = np.nansum(m2, axis=0) / df_error
+    
+    idx1, idx2 = np.triu_indices(len(groups), 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meandiff = means[idx2] - means[idx1]
+        std_pairs = np.sqrt(mse / 2 * (1 / counts[idx1] + 1 / counts[idx2]))
+        q = np.abs(meandiff) / std_pairs
+    
+    # the critical value and the distribution are shared by all features with the same group structure
+    p_adj = np.full(q.shape, np.nan)
+    q_crit = np.full(len(features), np.nan)
+    for k_f, df_f in set(zip(k, df_error)):
+        if k_f < 2 or df_f < 1:
+            continue
+        columns = (k == k_f) & (df_error == df_f)
+        q_crit[columns] = stats.studentized_range.ppf(1 - alpha, k_f, df_f)
+        valid = ~np.isnan(q[:, columns])
+        p_cols = np.full(valid.shape, np.nan)
+        p_cols[valid] = studentized_range_sf(q[:, columns][valid], k_f, df_f)
+        p_adj[:, columns] = p_cols
+    
+    # one block of pairs per feature
+    crit_int = std_pairs * q_crit
+    rs = pd.DataFrame({'Feature': np.repeat(np.asarray(features), len(idx1)),
+                       'group1': np.tile(np.asarray(groups, dtype=object)[idx1], len(features)),
+                       'group2': np.tile(np.asarray(groups, dtype=object)[idx2], len(features)),
+                       'meandiff': meandiff.T.ravel(),
+                       'p-adj': p_adj.T.ravel(),
+                       'lower': (meandiff - crit_int).T.ravel(),
+                       'upper': (meandiff + crit_int).T.ravel(),
+                       'reject': (q > q_crit).T.ravel()}, columns=TUKEY_BATCH_COLUMNS)
+    return rs
+
+def doses_Tukey_HSD_batch(cytokine, df, features=None, alpha=0.05):
+    '''
+    This function runs the Tukey test of doses_Tukey_HSD across dosage levels of a cytokine
+    for a list of features at once
+    
+    Arguments:
+
+    - cytokine: the cytokine we are interested in
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate
+    
+    Returns: 
+    
+    - rs: a Pandas DataFrame with one row per feature and pair of doses (see tukey_from_moments)
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.doses_Tukey_HSD_batch(cytokine, features, alpha)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == cytokine, ['Metadata_Metadata_Dose'] + features]
+    return tukey_from_moments(group_moments(sub_df, features=features, group_cols=['Metadata_Metadata_Dose']), alpha)
+
+def plate_Tukey_HSD_batch(untr, df, features=None, alpha=0.05):
+    '''
+    This function runs the Tukey test of plate_Tukey_HSD across plates using untreated experiments
+    for a list of features at once
+    
+    Arguments:
+
+    - untr: specifies the untreated experiments
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate
+    
+    Returns: 
+    
+    - rs: a Pandas DataFrame with one row per feature and pair of plates (see tukey_from_moments)
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.plate_Tukey_HSD_batch(untr, features, alpha)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == untr, ['Metadata_Plate'] + features]
+    return tukey_from_moments(group_moments(sub_df, features=features, group_cols=['Metadata_Plate']), alpha)
+
+def cytokine_Tukey_HSD_batch(df, dose, features=None, alpha=0.05):
+    '''
+    This function runs the Tukey test of cytokine_Tukey_HSD across different cytokines
+    at the dosage level of interest for a list of features at once
+    
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - dose: the dosage level that we are interested in
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate
+    
+    Returns: 
+    
+    - rs: a Pandas DataFrame with one row per feature and pair of cytokines (see tukey_from_moments)
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.cytokine_Tukey_HSD_batch(dose, features, alpha)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    # We're only looking at our treated cells, so filter out the untreated cells
+    treated = ((df['Metadata_Metadata_Dose'] == dose) &
+               (df['Metadata_Metadata_Cytokine'] != 'untr') & (df['Metadata_Metadata_Cytokine'] != 'untr-50'))
+    sub_df = df.loc[treated, ['Metadata_Metadata_Cytokine'] + features]
+    return tukey_from_moments(group_moments(sub_df, features=features, group_cols=['Metadata_Metadata_Cytokine']), alpha)
+
+def ttest_wells_from_moments(moments):
+    '''
+    This function runs Welch's t-test between every pair of wells of every cytokine and dose for
+    every feature from group summaries, with the same results as stats.ttest_ind(equal_var=False)
+    
+    Arguments:
+
+    - moments: the 'count', 'mean' and 'm2' DataFrames of incremental.group_moments grouped by
+    cytokine, dose and well
+    
+    Returns: 
+    
+    - ttest_df: a Pandas DataFrame with the columns of TTEST_BATCH_COLUMNS, one row per treatment,
+    pair of wells and feature
+    '''
+    counts = moments['count'].to_numpy(dtype=np.float64)
+    means = moments['mean'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variances = moments['m2'].to_numpy(dtype=np.float64) / (counts - 1)
+    features = np.asarray(moments['count'].columns)
+    index = moments['count'].index.to_frame(index=False)
+    index.columns = ['Cytokine', 'Dose', 'Well']
+    
+    # every pair of wells within a treatment, as row positions into the moments
+    treatments, first, second = [], [], []
+    for (cytokine, dose), rows in index.groupby(['Cytokine', 'Dose'], sort=False, observed=True).groups.items():
+        rows = np.asarray(rows)
+        i, j = np.triu_indices(len(rows), 1)
+        treatments.extend([(cytokine, dose, len(rows))] * len(i))
+        first.append(rows[i])
+        second.append(rows[j])
+    if not treatments:
+        return pd.DataFrame(columns=TTEST_BATCH_COLUMNS)
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    
+    n1, n2 = counts[first], counts[second]
+    se1, se2 = variances[first] / n1, variances[second] / n2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        T = (means[first] - means[second]) / np.sqrt(se1 + se2)
+        # Welch-Satterthwaite degrees of freedom
+        dof = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+    P = 2 * stats.t.sf(np.abs(T), dof)
+    
+    # the power uses the number of objects of the treatment, as in get_ttest_wells_d
+    treatment_counts = index.assign(n=counts.max(axis=1)).groupby(['Cytokine', 'Dose'], observed=True)['n'].sum()
+    treatment_power = dict(zip(treatment_counts.index, power_analysis.ttest_power(treatment_counts.to_numpy())))
+    
+    n_features = len(features)
+    wells_1 = index['Well'].to_numpy()[first]
+    wells_2 = index['Well'].to_numpy()[second]
+    ttest_df = pd.DataFrame({'Cytokine': np.repeat([t[0] for t in treatments], n_features),
+                             'Dose': np.repeat([t[1] for t in treatments], n_features),
+                             'Feature': np.tile(features, len(first)),
+                             'Well Comparison': np.repeat([str(w1) + ' vs ' + str(w2) for w1, w2 in zip(wells_1, wells_2)], n_features),
+                             'Well 1': np.repeat(wells_1, n_features),
+                             'Well 2': np.repeat(wells_2, n_features),
+                             'T-Statistic': T.ravel(),
+                             'p-value': P.ravel(),
+                             'df': dof.ravel(),
+                             'N 1': n1.ravel().astype(np.int64),
+                             'N 2': n2.ravel().astype(np.int64),
+                             'Power': np.repeat([treatment_power[(t[0], t[1])] for t in treatments], n_features)},
+                            columns=TTEST_BATCH_COLUMNS)
+    return ttest_df
+
+def get_ttest_wells_batch(df, features=None, cytokines=None, doses=None):
+    '''
+    This function runs t-tests between every pair of wells of every cytokine and dose for a
+    list of features at once, computed from one groupby over the data. Missing values only
+    leave out the value itself, not the whole row.
+    
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - cytokines: optional list of the cytokines to test, all by default
+    - doses: optional list of the dosage levels to test, all by default
+    
+    Returns: 
+    
+    - ttest_df: a Pandas DataFrame with one row per cytokine, dose, pair of wells and feature
+    (see ttest_wells_from_moments)
+    '''
+    # summary backends (out_of_core.PlateDataset, cube.StatsCube) answer from group aggregates
+    if not isinstance(df, pd.DataFrame):
+        return df.get_ttest_wells_batch(features, cytokines, doses)
+    
+    features = df.columns[6:].tolist() if features is None else list(features)
+    group_cols = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
+    selected = pd.Series(True, index=df.index)
+    if cytokines is not None:
+        selected &= df['Metadata_Metadata_Cytokine'].isin(cytokines)
+    if doses is not None:
+        selected &= df['Metadata_Metadata_Dose'].isin(doses)
+    sub_df = df.loc[selected, group_cols + features]
+    return ttest_wells_from_moments(group_moments(sub_df, features=features, group_cols=group_cols))
+
+def moments_summary(moments):
+    '''
+    This function turns group summaries into a table of the count, mean and standard deviation
+    (ddof=1, as DataFrame.std) of every feature for every group
+    
+    Arguments:
+
+    - moments: the 'count', 'mean' and 'm2' DataFrames of incremental.group_moments
+    
+    Returns: 
+    
+    - summary_df: a Pandas DataFrame indexed by the groups with (statistic, feature) columns
+    '''
+    count = moments['count']
+    std = np.sqrt(moments['m2'] / (count - 1).where(count > 1))
+    return pd.concat({'count': count, 'mean': moments['mean'], 'std': std}, axis=1)
+
+def plot_mean_ci(ax, means_df, groups):
+    '''
+    This function draws the group means with their confidence intervals over the box-plots
+    
+    Arguments:
+
+    - ax: the axes of the box-plots
+    - means_df: the first output of a bootstrap.bootstrap_ci_* function for one feature
+    - groups: the groups in the order of the boxes
+    '''
+    means_df = means_df.set_index('Group').reindex(groups)
+    positions = np.arange(1, len(groups) + 1)
+    ax.errorbar(positions, means_df['mean'],
+                yerr=[means_df['mean'] - means_df['lower'], means_df['upper'] - means_df['mean']],
+                fmt='o', color='red', capsize=4, label='Mean (95% bootstrap CI)')
+    ax.legend()
+
+def group_rank_sums(values, labels):
+    '''
+    This function ranks every feature once, over all objects with average ranks for ties, and
+    sums the ranks of every group. Missing values are left out of the ranking of their feature
+    and objects with a missing label are left out altogether.
+    
+    Arguments:
+
+    - values: array (objects x features)
+    - labels: the group of every object
+    
+    Returns: 
+    
+    - groups: the sorted group labels
+    - rank_sums: array (groups x features) of the rank sums
+    - counts: array (groups x features) of the number of ranked values
+    - ties: array of the tie term sum(t^3 - t) of every feature, t the size of each run of ties
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    codes, groups = pd.factorize(pd.Series(labels), sort=True)
+    # objects without a group label are left out, as groupby does
+    labelled = codes >= 0
+    values, codes = values[labelled], codes[labelled]
+    k = len(groups)
+    rank_sums = np.zeros((k, values.shape[1]))
+    counts = np.zeros((k, values.shape[1]))
+    ties = np.zeros(values.shape[1])
+    
+    for j in range(values.shape[1]):
+        column = values[:, j]
+        present = np.flatnonzero(~np.isnan(column))
+        order = present[np.argsort(column[present], kind='mergesort')]
+        ordered = column[order]
+        # the start of every run of equal values and the average rank of the run
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        lengths = np.diff(np.r_[starts, len(ordered)])
+        average_rank = starts + (lengths + 1) / 2
+        ranks = np.repeat(average_rank, lengths)
+        
+        group_codes = codes[order]
+        rank_sums[:, j] = np.bincount(group_codes, weights=ranks, minlength=k)
+        counts[:, j] = np.bincount(group_codes, minlength=k)
+        ties[j] = np.sum(lengths.astype(np.float64) ** 3 - lengths)
+    return groups, rank_sums, counts, ties
+
+def kruskal_dunn_from_ranks(label, features, groups, rank_sums, counts, ties, alpha=0.05):
+    '''
+    This function runs the Kruskal-Wallis H-test and Dunn's post-hoc test of every pair of groups
+    from the rank sums of group_rank_sums, for every feature at once. The H-statistic has the tie
+    correction of stats.kruskal and the Dunn P-values are Bonferroni adjusted within each feature.
+    
+    Arguments:
+
+    - label: the value of the Cytokine column, as in run_ANOVA_doses/plates/cytokines
+    - features: the feature names
+    - groups, rank_sums, counts, ties: the outputs of group_rank_sums
+    - alpha: the family-wise error rate of the Dunn tests
+    
+    Returns: 
+    
+    - kruskal_df: a Pandas DataFrame with the columns of KRUSKAL_BATCH_COLUMNS, one row per feature
+    - dunn_df: a Pandas DataFrame with the columns of DUNN_BATCH_COLUMNS, one row per feature and pair
+    of groups. meanrankdiff is the mean rank of group2 minus the mean rank of group1
+    '''
+    n = counts.sum(axis=0)
+    k = (counts > 0).sum(axis=0)
+    features = np.asarray(features)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ranks = rank_sums / counts
+        H = 12 / (n * (n + 1)) * np.nansum(rank_sums ** 2 / counts, axis=0) - 3 * (n + 1)
+        H = H / (1 - ties / (n ** 3 - n))
+    p = stats.chi2.sf(H, k - 1)
+    
+    group_sizes = [{group: int(size) for group, size in zip(groups, counts[:, j]) if size > 0}
+                   for j in range(counts.shape[1])]
+    kruskal_df = pd.DataFrame({'Cytokine': label,
+                               'Feature': features,
+                               'H-stat': H,
+                               'P-value': p,
+                               'N': n.astype(np.int64),
+                               'Groups': k,
+                               'Group Sizes': group_sizes}, columns=KRUSKAL_BATCH_COLUMNS)
+    
+    idx1, idx2 = np.triu_indices(len(groups), 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        meanrankdiff = mean_ranks[idx2] - mean_ranks[idx1]
+        variance = (n * (n + 1) / 12 - ties / (12 * (n - 1))) * (1 / counts[idx1] + 1 / counts[idx2])
+        z = meanrankdiff / np.sqrt(variance)
+    # Bonferroni over the pairs of groups that are both present for the feature
+    n_pairs = np.maximum(k * (k - 1) / 2, 1)
+    p_adj = np.minimum(2 * stats.norm.sf(np.abs(z)) * n_pairs, 1)
+    
+    dunn_df = pd.DataFrame({'Feature': np.repeat(features, len(idx1)),
+                            'group1': np.tile(np.asarray(groups, dtype=object)[idx1], len(features)),
+                            'group2': np.tile(np.asarray(groups, dtype=object)[idx2], len(features)),
+                            'meanrankdiff': meanrankdiff.T.ravel(),
+                            'z': z.T.ravel(),
+                            'p-adj': p_adj.T.ravel(),
+                            'reject': (p_adj < alpha).T.ravel()}, columns=DUNN_BATCH_COLUMNS)
+    return kruskal_df, dunn_df
+
+def _kruskal_batch(sub_df, group_col, label, features, alpha):
+    groups, rank_sums, counts, ties = group_rank_sums(sub_df[features].to_numpy(), sub_df[group_col])
+    return kruskal_dunn_from_ranks(label, features, groups, rank_sums, counts, ties, alpha)
+
+def run_kruskal_doses_batch(cytokine, df, features=None, alpha=0.05):
+    '''
+    This function runs the Kruskal-Wallis and Dunn tests across dosage levels of a cytokine,
+    the rank based counterparts of run_ANOVA_doses_batch and doses_Tukey_HSD_batch
+    
+    Arguments:
+
+    - cytokine: the cytokine we are interested in
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate of the Dunn tests
+    
+    Returns: 
+    
+    - kruskal_df, dunn_df: see kruskal_dunn_from_ranks
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == cytokine, ['Metadata_Metadata_Dose'] + features]
+    return _kruskal_batch(sub_df, 'Metadata_Metadata_Dose', cytokine, features, alpha)
+
+def run_kruskal_plates_batch(untr, df, features=None, alpha=0.05):
+    '''
+    This function runs the Kruskal-Wallis and Dunn tests across plates using untreated experiments,
+    the rank based counterparts of run_ANOVA_plates_batch and plate_Tukey_HSD_batch
+    
+    Arguments:
+
+    - untr: specifies the untreated experiments
+    - df: the Pandas DataFrame that stores all the data
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate of the Dunn tests
+    
+    Returns: 
+    
+    - kruskal_df, dunn_df: see kruskal_dunn_from_ranks
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    sub_df = df.loc[df['Metadata_Metadata_Cytokine'] == untr, ['Metadata_Plate'] + features]
+    return _kruskal_batch(sub_df, 'Metadata_Plate', untr, features, alpha)
+
+def run_kruskal_cytokines_batch(df, dose, features=None, alpha=0.05):
+    '''
+    This function runs the Kruskal-Wallis and Dunn tests across different cytokines at the dosage
+    level of interest, the rank based counterparts of run_ANOVA_cytokines_batch and
+    cytokine_Tukey_HSD_batch
+    
+    Arguments:
+
+    - df: the Pandas DataFrame that stores all the data
+    - dose: the dosage level that we are interested in
+    - features: the features we are interested in, every column from the 7th onwards by default
+    - alpha: the family-wise error rate of the Dunn tests
+    
+    Returns: 
+    
+    - kruskal_df, dunn_df: see kruskal_dunn_from_ranks
+    '''
+    features = df.columns[6:].tolist() if features is None else list(features)
+    # We're only looking at our treated cells, so filter out the untreated cells
+    treated = ((df['Metadata_Metadata_Dose'] == dose) &
+               (df['Metadata_Metadata_Cytokine'] != 'untr') & (df['Metadata_Metadata_Cytokine'] != 'untr-50'))
+    sub_df = df.loc[treated, ['Metadata_Metadata_Cytokine'] + features]
+    return _kruskal_batch(sub_df, 'Metadata_Metadata_Cytokine', dose, features, alpha)
@@ -1,6 +1,13 @@
 import plotly.express as px
 import pandas as pd
 
+try:
+    from .sketches import treatment_medians
+    from .aggregates import AGGREGATE_LEVELS, read_grouped
+except ImportError:
+    from sketches import treatment_medians
+    from aggregates import AGGREGATE_LEVELS, read_grouped
+
 def treatment_profiles_heatmap(data, non_numeric_cols=['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'ImageNumber', 'ObjectNumber',
                           'Metadata_Plate', 'Metadata_Well']):
     '''
@@ -8,7 +15,10 @@ def treatment_profiles_heatmap(data, non_numeric_cols=['Metadata_Metadata_Cytoki
     a heatmap showing the similarity between treatment profiles.
     
     Inputs: 
-    1. data: type(DataFrame), The data that will be aggregated.
+    1. data: type(DataFrame, out_of_core.PlateDataset, dict or str), The data that will be aggregated. A dict is the
+    output of sketches.build_sketches, the medians are then approximated by merging the quantile sketches.
+    A str is the path of a cleaned Parquet table, the treatment medians are then read from the aggregate
+    table aggregates.write_aggregates stored next to it.
     2. non_numeric_cols: type(list), Contains a list of the non-numerical columns of the dataframe so that
     the function can avoid taking the median of them when performing the group by. These features will be dropped.
 
@@ -16,15 +26,29 @@ def treatment_profiles_heatmap(data, non_numeric_cols=['Metadata_Metadata_Cytoki
     1. fig: returns the Plotly object representing the heatmap    
     '''
     
-    df_data = data
-    # merge cytokine and dose
-    # Reference: https://stackoverflow.com/questions/19377969/combine-two-columns-of-text-in-pandas-dataframe
-    df_data['Cytokine_and_Dose'] = df_data['Metadata_Metadata_Cytokine'] + "-" + df_data['Metadata_Metadata_Dose'].astype(str)
-    
-    # drop non_numeric columns
-    df_data.drop(columns=non_numeric_cols, inplace=True)
-    
-    df_data_medians = df_data.groupby(['Cytokine_and_Dose']).median()
+    if isinstance(data, pd.DataFrame):
+        df_data = data
+        # merge cytokine and dose
+        # Reference: https://stackoverflow.com/questions/19377969/combine-two-columns-of-text-in-pandas-dataframe
+        df_data['Cytokine_and_Dose'] = df_data['Metadata_Metadata_Cytokine'].astype(str) + "-" + df_data['Metadata_Metadata_Dose'].astype(str)
+        
+        # drop non_numeric columns
+        df_data.drop(columns=non_numeric_cols, inplace=True)
+        
+        df_data_medians = df_data.groupby(['Cytokine_and_Dose']).median()
+    elif isinstance(data, str):
+        # the materialized treatment-level medians, or the cached table grouped when there are none
+        medians = read_grouped(data, AGGREGATE_LEVELS['treatment'], 'median')
+        medians.index = medians['Metadata_Metadata_Cytokine'].astype(str) + "-" + medians['Metadata_Metadata_Dose'].astype(str)
+        medians.index.name = 'Cytokine_and_Dose'
+        df_data_medians = medians.drop(columns=[col for col in medians.columns if col in non_numeric_cols]).sort_index()
+    elif isinstance(data, dict):
+        # quantile sketches (sketches.build_sketches) merge into per treatment medians without the raw data
+        features = [feature for feature in data['features'] if feature not in non_numeric_cols]
+        df_data_medians = treatment_medians(data, features)
+    else:
+        # disk-backed datasets (out_of_core.PlateDataset) compute the medians one feature at a time
+        df_data_medians = data.treatment_medians(non_numeric_cols)
 
     # Need transpose because correlation is computed on columns
     df_data_medians_T = df_data_medians.T
@@ -2,6 +2,11 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.colors import n_colors
 
+try:
+    from .bootstrap import cached_bootstrap_ci
+except ImportError:
+    from bootstrap import cached_bootstrap_ci
+
 def generate_violins(data, col, sd=4):
     '''
     This function returns violin plots to show distributions of subsets of data
@@ -81,7 +86,7 @@ def generate_violins(data, col, sd=4):
 
 #     return fig
 
-def generate_box(data, x, col):
+def generate_box(data, x, col, ci=False, **kwargs):
     '''
     This function returns box-plot of data to view the distribution 
     and potential outliers of the data
@@ -91,6 +96,9 @@ def generate_box(data, x, col):
     - data: the dataframe containing the data
     - x: the variable, usually a metadata, to group by
     - col: the variable that we are interested in
+    - ci: whether to draw the mean of every group with its bootstrap 95% confidence interval
+    - kwargs: passed to bootstrap.cached_bootstrap_ci, the results are kept in memory by default
+    so that redrawing the same selection does not resample again
     
     Returns: 
     
@@ -101,6 +109,14 @@ def generate_box(data, x, col):
     # y = data[col]
     fig.add_trace(go.Box(x=data[x], y=data[col],
                          boxpoints='outliers', marker_size=6, showwhiskers=True))
+    if ci:
+        kwargs.setdefault('use_cache', True)
+        means_df = cached_bootstrap_ci(data, x, [col], **kwargs)[0]
+        fig.add_trace(go.Scatter(x=means_df['Group'], y=means_df['mean'], mode='markers',
+                                 name='Mean (95% CI)', marker=dict(color='black', symbol='diamond'),
+                                 error_y=dict(type='data', symmetric=False,
+                                              array=means_df['upper'] - means_df['mean'],
+                                              arrayminus=means_df['mean'] - means_df['lower'])))
 
     fig.update_layout(
         autosize=True,
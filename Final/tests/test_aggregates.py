@@ -0,0 +1,78 @@
+'''
+Tests that the views reading the materialized aggregate tables give the same results as on the
+object table
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import stats
+from aggregates import aggregate_path, read_grouped, write_aggregates
+from cache import write_cache
+from cube import StatsCube, load_for_stats
+from heatmaps import corr_heatmap_generator
+from treatment_profiling import treatment_profiles_heatmap
+
+FEATURES = ['Granularity_1_CorrActin', 'Granularity_2_CorrActin', 'Intensity_MeanIntensity_CorrActin',
+            'Intensity_MaxIntensity_CorrActin']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 2000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 40, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2', 'D2'], n)})
+    base = rng.normal(size=n)
+    for j, feature in enumerate(FEATURES):
+        data[feature] = base * j + rng.standard_t(4, n)
+    return data
+
+@pytest.fixture(scope='module')
+def path(df, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('cache') / 'pam194ObjCell_clean.parquet')
+    write_cache(df, path)
+    write_aggregates(df, path)
+    return path
+
+def heatmap_values(fig):
+    return np.asarray(fig.data[0].z, dtype=np.float64), list(fig.data[0].x)
+
+def test_read_grouped_falls_back_to_the_object_table(df, path):
+    group_cols = ['Metadata_Metadata_Cytokine', 'Metadata_Well']
+    assert not os.path.exists(aggregate_path(path, 'cytokine_well', 'mean'))
+    expected = df.groupby(group_cols)[df.columns[6:].tolist()].mean().reset_index()
+    pd.testing.assert_frame_equal(read_grouped(path, group_cols, 'mean'), expected)
+
+def test_heatmap_from_the_image_aggregate(df, path):
+    expected = heatmap_values(corr_heatmap_generator(df.copy(), columns_of_interest_for_heatmap='Granularity'))
+    result = heatmap_values(corr_heatmap_generator(path, columns_of_interest_for_heatmap='Granularity'))
+    np.testing.assert_allclose(result[0], expected[0], rtol=1e-12)
+    assert result[1] == expected[1]
+
+def test_treatment_profiles_from_the_treatment_aggregate(df, path):
+    expected = heatmap_values(treatment_profiles_heatmap(df.copy()))
+    result = heatmap_values(treatment_profiles_heatmap(path))
+    np.testing.assert_allclose(result[0], expected[0], rtol=1e-12)
+    assert result[1] == expected[1]
+
+def test_stats_from_the_well_aggregates(df, path):
+    cube = load_for_stats(path)
+    assert isinstance(cube, StatsCube)
+    assert len(cube) == len(df)
+    for cytokine in ['IL17', 'untr']:
+        expected = stats.run_ANOVA_doses_batch(cytokine, df, FEATURES)[0]
+        result = stats.run_ANOVA_doses_batch(cytokine, cube, FEATURES)[0]
+        np.testing.assert_allclose(result['F-stat'], expected['F-stat'], rtol=1e-9)
+        np.testing.assert_allclose(result['P-value'], expected['P-value'], rtol=1e-7)
+    expected = stats.get_ttest_wells_batch(df, FEATURES)
+    result = stats.get_ttest_wells_batch(cube, FEATURES)
+    np.testing.assert_allclose(result['T-Statistic'], expected['T-Statistic'], rtol=1e-9)
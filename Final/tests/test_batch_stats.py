@@ -0,0 +1,165 @@
+'''
+Regression tests of the batched statistics engines against the per-feature scipy and statsmodels
+results they replace. Run from the Final folder with python -m pytest tests
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats as scipy_stats
+from statsmodels.stats.multicomp import pairwise_tukeyhsd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import stats
+from cube import StatsCube
+from out_of_core import PlateDataset
+from permutation import permutation_anova, permutation_ANOVA_doses
+
+CYTOKINES = ['IL17', 'IFNg', 'TNFa', 'untr']
+DOSES = [11, 33, 100]
+WELLS = ['B2', 'C2', 'D2']
+PLATES = ['Plate 1', 'Plate 2']
+FEATURES = ['Feature_0', 'Feature_1', 'Feature_2']
+
+@pytest.fixture(scope='module')
+def df():
+    '''
+    A small cleaned table: metadata in the first 6 columns, a heavy tailed feature, a feature with
+    many ties and a feature with a dose effect for IL17
+    '''
+    rng = np.random.default_rng(0)
+    n = 1800
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(CYTOKINES, n),
+                         'Metadata_Metadata_Dose': rng.choice(DOSES, n),
+                         'Metadata_Plate': rng.choice(PLATES, n),
+                         'Metadata_Well': rng.choice(WELLS, n)})
+    data['Feature_0'] = rng.standard_t(3, n)
+    data['Feature_1'] = rng.normal(size=n).round(1)
+    data['Feature_2'] = rng.normal(size=n) + np.where(data['Metadata_Metadata_Cytokine'] == 'IL17',
+                                                      data['Metadata_Metadata_Dose'] / 100, 0)
+    return data
+
+def f_oneway_by(sub_df, group_col, feature):
+    return scipy_stats.f_oneway(*[g[feature] for _, g in sub_df.groupby(group_col)])
+
+def test_anova_batch_matches_f_oneway(df):
+    final_df, power = stats.run_ANOVA_doses_batch('IL17', df, FEATURES)
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17']
+    for _, row in final_df.iterrows():
+        F, p = f_oneway_by(sub_df, 'Metadata_Metadata_Dose', row['Feature'])
+        assert row['F-stat'] == pytest.approx(F, rel=1e-9)
+        assert row['P-value'] == pytest.approx(p, rel=1e-7)
+    assert final_df['N'].tolist() == [len(sub_df)] * len(FEATURES)
+
+def test_tukey_batch_matches_pairwise_tukeyhsd(df):
+    rs = stats.doses_Tukey_HSD_batch('IL17', df, FEATURES)
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17']
+    for feature in FEATURES:
+        res = pairwise_tukeyhsd(sub_df[feature], sub_df['Metadata_Metadata_Dose'], alpha=0.05)
+        mine = rs[rs['Feature'] == feature]
+        np.testing.assert_allclose(mine['meandiff'], res.meandiffs, rtol=1e-9)
+        np.testing.assert_allclose(mine['lower'], res.confint[:, 0], rtol=1e-9)
+        np.testing.assert_allclose(mine['upper'], res.confint[:, 1], rtol=1e-9)
+        np.testing.assert_allclose(mine['p-adj'], res.pvalues, atol=2e-4)
+        assert mine['reject'].tolist() == list(res.reject)
+
+@pytest.mark.parametrize('k, dof', [(3, 10), (8, 30), (3, 1000)])
+def test_studentized_range_sf_error_bound(k, dof):
+    q = np.linspace(0.5, 7, 30)
+    np.testing.assert_allclose(stats.studentized_range_sf(q, k, dof), scipy_stats.studentized_range.sf(q, k, dof),
+                               atol=2e-4)
+
+def test_ttest_wells_batch_matches_ttest_ind(df):
+    ttest_df = stats.get_ttest_wells_batch(df, FEATURES, cytokines=['IL17', 'TNFa'])
+    assert len(ttest_df) == 2 * len(DOSES) * 3 * len(FEATURES)
+    for _, row in ttest_df.iloc[::5].iterrows():
+        sub_df = df[(df['Metadata_Metadata_Cytokine'] == row['Cytokine']) & (df['Metadata_Metadata_Dose'] == row['Dose'])]
+        result = scipy_stats.ttest_ind(sub_df.loc[sub_df['Metadata_Well'] == row['Well 1'], row['Feature']],
+                                       sub_df.loc[sub_df['Metadata_Well'] == row['Well 2'], row['Feature']],
+                                       equal_var=False)
+        assert row['T-Statistic'] == pytest.approx(result.statistic, rel=1e-9)
+        assert row['p-value'] == pytest.approx(result.pvalue, rel=1e-7)
+
+def test_cube_answers_like_the_frame(df):
+    # an offset makes the cube's shifted sums matter
+    shifted = df.copy()
+    shifted[FEATURES] = shifted[FEATURES] * 100 + 1e6
+    cube = StatsCube.from_frame(shifted, FEATURES)
+    for label in ['IL17', 'untr']:
+        expected = stats.run_ANOVA_doses_batch(label, shifted, FEATURES)[0]
+        result = stats.run_ANOVA_doses_batch(label, cube, FEATURES)[0]
+        np.testing.assert_allclose(result['F-stat'], expected['F-stat'], rtol=1e-6)
+    expected = stats.run_ANOVA_plates('untr', 'Feature_2', shifted)[0]
+    result = stats.run_ANOVA_plates('untr', 'Feature_2', cube)[0]
+    assert result['F-stat'][0] == pytest.approx(expected['F-stat'][0], rel=1e-6)
+    expected = stats.get_ttest_wells_batch(shifted, FEATURES)
+    result = stats.get_ttest_wells_batch(cube, FEATURES)
+    np.testing.assert_allclose(result['T-Statistic'], expected['T-Statistic'], rtol=1e-6)
+    for cytokine in ['IL17', 'IFNg']:
+        expected = stats.get_ttest_wells(cytokine, 'Feature_0', shifted)
+        result = stats.get_ttest_wells(cytokine, 'Feature_0', cube)
+        assert result['Well Comparison'].iloc[0] == expected['Well Comparison'].iloc[0]
+        assert result['T-Statistic'].iloc[0] == pytest.approx(expected['T-Statistic'].iloc[0], abs=1e-3)
+
+def test_backends_compare_the_first_wells_to_appear(df, tmp_path):
+    # the wells appear in reverse sorted order, on every plate
+    reordered = df.sort_values('Metadata_Well', ascending=False, kind='stable').reset_index(drop=True)
+    cube = StatsCube.from_frame(reordered, FEATURES)
+    dataset = PlateDataset.write(reordered, str(tmp_path / 'dataset'))
+    for cytokine in ['IL17', 'IFNg']:
+        expected = stats.get_ttest_wells(cytokine, 'Feature_0', reordered)
+        assert expected['Well Comparison'].iloc[0] == 'D2 vs C2'
+        for backend in [cube, dataset]:
+            result = stats.get_ttest_wells(cytokine, 'Feature_0', backend)
+            assert result['Well Comparison'].iloc[0] == expected['Well Comparison'].iloc[0]
+            assert result['T-Statistic'].iloc[0] == pytest.approx(expected['T-Statistic'].iloc[0], abs=1e-3)
+            assert result['p-value'].iloc[0] == pytest.approx(expected['p-value'].iloc[0], abs=1e-3)
+
+def test_permutation_anova(df):
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17']
+    values = sub_df[FEATURES].to_numpy()
+    labels = sub_df['Metadata_Metadata_Dose'].to_numpy()
+    F, p = permutation_anova(values, labels, n_permutations=200, seed=1, chunk_size=200)
+    F_chunked, p_chunked = permutation_anova(values, labels, n_permutations=200, seed=1, chunk_size=23)
+    for j, feature in enumerate(FEATURES):
+        assert F[j] == pytest.approx(f_oneway_by(sub_df, 'Metadata_Metadata_Dose', feature)[0], rel=1e-9)
+    np.testing.assert_array_equal(p, p_chunked)
+    # the dose effect of Feature_2 is never reached by a permutation
+    assert p[2] == pytest.approx(1 / 201)
+    assert permutation_ANOVA_doses('IL17', df, FEATURES, n_permutations=200, seed=1)['P-value'].tolist() == p.tolist()
+
+def test_kruskal_batch_matches_scipy(df):
+    kruskal_df, dunn_df = stats.run_kruskal_doses_batch('IL17', df, FEATURES)
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17']
+    for _, row in kruskal_df.iterrows():
+        result = scipy_stats.kruskal(*[g[row['Feature']] for _, g in sub_df.groupby('Metadata_Metadata_Dose')])
+        assert row['H-stat'] == pytest.approx(result.statistic, rel=1e-9)
+        assert row['P-value'] == pytest.approx(result.pvalue, rel=1e-7)
+    assert len(dunn_df) == 3 * len(FEATURES)
+
+def test_kruskal_batch_with_ties_and_missing_labels(df):
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17'].copy()
+    sub_df['Metadata_Metadata_Dose'] = sub_df['Metadata_Metadata_Dose'].astype(float)
+    sub_df.iloc[:7, sub_df.columns.get_loc('Metadata_Metadata_Dose')] = np.nan
+    kruskal_df, dunn_df = stats.run_kruskal_doses_batch('IL17', sub_df, ['Feature_1'])
+    labelled = sub_df.dropna(subset=['Metadata_Metadata_Dose'])
+    result = scipy_stats.kruskal(*[g['Feature_1'] for _, g in labelled.groupby('Metadata_Metadata_Dose')])
+    assert kruskal_df['H-stat'][0] == pytest.approx(result.statistic, rel=1e-9)
+    assert kruskal_df['N'][0] == len(labelled)
+
+def test_permutation_anova_with_missing_labels(df):
+    sub_df = df[df['Metadata_Metadata_Cytokine'] == 'IL17'].copy()
+    sub_df['Metadata_Metadata_Dose'] = sub_df['Metadata_Metadata_Dose'].astype(float)
+    sub_df.iloc[:7, sub_df.columns.get_loc('Metadata_Metadata_Dose')] = np.nan
+    result = permutation_ANOVA_doses('IL17', sub_df, FEATURES, n_permutations=200, seed=1)
+    labelled = sub_df.dropna(subset=['Metadata_Metadata_Dose'])
+    expected = permutation_ANOVA_doses('IL17', labelled, FEATURES, n_permutations=200, seed=1)
+    pd.testing.assert_frame_equal(result, expected)
+    for _, row in result.iterrows():
+        assert row['F-stat'] == pytest.approx(f_oneway_by(labelled, 'Metadata_Metadata_Dose', row['Feature'])[0], rel=1e-9)
+    assert result['N'].tolist() == [len(labelled)] * len(FEATURES)
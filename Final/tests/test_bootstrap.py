@@ -0,0 +1,111 @@
+'''
+Tests of the bootstrap engine: the resampled means against a direct resampling loop, the
+independence from the chunk size and the keying of the memory and disk caches
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import bootstrap
+from bootstrap import bootstrap_ci, bootstrap_group_means, cached_bootstrap_ci
+from violinPlots import generate_box
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 600
+    data = pd.DataFrame({'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n)})
+    data['Feature_0'] = rng.standard_t(3, n) + data['Metadata_Metadata_Dose'] / 50
+    data['Feature_1'] = rng.normal(size=n)
+    return data
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(bootstrap, '_cache', type(bootstrap._cache)())
+    return bootstrap._cache
+
+def test_resampled_means_match_a_direct_resampling(df):
+    values = df[['Feature_0', 'Feature_1']].to_numpy()
+    labels = df['Metadata_Metadata_Dose'].to_numpy()
+    groups, boot = bootstrap_group_means(values, labels, n_boot=20, seed=3, chunk_size=6)
+    assert groups.tolist() == [11, 33, 100]
+    for g, group in enumerate(groups):
+        index = np.flatnonzero(labels == group)
+        stream = np.random.default_rng([3, g])
+        for start in range(0, 20, 6):
+            draws = stream.integers(0, len(index), size=(min(6, 20 - start), len(index)))
+            np.testing.assert_allclose(boot[start:start + 6, g], values[index][draws].mean(axis=1), rtol=1e-12)
+
+def test_results_do_not_depend_on_the_chunk_size(df):
+    values = df[['Feature_0', 'Feature_1']].to_numpy()
+    labels = df['Metadata_Metadata_Dose']
+    expected = bootstrap_ci(values, labels, ['Feature_0', 'Feature_1'], n_boot=200, chunk_size=200)
+    for chunk_size in [1, 7, 64]:
+        result = bootstrap_ci(values, labels, ['Feature_0', 'Feature_1'], n_boot=200, chunk_size=chunk_size)
+        pd.testing.assert_frame_equal(result[0], expected[0], check_exact=False, rtol=1e-12)
+        pd.testing.assert_frame_equal(result[1], expected[1], check_exact=False, rtol=1e-12)
+
+def test_means_are_inside_their_intervals(df):
+    means_df, diffs_df = bootstrap_ci(df[['Feature_0']].to_numpy(), df['Metadata_Metadata_Dose'], ['Feature_0'],
+                                      n_boot=500)
+    assert ((means_df['lower'] <= means_df['mean']) & (means_df['mean'] <= means_df['upper'])).all()
+    # the dose effect of Feature_0 separates 11 and 100
+    pair = diffs_df[(diffs_df['group1'] == 11) & (diffs_df['group2'] == 100)]
+    assert pair['lower'].iloc[0] > 0
+
+def test_memory_cache_is_opt_in_and_bounded(df, empty_cache, monkeypatch):
+    monkeypatch.setattr(bootstrap, 'CACHE_SIZE', 2)
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50)
+    assert len(empty_cache) == 0
+
+    first = cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, seed=0, use_cache=True)
+    second = cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, seed=1, use_cache=True)
+    assert len(empty_cache) == 2
+    # a hit returns the stored result and makes it the most recently used
+    assert cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, seed=0, use_cache=True) is first
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, seed=2, use_cache=True)
+    assert len(empty_cache) == 2
+    assert any(result is first for result in empty_cache.values())
+    assert not any(result is second for result in empty_cache.values())
+
+def test_cache_keys_follow_the_data_and_parameters(df, empty_cache):
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, use_cache=True)
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=60, use_cache=True)
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_1'], n_boot=50, use_cache=True)
+    changed = df.copy()
+    changed.loc[0, 'Feature_0'] += 1
+    cached_bootstrap_ci(changed, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, use_cache=True)
+    assert len(empty_cache) == 4
+    # the chunk size does not change the result, so it is not part of the key
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, chunk_size=7, use_cache=True)
+    assert len(empty_cache) == 4
+
+def test_disk_cache_is_read_back(df, empty_cache, tmp_path):
+    expected = cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, cache_dir=str(tmp_path))
+    files = os.listdir(tmp_path)
+    assert len(files) == 1
+    assert len(empty_cache) == 0
+
+    # a marked copy of the stored result shows that the second call reads the file
+    path = os.path.join(tmp_path, files[0])
+    stored = pd.read_pickle(path)
+    pd.testing.assert_frame_equal(stored[0], expected[0])
+    stored[0]['mean'] = -1.0
+    pd.to_pickle(stored, path)
+    result = cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=50, cache_dir=str(tmp_path))
+    assert (result[0]['mean'] == -1.0).all()
+
+    cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=60, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 2
+
+def test_box_plot_draws_the_intervals(df, empty_cache):
+    fig = generate_box(df, 'Metadata_Metadata_Dose', 'Feature_0', ci=True, n_boot=100)
+    means_df = cached_bootstrap_ci(df, 'Metadata_Metadata_Dose', ['Feature_0'], n_boot=100, use_cache=True)[0]
+    assert len(fig.data) == 2
+    np.testing.assert_allclose(fig.data[1].y, means_df['mean'])
+    np.testing.assert_allclose(np.asarray(fig.data[1].y) + np.asarray(fig.data[1].error_y.array), means_df['upper'])
@@ -0,0 +1,61 @@
+'''
+Tests of the Parquet cache: column projection by feature group from a path and from an in-memory
+buffer such as a dashboard upload
+'''
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cache import read_cache, read_manifest, write_cache
+
+FEATURES = ['AreaShape_Area', 'Granularity_1_CorrActin', 'Intensity_MeanIntensity_CorrActin',
+            'Texture_Contrast_CorrActin_3_00_256', 'Texture_Variance_CorrActin_3_00_256']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 200
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 20, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for feature in FEATURES:
+        data[feature] = rng.normal(size=n)
+    return data
+
+@pytest.fixture(scope='module')
+def path(df, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('cache') / 'pam194ObjCell_clean.parquet')
+    write_cache(df, path)
+    return path
+
+def test_round_trip(df, path):
+    pd.testing.assert_frame_equal(read_cache(path), df)
+    result = read_cache(path, group='Texture_Contrast', columns=['AreaShape_Area'])
+    assert result.columns.tolist() == df.columns[:6].tolist() + ['Texture_Contrast_CorrActin_3_00_256',
+                                                                 'AreaShape_Area']
+
+def test_projection_from_a_buffer(df, path):
+    with open(path, 'rb') as f:
+        buffer = io.BytesIO(f.read())
+    assert read_manifest(buffer) == read_manifest(path)
+    result = read_cache(buffer, group=['Granularity', 'Texture', 'Area'])
+    expected = df[df.columns[:6].tolist() + ['Granularity_1_CorrActin', 'Texture_Contrast_CorrActin_3_00_256',
+                                             'Texture_Variance_CorrActin_3_00_256', 'AreaShape_Area']]
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_projection_without_a_manifest(df):
+    # a table that was not written by write_cache is grouped by its column names
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    buffer.seek(0)
+    result = read_cache(buffer, group='Intensity')
+    pd.testing.assert_frame_equal(result, df[df.columns[:6].tolist() + ['Intensity_MeanIntensity_CorrActin']])
@@ -0,0 +1,81 @@
+'''
+Tests of the blockwise correlation against DataFrame.corr and of the correlation pruning
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from dimensionality_reduction import blockwise_correlation, prune_correlated_features
+from schema import feature_group
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 2000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    base = rng.normal(size=n)
+    data['Granularity_1_CorrActin'] = base
+    data['Granularity_2_CorrActin'] = rng.normal(size=n)
+    data['Granularity_3_CorrActin'] = base * 3 + 0.1 * rng.normal(size=n)
+    data['Texture_Contrast_CorrActin_3_00_256'] = base + 0.05 * rng.normal(size=n)
+    data['Texture_Contrast_CorrActin_3_01_256'] = -base + 0.05 * rng.normal(size=n)
+    data['Texture_Variance_CorrActin_3_00_256'] = base + 0.05 * rng.normal(size=n)
+    data['Intensity_MeanIntensity_CorrActin'] = 1e3 + rng.exponential(size=n)
+    for col, fraction in [('Granularity_2_CorrActin', 0.1), ('Texture_Contrast_CorrActin_3_01_256', 0.3)]:
+        data.loc[rng.random(n) < fraction, col] = np.nan
+    return data
+
+def test_feature_group():
+    assert feature_group('Granularity_1_CorrActin') == 'Granularity'
+    assert feature_group('Texture_Contrast_CorrActin_3_00_256') == 'Texture_Contrast'
+    assert feature_group('RadialDistribution_MeanFrac_CorrActin_1of4') == 'RadialDistribution_MeanFrac'
+
+@pytest.mark.parametrize('block_size', [97, 100000])
+def test_blockwise_correlation_matches_pandas(df, block_size):
+    features = df.columns[6:].tolist()
+    expected = df[features].corr().to_numpy()
+    result = blockwise_correlation(df, block_size=block_size, columns=features)
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+    np.testing.assert_allclose(blockwise_correlation(df[features].to_numpy(), block_size=block_size), expected,
+                               atol=1e-5)
+
+def greedy_pruning(df, features, threshold):
+    # the notebook rule with DataFrame.corr, one feature group at a time
+    kept = []
+    for group in dict.fromkeys(feature_group(feature) for feature in features):
+        columns = [feature for feature in features if feature_group(feature) == group]
+        corr = df[columns].corr().abs()
+        group_kept = []
+        for col in columns:
+            if all(corr.loc[col, other] <= threshold for other in group_kept):
+                group_kept.append(col)
+        kept.extend(group_kept)
+    return [feature for feature in features if feature in kept]
+
+def test_pruning_is_deterministic(df):
+    features = df.columns[6:].tolist()
+    kept, dropped = prune_correlated_features(df, threshold=0.9)
+    assert kept == greedy_pruning(df, features, 0.9)
+    assert kept == ['Granularity_1_CorrActin', 'Granularity_2_CorrActin', 'Texture_Contrast_CorrActin_3_00_256',
+                    'Texture_Variance_CorrActin_3_00_256', 'Intensity_MeanIntensity_CorrActin']
+    assert sorted(kept + dropped) == sorted(features)
+    # neither the block size, nor the column order within other groups, nor a rerun change the result
+    assert prune_correlated_features(df, threshold=0.9, block_size=101) == (kept, dropped)
+    assert prune_correlated_features(df, threshold=0.9) == (kept, dropped)
+    reordered = df[df.columns[:6].tolist() + features[::-1]]
+    assert sorted(prune_correlated_features(reordered, threshold=0.9)[0]) == sorted(
+        greedy_pruning(df, features[::-1], 0.9))
+
+def test_pruning_across_groups(df):
+    kept, dropped = prune_correlated_features(df, threshold=0.9, by_prefix=False)
+    assert kept == ['Granularity_1_CorrActin', 'Granularity_2_CorrActin', 'Intensity_MeanIntensity_CorrActin']
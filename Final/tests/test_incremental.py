@@ -0,0 +1,69 @@
+'''
+Tests of the incremental statistics: merging against a full recompute, the Parquet store and
+appending plates one at a time
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from incremental import append_plate, group_moments, load_moments, merge_moments, save_moments, score_outliers
+
+PLATES = ['Plate 1', 'Plate 2', 'Plate 3']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(PLATES, n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for j in range(4):
+        data['Feature_' + str(j)] = rng.standard_t(3, n) * 10 + 100
+    data.loc[rng.random(n) < 0.05, 'Feature_2'] = np.nan
+    # a group that only one plate has
+    data.loc[(data['Metadata_Plate'] == 'Plate 3') & (data['Metadata_Well'] == 'C2'), 'Metadata_Well'] = 'D2'
+    return data
+
+def assert_moments_equal(result, expected):
+    for stat in ['count', 'mean', 'm2']:
+        pd.testing.assert_frame_equal(result[stat].sort_index(), expected[stat].sort_index(),
+                                      check_exact=False, rtol=1e-9, check_dtype=(stat == 'count'))
+
+def test_merged_moments_match_a_full_recompute(df):
+    parts = [df[df['Metadata_Plate'] == plate] for plate in PLATES]
+    merged = group_moments(parts[0])
+    for part in parts[1:]:
+        merged = merge_moments(merged, group_moments(part))
+    assert_moments_equal(merged, group_moments(df))
+
+def test_store_round_trip(df, tmp_path):
+    moments = group_moments(df)
+    path = str(tmp_path / 'moments.parquet')
+    save_moments(moments, path)
+    assert_moments_equal(load_moments(path), moments)
+
+def test_append_plate_matches_a_full_recompute(df, tmp_path):
+    store_path = str(tmp_path / 'moments.parquet')
+    for plate in PLATES:
+        new_data = df[df['Metadata_Plate'] == plate].copy()
+        outliers, sub_data, moments = append_plate(new_data, sd=2, thresh=0.25, store_path=store_path)
+
+    full = group_moments(df)
+    assert_moments_equal(load_moments(store_path), full)
+    assert_moments_equal(moments, full)
+
+    # the last plate is scored against the statistics of all the plates
+    last = df[df['Metadata_Plate'] == PLATES[-1]].copy()
+    measurements = last.columns[6:]
+    last[measurements] = last[measurements].fillna(df[measurements].mean())
+    expected_outliers, expected_kept = score_outliers(last, full, 2, 0.25)
+    assert outliers['ObjectNumber'].tolist() == expected_outliers['ObjectNumber'].tolist()
+    assert sub_data['ObjectNumber'].tolist() == expected_kept['ObjectNumber'].tolist()
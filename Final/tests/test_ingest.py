@@ -0,0 +1,68 @@
+'''
+Tests of the streaming cleaner against drop_columns and replace_NA on the whole table
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from ingest import kept_columns, stream_clean_csv
+from preprocessing import drop_columns, replace_NA
+
+@pytest.fixture(scope='module')
+def csv_path(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n = 500
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 20, n),
+                         'ObjectNumber': np.arange(n),
+                         'FileName_Actin': 'image.tiff',
+                         'Metadata_Date': '2021-01-01',
+                         'Metadata_FileLocation': 'file://image.tiff',
+                         'Metadata_Frame': 0,
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Run': 1,
+                         'Metadata_Series': 0,
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n),
+                         'PathName_Actin': '/images'})
+    for j in range(4):
+        data['Feature_' + str(j)] = rng.normal(size=n)
+    data.loc[rng.random(n) < 0.1, 'Feature_1'] = np.nan
+    data.loc[rng.random(n) < 0.3, 'Feature_3'] = np.nan
+    path = str(tmp_path_factory.mktemp('raw') / 'pam194ObjCell.csv')
+    data.to_csv(path, index=False)
+    return path
+
+@pytest.mark.parametrize('chunksize', [37, 100000])
+def test_streamed_output_matches_the_in_memory_cleaning(csv_path, tmp_path, chunksize):
+    expected = pd.read_csv(csv_path)
+    drop_columns(expected)
+    replace_NA(expected)
+
+    output_path = str(tmp_path / 'clean.csv')
+    means = stream_clean_csv(csv_path, output_path, chunksize=chunksize)
+    result = pd.read_csv(output_path)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+    assert means.index.tolist() == expected.columns[6:].tolist()
+
+def test_header_only_input_writes_the_header(csv_path, tmp_path):
+    header_path = str(tmp_path / 'header.csv')
+    pd.read_csv(csv_path, nrows=0).to_csv(header_path, index=False)
+    output_path = str(tmp_path / 'clean.csv')
+    stream_clean_csv(header_path, output_path)
+    result = pd.read_csv(output_path)
+    assert len(result) == 0
+    assert result.columns.tolist() == kept_columns(csv_path)
+
+def test_empty_input_writes_an_empty_file(tmp_path):
+    empty_path = str(tmp_path / 'empty.csv')
+    open(empty_path, 'w').close()
+    output_path = str(tmp_path / 'clean.csv')
+    means = stream_clean_csv(empty_path, output_path)
+    assert os.path.getsize(output_path) == 0
+    assert len(means) == 0
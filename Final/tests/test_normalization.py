@@ -0,0 +1,87 @@
+'''
+Tests of the plate normalization to the untreated controls
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from normalization import (IQR_SCALE, control_parameters, load_control_parameters, normalize_to_controls,
+                           save_control_parameters)
+from schema import compact_dtypes
+
+FEATURES = ['Feature_0', 'Feature_1', 'Feature_2']
+PLATES = ['Plate 1', 'Plate 2', 'Plate 3']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(PLATES, n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    # every plate has its own offset and gain
+    offset = data['Metadata_Plate'].map(dict(zip(PLATES, [0.0, 5.0, -3.0])))
+    gain = data['Metadata_Plate'].map(dict(zip(PLATES, [1.0, 2.0, 0.5])))
+    for feature in FEATURES:
+        data[feature] = 50 + offset + gain * rng.standard_t(4, n)
+    return data
+
+@pytest.mark.parametrize('robust', [True, False])
+def test_parameters_match_the_controls_of_every_plate(df, robust):
+    params = control_parameters(df, FEATURES, robust=robust)
+    for plate in PLATES:
+        ctrl = df[(df['Metadata_Plate'] == plate) & (df['Metadata_Metadata_Cytokine'] == 'untr')][FEATURES]
+        if robust:
+            location = ctrl.median()
+            scale = (ctrl.quantile(0.75) - ctrl.quantile(0.25)) / IQR_SCALE
+        else:
+            location, scale = ctrl.mean(), ctrl.std()
+        np.testing.assert_allclose(params.loc[('location', plate)], location, rtol=1e-12)
+        np.testing.assert_allclose(params.loc[('scale', plate)], scale, rtol=1e-12)
+
+def test_zscore_round_trip(df):
+    params = control_parameters(df, FEATURES)
+    normalized = normalize_to_controls(df, params)
+    pd.testing.assert_frame_equal(normalized[df.columns[:6]], df[df.columns[:6]])
+
+    # the controls of every plate are centred and scaled to one
+    ctrl = normalized[normalized['Metadata_Metadata_Cytokine'] == 'untr']
+    np.testing.assert_allclose(ctrl.groupby('Metadata_Plate')[FEATURES].median(), 0, atol=1e-12)
+
+    # undoing the transform with the parameters of every object's plate gives the data back
+    location = params.loc['location'].loc[df['Metadata_Plate']].to_numpy()
+    scale = params.loc['scale'].loc[df['Metadata_Plate']].to_numpy()
+    np.testing.assert_allclose(normalized[FEATURES].to_numpy() * scale + location, df[FEATURES], rtol=1e-12)
+
+def test_percent_of_control(df):
+    params = control_parameters(df, FEATURES, robust=False)
+    normalized = normalize_to_controls(df, params, method='percent')
+    ctrl = normalized[normalized['Metadata_Metadata_Cytokine'] == 'untr']
+    np.testing.assert_allclose(ctrl.groupby('Metadata_Plate')[FEATURES].mean(), 100, rtol=1e-12)
+
+def test_cached_parameters_and_compact_frames(df, tmp_path):
+    params = control_parameters(df, FEATURES)
+    path = str(tmp_path / 'controls.pkl')
+    save_control_parameters(params, path)
+    expected = normalize_to_controls(df, params)
+    pd.testing.assert_frame_equal(normalize_to_controls(df, load_control_parameters(path)), expected)
+
+    compact = compact_dtypes(df)
+    result = normalize_to_controls(compact, control_parameters(compact, FEATURES))
+    assert result['Feature_0'].dtype == np.float32
+    np.testing.assert_allclose(result[FEATURES], expected[FEATURES], atol=1e-3)
+
+def test_unknown_plate_and_method(df):
+    params = control_parameters(df[df['Metadata_Plate'] != 'Plate 3'], FEATURES)
+    with pytest.raises(ValueError, match='Plate 3'):
+        normalize_to_controls(df, params)
+    with pytest.raises(ValueError):
+        normalize_to_controls(df, params, method='ratio')
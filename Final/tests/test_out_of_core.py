@@ -0,0 +1,75 @@
+'''
+Tests of the plate partitioned dataset: the out-of-core outlier detection and treatment medians
+against the in-memory functions
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from out_of_core import PlateDataset
+from preprocessing import outlier_detection
+
+FEATURES = ['Feature_0', 'Feature_1', 'Feature_2', 'Feature_3']
+NON_NUMERIC = ['ImageNumber', 'ObjectNumber', 'Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose',
+               'Metadata_Plate', 'Metadata_Well']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2', 'Plate 3'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for feature in FEATURES:
+        data[feature] = rng.standard_t(3, n)
+    return data
+
+@pytest.fixture
+def dataset(df, tmp_path):
+    return PlateDataset.write(df, str(tmp_path / 'dataset'))
+
+def sorted_objects(frame):
+    return frame.sort_values('ObjectNumber').reset_index(drop=True)
+
+def test_outlier_detection_matches_the_frame(df, dataset):
+    expected_outliers, expected_kept = outlier_detection(df, 2, 0.25)
+    outliers, kept = outlier_detection(dataset, 2, 0.25)
+    assert len(outliers) > 0
+    pd.testing.assert_frame_equal(sorted_objects(outliers), sorted_objects(expected_outliers))
+    pd.testing.assert_frame_equal(sorted_objects(kept.read()), sorted_objects(expected_kept))
+
+def test_outlier_detection_replaces_a_previous_output(df, dataset):
+    first = outlier_detection(dataset, 2, 0.25)[1]
+    second = outlier_detection(dataset, 3, 0.25)[1]
+    assert second.directory == first.directory
+    assert len(second) == len(outlier_detection(df, 3, 0.25)[1])
+    assert not os.path.exists(os.path.normpath(first.directory) + '.tmp')
+
+def test_outlier_detection_rejects_mad(dataset):
+    with pytest.raises(ValueError, match="method='mad'"):
+        outlier_detection(dataset, 2, 0.25, method='mad')
+    with pytest.raises(ValueError):
+        dataset.outlier_detection(2, 0.25, output_directory=dataset.directory)
+
+def test_treatment_medians_read_every_partition_once(df, dataset, monkeypatch):
+    key = df['Metadata_Metadata_Cytokine'] + '-' + df['Metadata_Metadata_Dose'].astype(str)
+    expected = df[FEATURES].groupby(key.rename('Cytokine_and_Dose')).median()
+
+    reads = []
+    read_partition = PlateDataset.read_partition
+    monkeypatch.setattr(PlateDataset, 'read_partition',
+                        lambda self, plate, columns=None: reads.append(plate) or read_partition(self, plate, columns))
+    pd.testing.assert_frame_equal(dataset.treatment_medians(NON_NUMERIC), expected)
+    assert sorted(reads) == sorted(dataset.plates)
+
+    reads.clear()
+    pd.testing.assert_frame_equal(dataset.treatment_medians(NON_NUMERIC, features_per_pass=3), expected)
+    assert len(reads) == 2 * len(dataset.plates)
@@ -0,0 +1,103 @@
+'''
+Tests of the cached pipeline: resuming from the cache, invalidation by parameters and by code,
+stages that are not plain functions and interrupted cache writes
+'''
+import functools
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import preprocessing
+from fingerprint import callable_name, code_fingerprint
+from pipeline import Pipeline, outlier_stage
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 1000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for j in range(4):
+        data['Feature_' + str(j)] = rng.standard_t(3, n)
+    return data
+
+def scale_stage(data, factor=1.0):
+    data = data.copy()
+    data[data.columns[6:]] *= factor
+    return data
+
+class Shift:
+    def __init__(self, offset):
+        self.offset = offset
+
+    def __call__(self, data):
+        data = data.copy()
+        data[data.columns[6:]] += self.offset
+        return data
+
+def detect(data):
+    return preprocessing.outlier_detection(data, 3, 0.25)[1]
+
+def statuses(pipe):
+    return [(name, status) for name, status, seconds in pipe.last_run]
+
+def test_resume_and_invalidation(df, tmp_path):
+    def pipeline(sd):
+        return (Pipeline(str(tmp_path))
+                .add('scale', scale_stage, factor=2.0)
+                .add('outliers', outlier_stage, sd=sd, thresh=0.25)
+                .add('shift', Shift(1.0)))
+
+    pipe = pipeline(3)
+    expected = pipe.run(df)
+    assert statuses(pipe) == [('scale', 'computed'), ('outliers', 'computed'), ('shift', 'computed')]
+    pd.testing.assert_frame_equal(pipe.run(df), expected)
+    assert statuses(pipe) == [('shift', 'cached')]
+
+    # a new parameter only reruns its stage and the ones after it
+    pipe = pipeline(4)
+    pipe.run(df)
+    assert statuses(pipe) == [('scale', 'cached'), ('outliers', 'computed'), ('shift', 'computed')]
+    pipe.run(df, until='outliers')
+    assert statuses(pipe) == [('outliers', 'cached')]
+
+    changed = df.copy()
+    changed.loc[0, 'Feature_0'] += 1
+    pipe.run(changed)
+    assert statuses(pipe)[0] == ('scale', 'computed')
+
+def test_partial_and_callable_stages(df, tmp_path):
+    pipe = (Pipeline(str(tmp_path))
+            .add('scale', functools.partial(scale_stage, factor=3.0))
+            .add('shift', Shift(1.0)))
+    result = pipe.run(df)
+    expected = df[df.columns[6:]] * 3.0 + 1.0
+    pd.testing.assert_frame_equal(result[df.columns[6:]], expected)
+    pipe.run(df)
+    assert statuses(pipe) == [('shift', 'cached')]
+
+    assert callable_name(functools.partial(scale_stage, factor=3.0)) != callable_name(functools.partial(scale_stage, factor=2.0))
+    assert callable_name(Shift(1.0)) != callable_name(Shift(2.0))
+    assert code_fingerprint(Shift(1.0)) == code_fingerprint(Shift)
+
+def test_module_attribute_calls_are_fingerprinted(monkeypatch):
+    before = code_fingerprint(detect)
+    assert code_fingerprint(detect) == before
+    # detect calls preprocessing.outlier_detection, whose code is part of the fingerprint
+    monkeypatch.setattr(preprocessing, 'outlier_detection', preprocessing.robust_outlier_mask)
+    assert code_fingerprint(detect) != before
+
+def test_failed_cache_write_leaves_no_file(df, tmp_path):
+    pipe = Pipeline(str(tmp_path)).add('unpicklable', lambda data: lambda: data)
+    with pytest.raises(Exception):
+        pipe.run(df)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,46 @@
+'''
+Tests of the vectorized power analysis against statsmodels
+'''
+import os
+import sys
+
+import numpy as np
+import pytest
+from statsmodels.stats.power import FTestAnovaPower, TTestPower
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from power import anova_power, power_table, ttest_power
+
+@pytest.mark.parametrize('effect_size', [0.1, 0.5, 1.0])
+def test_ttest_power_matches_statsmodels(effect_size):
+    nobs = np.arange(2, 300)
+    expected = np.array([TTestPower().power(effect_size, n, 0.05) for n in nobs])
+    result = ttest_power(nobs, effect_size)
+    finite = np.isfinite(expected)
+    np.testing.assert_allclose(result[finite], expected[finite], rtol=1e-10)
+    # where the noncentral t gives NaN the power is 1 to many decimals
+    assert np.all(result[~finite] > 1 - 1e-6)
+    for n in [2, 17, 250]:
+        assert ttest_power(n, effect_size) == pytest.approx(float(TTestPower().power(effect_size, n, 0.05)), rel=1e-10)
+
+def test_ttest_power_keeps_the_shape():
+    nobs = np.array([[10, 20], [10, 700]])
+    result = ttest_power(nobs)
+    assert result.shape == (2, 2)
+    assert result[0, 0] == result[1, 0]
+    assert np.isfinite(result).all()
+    assert isinstance(ttest_power(10), float)
+
+def test_anova_power_matches_statsmodels():
+    nobs = np.array([20, 60, 60, 200])
+    k_groups = np.array([2, 3, 4, 3])
+    expected = [FTestAnovaPower().power(0.25, n, 0.05, k_groups=k) for n, k in zip(nobs, k_groups)]
+    np.testing.assert_allclose(anova_power(nobs, k_groups), expected, rtol=1e-10)
+    assert anova_power(60, 3) == pytest.approx(expected[1], rel=1e-10)
+
+def test_power_table():
+    table = power_table([10, 50], [0.2, 0.5])
+    assert table.loc[50.0, 0.5] == pytest.approx(ttest_power(50, 0.5))
+    table = power_table([30, 90], [0.25], k_groups=3)
+    assert table.loc[90.0, 0.25] == pytest.approx(anova_power(90, 3))
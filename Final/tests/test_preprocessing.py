@@ -0,0 +1,77 @@
+'''
+Tests of the outlier detection of preprocessing.py against the original per-group, per-feature
+loop and of the bit-packed flags against the boolean outlier matrix
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from preprocessing import (flag_counts, flagged_features, outlier_detection, outlier_flags, outlier_mask,
+                           replace_outliers_with_sd)
+
+@pytest.fixture(scope='module')
+def df():
+    '''
+    A cleaned table with heavy tailed features, a feature whose MAD is 0 in every group and a
+    number of features that is not a multiple of 8
+    '''
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for j in range(11):
+        data['Feature_' + str(j)] = rng.standard_t(3, n)
+    data['Feature_3'] = (rng.random(n) < 0.1).astype(float)
+    return data
+
+def legacy_mask(df, n):
+    # the original loop over every cytokine, dose and well combination and every feature
+    features = df.columns[6:]
+    mask = np.zeros((len(df), len(features)), dtype=bool)
+    positions = pd.Series(np.arange(len(df)), index=df.index)
+    groups = df[['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']].drop_duplicates()
+    for c, d, w in groups.itertuples(index=False):
+        for j, feature in enumerate(features):
+            bool_col = replace_outliers_with_sd(df, feature, c, d, w, n)
+            mask[positions[bool_col.index].to_numpy(), j] = bool_col.to_numpy()
+    return mask
+
+def test_outlier_mask_matches_the_original_loop(df):
+    np.testing.assert_array_equal(outlier_mask(df, df.columns[6:], 2, 'sd'), legacy_mask(df, 2))
+
+@pytest.mark.parametrize('method', ['sd', 'mad'])
+def test_outlier_flags_match_outlier_mask(df, method):
+    mask = outlier_mask(df, df.columns[6:], 2, method)
+    flags, features = outlier_flags(df, 2, method, block_size=701)
+    assert features == df.columns[6:].tolist()
+    assert flags.shape == (len(df), 2)
+    np.testing.assert_array_equal(np.unpackbits(flags, axis=1, count=len(features)).astype(bool), mask)
+    np.testing.assert_array_equal(flag_counts(flags), mask.sum(axis=1))
+    position = int(np.argmax(mask.sum(axis=1)))
+    assert flagged_features(flags, features, position) == [f for f, bit in zip(features, mask[position]) if bit]
+
+def test_mad_uses_the_mean_absolute_deviation_when_the_mad_is_zero(df):
+    mask = outlier_mask(df, ['Feature_3'], 3, 'mad')
+    # the ones of the mostly zero feature are far from the median in scaled mean absolute deviations
+    np.testing.assert_array_equal(mask[:, 0], df['Feature_3'].to_numpy() == 1)
+
+@pytest.mark.parametrize('method', ['sd', 'mad'])
+def test_outlier_detection_splits_on_the_mask(df, method):
+    outliers, sub_data = outlier_detection(df, 2, 0.2, method)
+    counts = outlier_mask(df, df.columns[6:], 2, method).sum(axis=1)
+    threshold = round(0.2 * len(df.columns[6:]))
+    assert outliers.index.tolist() == df.index[counts >= threshold].tolist()
+    assert sub_data.index.tolist() == df.index[counts < threshold].tolist()
+
+def test_outlier_detection_rejects_unknown_methods(df):
+    with pytest.raises(ValueError):
+        outlier_detection(df, 2, 0.2, 'iqr')
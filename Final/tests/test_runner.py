@@ -0,0 +1,77 @@
+'''
+Tests of the batch runner: the cleaned tables and timings of every experiment, and a failing file
+that does not stop the others
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cache import read_cache
+from preprocessing import drop_columns, outlier_detection, replace_NA
+from runner import clean_experiments
+
+def raw_table(seed, n=400):
+    '''
+    A compartment table as CellProfiler exports it, with the columns drop_columns removes
+    '''
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 20, n),
+                         'ObjectNumber': np.arange(n),
+                         'FileName_Actin': 'image.tiff',
+                         'Metadata_Date': '2021-01-01',
+                         'Metadata_FileLocation': 'file://image.tiff',
+                         'Metadata_Frame': 0,
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Run': 1,
+                         'Metadata_Series': 0,
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n),
+                         'PathName_Actin': '/images'})
+    for j in range(5):
+        data['Feature_' + str(j)] = rng.standard_t(3, n)
+    data.loc[data.index[:10], 'Feature_1'] = np.nan
+    return data
+
+def write_experiment(directory, name, seed):
+    experiment = os.path.join(directory, name)
+    os.makedirs(experiment)
+    raw = raw_table(seed)
+    raw.to_csv(os.path.join(experiment, name.lower() + 'ObjCell.csv'), index=False)
+    return experiment, raw
+
+def test_experiments_are_cleaned_and_timed(tmp_path):
+    experiment, raw = write_experiment(str(tmp_path), 'PAM194', 0)
+    # a table without the metadata columns fails in drop_columns
+    pd.DataFrame({'a': [1, 2]}).to_csv(os.path.join(experiment, 'pam194ObjPerinuclear.csv'), index=False)
+
+    summary = clean_experiments(experiment, workers=2, sd=3, thresh=0.2)
+    assert summary['compartment'].tolist() == ['ObjCell', 'ObjPerinuclear']
+    assert pd.isna(summary.loc[0, 'error'])
+    assert summary.loc[1, 'error'].startswith('KeyError')
+
+    data = pd.read_csv(os.path.join(experiment, 'pam194ObjCell.csv'))
+    drop_columns(data)
+    replace_NA(data)
+    outliers, expected = outlier_detection(data, 3, 0.2)
+    assert summary.loc[0, 'rows'] == len(raw)
+    assert summary.loc[0, 'outliers'] == len(outliers)
+    cleaned = read_cache(summary.loc[0, 'output'])
+    np.testing.assert_allclose(cleaned[expected.columns[6:]], expected[expected.columns[6:]])
+
+    timings = pd.read_csv(os.path.join(experiment, 'cleaned', 'timings.csv'))
+    assert timings['compartment'].tolist() == ['ObjCell', 'ObjPerinuclear']
+
+def test_a_shared_output_dir_has_one_timings_file(tmp_path):
+    first, _ = write_experiment(str(tmp_path), 'PAM194', 0)
+    second, _ = write_experiment(str(tmp_path), 'PAM195', 1)
+    output_dir = str(tmp_path / 'cleaned')
+
+    summary = clean_experiments([first, second], output_dir=output_dir, workers=2)
+    assert summary['error'].isna().all()
+    timings = pd.read_csv(os.path.join(output_dir, 'timings.csv'))
+    assert timings['experiment'].tolist() == ['PAM194', 'PAM195']
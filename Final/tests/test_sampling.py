@@ -0,0 +1,65 @@
+'''
+Tests of the reservoir and preview samples
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from out_of_core import PlateDataset
+from sampling import SAMPLE_GROUPS, SAMPLE_KEY, preview_sample, reservoir_sample
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 5000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n, p=[0.6, 0.39, 0.01]),
+                         'Metadata_Metadata_Dose': rng.choice([11, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    data['Feature_0'] = rng.normal(size=n)
+    return data
+
+def sampled(reservoir):
+    return reservoir.sort_values('ObjectNumber').reset_index(drop=True)
+
+def test_reservoir_does_not_depend_on_the_chunks(df, tmp_path):
+    expected = sampled(reservoir_sample(df, 50, seed=3))
+    for size in [97, 333, 1000]:
+        chunks = [df.iloc[start:start + size] for start in range(0, len(df), size)]
+        pd.testing.assert_frame_equal(sampled(reservoir_sample(chunks, 50, seed=3)), expected)
+
+    path = str(tmp_path / 'clean.csv')
+    df.to_csv(path, index=False)
+    pd.testing.assert_frame_equal(sampled(reservoir_sample(path, 50, seed=3, chunksize=700)), expected)
+
+    # a dataset streams the objects plate by plate, as the table sorted by plate
+    dataset = PlateDataset.write(df.sort_values('Metadata_Plate', kind='stable'), str(tmp_path / 'dataset'))
+    ordered = df.sort_values('Metadata_Plate', kind='stable')
+    pd.testing.assert_frame_equal(sampled(reservoir_sample(dataset, 50, seed=3)),
+                                  sampled(reservoir_sample(ordered, 50, seed=3)))
+
+def test_reservoir_sizes(df):
+    reservoir = reservoir_sample(df, 50, seed=0)
+    sizes = df.groupby(SAMPLE_GROUPS).size()
+    counts = reservoir.groupby(SAMPLE_GROUPS).size().reindex(sizes.index)
+    pd.testing.assert_series_equal(counts, np.minimum(sizes, 50))
+    assert not reservoir_sample(df, 50, seed=1)['ObjectNumber'].equals(reservoir['ObjectNumber'])
+
+def test_previews_are_nested(df):
+    reservoir = reservoir_sample(df, 200, seed=0)
+    small = preview_sample(reservoir, 100)
+    large = preview_sample(reservoir, 400)
+    assert len(small) <= 100 and len(large) <= 400
+    assert set(small['ObjectNumber']) <= set(large['ObjectNumber'])
+    assert SAMPLE_KEY not in large.columns
+    # every group is represented, the small untr groups included
+    assert len(small.groupby(SAMPLE_GROUPS)) == len(df.groupby(SAMPLE_GROUPS))
+    with pytest.raises(ValueError):
+        preview_sample(reservoir, 5)
@@ -0,0 +1,64 @@
+'''
+Tests of the compact schema: the precision check of the float32 downcast and the results of the
+cleaning steps on the compact frame
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from preprocessing import outlier_detection
+from schema import compact_dtypes, float32_safe_columns
+
+GROUPS = ['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose', 'Metadata_Well']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    data['Feature_0'] = rng.standard_t(3, n)
+    data['Feature_1'] = rng.exponential(size=n) * 1000
+    data['Feature_2'] = rng.normal(size=n).round(2)
+    # a large offset with a small spread, and a constant column
+    data['Location_Center_X'] = 1e6 + 1e-3 * rng.normal(size=n)
+    data['Constant'] = 0.1
+    return data
+
+def test_float32_safe_columns(df):
+    features = df.columns[6:].tolist()
+    assert float32_safe_columns(df, features) == ['Feature_0', 'Feature_1', 'Feature_2']
+    # a constant that float32 cannot hold exactly is not safe, an exact one is
+    exact = pd.DataFrame({'Constant': np.full(10, 0.5)})
+    assert float32_safe_columns(exact, ['Constant']) == ['Constant']
+    # a column with an infinite rounding error is never safe, however large its spread
+    overflow = pd.DataFrame({'Big': [1e39, -1e39, 0.0]})
+    assert float32_safe_columns(overflow, ['Big']) == []
+
+def test_compact_frame_keeps_the_analysis_results(df):
+    compact = compact_dtypes(df)
+    assert compact['Metadata_Well'].dtype == 'category'
+    assert compact['Feature_0'].dtype == np.float32
+    assert compact['Location_Center_X'].dtype == np.float64
+
+    expected_outliers, expected_kept = outlier_detection(df, 2, 0.2)
+    outliers, kept = outlier_detection(compact, 2, 0.2)
+    assert outliers['ObjectNumber'].tolist() == expected_outliers['ObjectNumber'].tolist()
+    assert kept['ObjectNumber'].tolist() == expected_kept['ObjectNumber'].tolist()
+
+    features = df.columns[6:].tolist()
+    expected = df.groupby(GROUPS)[features].mean()
+    result = compact.groupby(GROUPS, observed=True)[features].mean()
+    result.index = expected.index
+    # every mean is within the rounding error float32_safe_columns allows
+    tolerance = 1e-3 * df[features].std(ddof=0)
+    assert ((result - expected).abs() <= tolerance).all().all()
@@ -0,0 +1,76 @@
+'''
+Tests of the treatment grid screen against per-test scipy ANOVAs and the statsmodels
+Benjamini-Hochberg correction
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats as scipy_stats
+from statsmodels.stats.multitest import multipletests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from screening import SCREEN_COLUMNS, screen, screening_tasks
+
+FEATURES = ['Feature_' + str(j) for j in range(5)]
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 2400
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'TNFa', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    for feature in FEATURES:
+        data[feature] = rng.normal(size=n)
+    # a dose effect of IL17 and a cytokine effect at dose 100
+    il17 = data['Metadata_Metadata_Cytokine'] == 'IL17'
+    data.loc[il17, 'Feature_0'] += data.loc[il17, 'Metadata_Metadata_Dose'] / 100
+    data.loc[(data['Metadata_Metadata_Dose'] == 100) & il17, 'Feature_1'] += 0.5
+    data['Feature_4'] = 1.0
+    return data
+
+@pytest.fixture(scope='module')
+def results(df):
+    return screen(df, FEATURES, workers=1, chunk_size=2)
+
+def test_tasks(df):
+    tasks = screening_tasks(df, FEATURES, chunk_size=2)
+    # 4 cytokines with 3 doses, and 3 doses with the 3 treated cytokines, times 3 feature chunks
+    assert len(tasks) == (4 + 3) * 3
+
+def test_p_values_match_scipy(df, results):
+    assert results.columns.tolist() == SCREEN_COLUMNS
+    for _, row in results[results['Feature'] != 'Feature_4'].iterrows():
+        if row['Comparison'] == 'doses':
+            sub_df = df[df['Metadata_Metadata_Cytokine'] == row['Cytokine']]
+            group_col = 'Metadata_Metadata_Dose'
+        else:
+            sub_df = df[(df['Metadata_Metadata_Dose'] == row['Dose']) & (df['Metadata_Metadata_Cytokine'] != 'untr')]
+            group_col = 'Metadata_Metadata_Cytokine'
+        expected = scipy_stats.f_oneway(*[group[row['Feature']] for _, group in sub_df.groupby(group_col)])
+        assert row['F-stat'] == pytest.approx(expected.statistic, rel=1e-9)
+        assert row['P-value'] == pytest.approx(expected.pvalue, rel=1e-7, abs=1e-300)
+
+def test_q_values_match_multipletests(results):
+    tested = results[results['P-value'].notna()]
+    # the constant feature has no P-value and is left out of the correction
+    assert set(results.loc[results['P-value'].isna(), 'Feature']) == {'Feature_4'}
+    rejected, q_values = multipletests(tested['P-value'], alpha=0.05, method='fdr_bh')[:2]
+    np.testing.assert_allclose(tested['Q-value'], q_values, rtol=1e-12)
+    assert tested['Hit'].tolist() == rejected.tolist()
+    assert results['Q-value'].iloc[:len(tested)].is_monotonic_increasing
+    hits = results[results['Hit']]
+    assert ('doses', 'IL17', 'Feature_0') in set(zip(hits['Comparison'], hits['Cytokine'], hits['Feature']))
+
+def test_workers_give_the_same_screen(df, results):
+    # the tasks finish in any order, which only moves the untested rows around
+    def ordered(frame):
+        return frame.sort_values(['Comparison', 'Cytokine', 'Dose', 'Feature']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(ordered(screen(df, FEATURES, workers=2, chunk_size=2)), ordered(results))
@@ -0,0 +1,66 @@
+'''
+Tests of the memory-mapped feature store: the round trip, the precision checked downcast, the
+zero-copy frames and a fan-out job that attaches to the store
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from dimensionality_reduction import prune_correlated_features
+from shared_store import FeatureStore, write_feature_store
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 3000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    base = rng.normal(size=n)
+    data['Granularity_1'] = base
+    data['Granularity_2'] = base + 0.01 * rng.normal(size=n)
+    data['Granularity_3'] = rng.normal(size=n)
+    # a large offset with a small spread does not survive float32
+    data['Intensity_Location'] = 1e6 + 1e-3 * rng.normal(size=n)
+    data['Intensity_Mean'] = rng.normal(size=n)
+    data['Intensity_Max'] = data['Intensity_Mean'] * 2 + 0.001 * rng.normal(size=n)
+    return data
+
+@pytest.fixture(scope='module')
+def store(df, tmp_path_factory):
+    return write_feature_store(df, str(tmp_path_factory.mktemp('store')))
+
+def test_only_safe_columns_are_downcast(df, store):
+    assert store.column('Intensity_Location').dtype == np.float64
+    assert store.column('Granularity_1').dtype == np.float32
+    np.testing.assert_array_equal(store.column('Intensity_Location'), df['Intensity_Location'])
+
+def test_frame_round_trip(df, store):
+    frame = FeatureStore(store.directory).frame()
+    assert frame.columns.tolist() == df.columns.tolist()
+    for col in ['ImageNumber', 'ObjectNumber', 'Metadata_Metadata_Dose']:
+        np.testing.assert_array_equal(frame[col], df[col])
+    for col in ['Metadata_Metadata_Cytokine', 'Metadata_Plate', 'Metadata_Well']:
+        assert frame[col].astype(str).tolist() == df[col].tolist()
+    np.testing.assert_allclose(frame[df.columns[6:]], df[df.columns[6:]], rtol=1e-6)
+
+def test_frame_is_a_view_of_the_mapped_files(store):
+    frame = store.frame(['Granularity_2', 'Granularity_3', 'Intensity_Location'])
+    for feature in frame.columns[6:]:
+        name, _ = store._positions[feature]
+        assert np.shares_memory(frame[feature].to_numpy(), store.blocks[name])
+
+def test_pruning_fans_out_over_the_store(df, store):
+    expected = prune_correlated_features(df, threshold=0.9)
+    assert expected == (['Granularity_1', 'Granularity_3', 'Intensity_Location', 'Intensity_Mean'],
+                        ['Granularity_2', 'Intensity_Max'])
+    assert prune_correlated_features(store, threshold=0.9, workers=2) == expected
+    assert prune_correlated_features(store, threshold=0.9) == expected
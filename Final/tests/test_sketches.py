@@ -0,0 +1,85 @@
+'''
+Tests of the quantile sketches: exact quantiles of small groups, the rank error bound of large
+ones and the roll-ups against grouped pandas quantiles
+'''
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sketches import QuantileSketch, SKETCH_GROUPS, build_sketches, rollup_quantiles, treatment_medians
+
+FEATURES = ['Feature_0', 'Feature_1', 'Feature_2']
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(0)
+    n = 4000
+    data = pd.DataFrame({'ImageNumber': rng.integers(1, 50, n),
+                         'ObjectNumber': np.arange(n),
+                         'Metadata_Metadata_Cytokine': rng.choice(['IL17', 'IFNg', 'untr'], n),
+                         'Metadata_Metadata_Dose': rng.choice([11, 33, 100], n),
+                         'Metadata_Plate': rng.choice(['Plate 1', 'Plate 2'], n),
+                         'Metadata_Well': rng.choice(['B2', 'C2'], n)})
+    data['Feature_0'] = rng.standard_t(3, n)
+    data['Feature_1'] = rng.normal(size=n).round(1)
+    data['Feature_2'] = rng.exponential(size=n)
+    data.loc[data.index[:40], 'Feature_2'] = np.nan
+    return data
+
+@pytest.mark.parametrize('n', [1, 2, 4, 99, 200])
+def test_uncompacted_sketch_is_exact(n):
+    values = np.random.default_rng(n).normal(size=n)
+    sketch = QuantileSketch(k=200).update(values)
+    assert sketch.quantile(0.5) == pytest.approx(np.median(values), rel=1e-12)
+    np.testing.assert_allclose(sketch.quantile([0.1, 0.25, 0.75]), np.quantile(values, [0.1, 0.25, 0.75]))
+
+def test_merged_sketch_rank_error():
+    rng = np.random.default_rng(1)
+    parts = [rng.standard_t(3, 5000) for _ in range(4)]
+    sketch = QuantileSketch(k=200, seed=1).update(parts[0])
+    for part in parts[1:]:
+        sketch = sketch.merge(QuantileSketch(k=200, seed=2).update(part))
+    values = np.concatenate(parts)
+    assert sketch.n == len(values)
+    for q in [0.1, 0.5, 0.9]:
+        assert abs((values < sketch.quantile(q)).mean() - q) < 0.01
+
+def test_groups_smaller_than_k_are_exact(df):
+    sketch_table = build_sketches(df, FEATURES, k=500)
+    result = rollup_quantiles(sketch_table, SKETCH_GROUPS, q=[0.25, 0.5, 0.75])
+    expected = df.groupby(SKETCH_GROUPS)[FEATURES].quantile([0.25, 0.5, 0.75]).unstack()
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+def test_treatment_medians_of_small_groups_match_pandas(df):
+    small = df.groupby(['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose']).head(60)
+    medians = treatment_medians(build_sketches(small, FEATURES, k=200))
+    expected = small.groupby(['Metadata_Metadata_Cytokine', 'Metadata_Metadata_Dose'])[FEATURES].median()
+    expected.index = [str(c) + '-' + str(d) for c, d in expected.index]
+    pd.testing.assert_frame_equal(medians, expected.sort_index(), check_names=False, rtol=1e-12)
+
+def test_rollup_rank_error_is_bounded(df):
+    k = 50
+    sketch_table = build_sketches(df, FEATURES, k=k)
+    by = ['Metadata_Metadata_Cytokine']
+    result = rollup_quantiles(sketch_table, by, q=[0.25, 0.5, 0.75], where={'Metadata_Plate': 'Plate 1'})
+    selected = df[df['Metadata_Plate'] == 'Plate 1']
+    assert result.index.tolist() == sorted(selected['Metadata_Metadata_Cytokine'].unique())
+    for cytokine, part in selected.groupby('Metadata_Metadata_Cytokine'):
+        for feature in FEATURES:
+            values = part[feature].dropna()
+            for q in [0.25, 0.5, 0.75]:
+                estimate = result.loc[cytokine, (feature, q)]
+                # the rank of the estimate is within 1/k of q, ties included
+                assert (values < estimate).mean() - 1 / k <= q <= (values <= estimate).mean() + 1 / k
+
+def test_rollup_of_everything(df):
+    sketch_table = build_sketches(df, FEATURES, k=200)
+    result = rollup_quantiles(sketch_table, [], q=0.5)
+    assert result.index.tolist() == ['all']
+    values = df['Feature_0']
+    assert abs((values < result.loc['all', 'Feature_0']).mean() - 0.5) <= 1 / 200